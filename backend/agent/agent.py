@@ -1,75 +1,276 @@
 # agent.py
 
+import asyncio
+import contextlib
 import json
-from config import client, MODEL, TOOLS
-from memory import add_message, get_messages
-from tools import (
-    tool_get_tomorrow_events,
-    tool_get_free_slots,
-    tool_schedule_meeting,
-    tool_list_unread_emails,
-    tool_get_unread_from_sender,
-    tool_send_email
-)
+from briefing import briefing
+from completion_cache import create_completion_cache
+from config import classify_openai_error, get_async_client, MODEL, TOOLS, MAX_PARALLEL_TOOLS, TOOL_TIMEOUT_SECONDS
+from context import count_tokens, message_tokens
+from executor import run_blocking
+from memory import DEFAULT_SESSION, add_message, add_messages, get_context
+from projection import payloads
+from scheduler import scheduler
+from telemetry import CACHE_LOOKUPS, TOKENS, span
+from speculation import speculator
+from tools import registry
 
+completion_cache = create_completion_cache(MODEL, TOOLS)
 
-def run_agent(user_input, creds=None):
-    add_message("user", user_input)
 
-    MAX_STEPS = 6
-    step_count = 0
+def execute_tool(name, args, creds=None):
+    """Run a single tool synchronously and return its JSON-serializable result."""
+    return registry.dispatch(name, creds, args)
+
+
+async def run_tool_call(name, arguments, creds, semaphore, serial):
+    """
+    Execute one tool call off the event loop, bounded by the semaphore and
+    the tool's timeout. Tools that are not concurrent-safe also hold
+    `serial`, so their side effects happen one at a time and in call order.
+    Errors are returned as results, never raised.
+    A timeout can't stop the worker thread, so a write that times out may
+    still take effect; its result says so, and that it must not be retried.
+    """
+    spec = registry.get(name)
+    if spec is None:
+        return {"error": "Unknown tool"}
+    timeout = spec.timeout or TOOL_TIMEOUT_SECONDS
+
+    try:
+        args = json.loads(arguments or "{}")
+        async with (contextlib.nullcontext() if spec.concurrent_safe else serial):
+            async with semaphore:
+                with span("tool", name):
+                    return await asyncio.wait_for(
+                        run_blocking(execute_tool, name, args, creds),
+                        timeout=timeout,
+                    )
+
+    except asyncio.TimeoutError:
+        if spec.read_only:
+            return {"error": f"{name} timed out after {timeout:g}s"}
+        return {
+            "error": f"{name} did not finish within {timeout:g}s; it may still take effect, so don't retry it",
+            "outcome": "unknown",
+            "retry": False,
+        }
+
+    except Exception as e:
+        return {"error": str(e)}
 
-    while step_count < MAX_STEPS:
-        step_count += 1
 
-        messages = get_messages()
+async def stream_completion(messages):
+    """
+    Stream one chat completion.
+    Yields ("token", text) for each content delta, then a single
+    ("message", content, tool_calls) once the stream is complete.
+    Cached completions are replayed as one token followed by the message.
+    """
+    key = completion_cache.key(messages) if completion_cache else None
+    cached = completion_cache.get(key) if key else None
+    if key:
+        CACHE_LOOKUPS.inc(cache="completion", result="hit" if cached is not None else "miss")
+    if cached is not None:
+        content, calls = cached
+        if content:
+            yield ("token", content)
+        yield ("message", content, calls)
+        return
 
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            tools=TOOLS,
+    prompt_tokens = sum(message_tokens(m) for m in messages)
+    content_parts = []
+    tool_calls = {}
+
+    with span("completion", MODEL):
+        # Throttling and 5xx surface when the stream opens, so only that is retried
+        stream = await scheduler.acall(
+            "openai",
+            lambda: get_async_client().chat.completions.create(
+                model=MODEL,
+                messages=messages,
+                tools=TOOLS,
+                stream=True,
+            ),
+            units=prompt_tokens,
+            classify=classify_openai_error,
         )
 
-        message = response.choices[0].message
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+
+            if delta.content:
+                content_parts.append(delta.content)
+                yield ("token", delta.content)
+
+            # Tool call names and arguments arrive in fragments keyed by index
+            for tc in delta.tool_calls or []:
+                call = tool_calls.setdefault(tc.index, {
+                    "id": None,
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""},
+                })
+                if tc.id:
+                    call["id"] = tc.id
+                if tc.function and tc.function.name:
+                    call["function"]["name"] += tc.function.name
+                if tc.function and tc.function.arguments:
+                    call["function"]["arguments"] += tc.function.arguments
+
+    content = "".join(content_parts) or None
+    calls = [tool_calls[i] for i in sorted(tool_calls)]
+    for call in calls:
+        call["function"]["arguments"] = call["function"]["arguments"] or "{}"
+
+    TOKENS.observe(prompt_tokens, kind="prompt")
+    TOKENS.observe(count_tokens(content) + count_tokens(json.dumps(calls) if calls else None), kind="completion")
+
+    # Don't memoize answers built on failed tool calls
+    if key and (content or calls) and not any(
+        m["role"] == "tool" and '"error"' in (m.get("content") or "") for m in messages
+    ):
+        completion_cache.set(key, content, calls, messages)
 
-        # Final answer
-        if not message.tool_calls:
-            add_message("assistant", message.content)
-            return message.content
+    yield ("message", content, calls)
 
-        # Save assistant tool call
-        add_message("assistant", message.model_dump_json())
 
-        # Execute tools
-        for tool_call in message.tool_calls:
-            name = tool_call.function.name
-            args = json.loads(tool_call.function.arguments)
+async def run_tool_calls(tool_calls, creds, semaphore, session_id=DEFAULT_SESSION, speculation=None, content=None):
+    """
+    Run the tool calls of one assistant turn concurrently.
+    Yields tool_start / tool_end events as they happen. Calls matching a
+    speculative fetch reuse its result. The assistant turn is recorded in
+    history together with one result per call, in the original call order,
+    even when the client disconnects part way: calls that didn't finish get
+    a cancelled result, so the history never holds unanswered tool calls.
+    """
+    results = [None] * len(tool_calls)
+    serial = asyncio.Lock()
+    tasks = []
 
-            try:
-                if name == "get_tomorrow_events":
-                    result = tool_get_tomorrow_events(creds)
+    async def run_indexed(i, call):
+        fn = call["function"]
+        prefetched = speculation.take(fn["name"], fn["arguments"]) if speculation else None
+        if prefetched is not None:
+            return i, await prefetched
+        return i, await run_tool_call(fn["name"], fn["arguments"], creds, semaphore, serial)
+
+    try:
+        for call in tool_calls:
+            yield {"type": "tool_start", "id": call["id"], "name": call["function"]["name"]}
+
+        tasks = [asyncio.ensure_future(run_indexed(i, call)) for i, call in enumerate(tool_calls)]
+        for next_done in asyncio.as_completed(tasks):
+            i, result = await next_done
+            results[i] = result
+            call = tool_calls[i]
+            spec = registry.get(call["function"]["name"])
+            if completion_cache and spec and spec.invalidates:
+                completion_cache.invalidate_tools(spec.invalidates)
+            if briefing and spec and spec.invalidates:
+                briefing.invalidate(creds, spec.invalidates)
+            yield {
+                "type": "tool_end",
+                "id": call["id"],
+                "name": call["function"]["name"],
+                "ok": not (isinstance(result, dict) and "error" in result),
+            }
+    finally:
+        # The client may disconnect mid-stream; don't leave tools running
+        for task in tasks:
+            task.cancel()
+        # Keep results that finished but weren't consumed yet
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                i, result = task.result()
+                results[i] = result
+
+        turn = [{"role": "assistant", "content": content, "tool_calls": tool_calls}]
+        for call, result in zip(tool_calls, results):
+            name = call["function"]["name"]
+            if result is None:
+                result = cancelled_result(name)
+            turn.append({"role": "tool", "content": payloads.encode(name, result), "tool_call_id": call["id"]})
+        # Shielded: a cancelled request still records the turn in its worker thread
+        await asyncio.shield(run_blocking(add_messages, turn, session_id))
+
+
+def cancelled_result(name):
+    """The result recorded for a call the turn stopped waiting for."""
+    spec = registry.get(name)
+    if spec is None or spec.read_only:
+        return {"error": "cancelled"}
+    # The worker thread can't be stopped, so a write may still go through
+    return {"error": "cancelled; it may still take effect, so don't retry it", "outcome": "unknown", "retry": False}
+
+
+async def run_agent_stream(user_input, creds=None, session_id=DEFAULT_SESSION):
+    """
+    Run the agent loop, yielding progress events:
+    step, token, tool_start, tool_end and finally done.
+    Step events carry the prompt size and the tokens the context builder saved.
+    """
+    # Session reads and writes may go to the shared state, so they run in a worker thread
+    await run_blocking(add_message, "user", user_input, session_id)
+
+    MAX_STEPS = 6
+    step_count = 0
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_TOOLS)
+
+    # Start likely reads now so they overlap the first completion
+    speculation = None
+    if speculator:
+        serial = asyncio.Lock()
+        speculation = speculator.start(
+            user_input,
+            lambda name, arguments: run_tool_call(name, arguments, creds, semaphore, serial),
+        )
 
-                elif name == "get_free_slots":
-                    result = tool_get_free_slots(creds)
+    try:
+        while step_count < MAX_STEPS:
+            step_count += 1
+            with span("agent_step", str(step_count)):
+                context = await run_blocking(get_context, session_id)
+                yield {
+                    "type": "step",
+                    "step": step_count,
+                    "context_tokens": context.tokens,
+                    "tokens_saved": context.tokens_saved,
+                }
 
-                elif name == "schedule_meeting":
-                    result = tool_schedule_meeting(creds, **args)
+                async for item in stream_completion(context.messages):
+                    if item[0] == "token":
+                        yield {"type": "token", "content": item[1]}
+                    else:
+                        _, content, tool_calls = item
 
-                elif name == "list_unread_emails":
-                    result = tool_list_unread_emails(creds, **args)
+                # Final answer
+                if not tool_calls:
+                    await run_blocking(add_message, "assistant", content, session_id)
+                    yield {"type": "done", "content": content}
+                    return
 
-                elif name == "get_unread_from_sender":
-                    result = tool_get_unread_from_sender(creds, **args)
+                # Execute tools concurrently; the assistant turn is saved with their results
+                async for event in run_tool_calls(tool_calls, creds, semaphore, session_id, speculation, content):
+                    yield event
 
-                elif name == "send_email":
-                    result = tool_send_email(creds, **args)
+            # Speculation only targets the first step
+            if speculation:
+                speculation.discard()
+                speculation = None
 
-                else:
-                    result = {"error": "Unknown tool"}
+    finally:
+        # Fetches the model never asked for are cancelled and counted as waste
+        if speculation:
+            speculation.discard()
 
-            except Exception as e:
-                result = {"error": str(e)}
+    yield {"type": "done", "content": "I couldn't complete the task."}
 
-            add_message("tool", json.dumps(result))
 
-    return "I couldn't complete the task."
+async def run_agent(user_input, creds=None, session_id=DEFAULT_SESSION):
+    content = None
+    async for event in run_agent_stream(user_input, creds, session_id):
+        if event["type"] == "done":
+            content = event["content"]
+    return content
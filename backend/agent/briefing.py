@@ -0,0 +1,349 @@
+# briefing.py
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, Optional
+
+from calendar_api import local_now, start_of_day
+from calendar_sync import CALENDAR_SYNC_ENABLED, sync_engine
+from config import MODEL, classify_openai_error, get_client
+from context import count_tokens
+from credentials import credential_manager
+from gmail_sync import GMAIL_SYNC_ENABLED, gmail_sync_engine
+from scheduler import scheduler
+from service_pool import credential_key
+from speculation import call_key
+from state import data_epoch, state
+from telemetry import CACHE_LOOKUPS, span
+from tools import registry
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Briefing configuration
+# ----------------------
+BRIEFING_ENABLED = os.getenv("BRIEFING_ENABLED", "1") == "1"
+# Digests are recomputed this often, and sooner after a write invalidates them
+BRIEFING_REFRESH_SECONDS = float(os.getenv("BRIEFING_REFRESH_SECONDS", "300"))
+# Older digests are not served; the request runs live and a refresh is queued
+BRIEFING_MAX_AGE_SECONDS = float(os.getenv("BRIEFING_MAX_AGE_SECONDS", "900"))
+BRIEFING_CHECK_SECONDS = float(os.getenv("BRIEFING_CHECK_SECONDS", "30"))
+# Users who haven't asked anything for this long drop off the schedule
+BRIEFING_IDLE_SECONDS = float(os.getenv("BRIEFING_IDLE_SECONDS", str(24 * 3600)))
+BRIEFING_UNREAD_MAX = int(os.getenv("BRIEFING_UNREAD_MAX", "10"))
+BRIEFING_SUMMARY_ENABLED = os.getenv("BRIEFING_SUMMARY_ENABLED", "0") == "1"
+# A worker's claim on a user's refresh lapses after this long if it dies mid-way
+BRIEFING_CLAIM_SECONDS = 120
+
+# Tool calls a digest materializes, with the arguments they are stored for
+DIGEST_CALLS = {
+    "get_tomorrow_events": {},
+    "get_free_slots": {},
+    "list_unread_emails": {"max_results": BRIEFING_UNREAD_MAX},
+}
+CALENDAR_TOOLS = ("get_tomorrow_events", "get_free_slots")
+GMAIL_TOOLS = ("list_unread_emails",)
+
+SUMMARY_PROMPT = (
+    "Summarize this daily briefing for the user in three or four sentences: "
+    "tomorrow's meetings, the best open time, and which unread emails look important."
+)
+
+
+def briefing_date() -> str:
+    """The day a digest describes: tomorrow, in local time."""
+    return start_of_day(local_now() + timedelta(days=1)).date().isoformat()
+
+
+# ----------------------
+# Digest store
+# ----------------------
+class DigestStore:
+    """Latest digest per user, in the shared state so every worker serves the same one."""
+
+    namespace = "briefing"
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        return state.get(self.namespace, user_id)
+
+    def put(self, digest: Dict):
+        state.set(self.namespace, digest["user_id"], digest, BRIEFING_IDLE_SECONDS)
+
+
+# ----------------------
+# Precompute worker
+# ----------------------
+class BriefingService:
+    """
+    Precomputes a per-user digest of tomorrow's events, free slots and
+    unread mail (plus an optional model summary) on a background thread.
+    The fast path serves matching tool calls from the digest while it is
+    fresh; writes that invalidate one of its tools, and changes the
+    calendar and Gmail syncs find upstream, mark it dirty so the worker
+    recomputes it at its next check.
+    """
+
+    def __init__(self, store: DigestStore, check_seconds: float = BRIEFING_CHECK_SECONDS):
+        self.store = store
+        self.check_seconds = check_seconds
+        # user_id -> last time a request asked for it
+        self._users: Dict[str, float] = {}
+        # user_id -> credential_key of the creds its digest was built from
+        self._credentials: Dict[str, object] = {}
+        self._dirty = set()
+        self._refreshing: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.last_refresh_seconds = 0.0
+
+    def track(self, user_id: str):
+        """Keep a user's digest on the refresh schedule. Does no I/O."""
+        with self._lock:
+            first = user_id not in self._users
+            self._users[user_id] = time.monotonic()
+            self._start()
+        if first:
+            # The worker computes it now if there is no digest yet
+            self._wake.set()
+
+    def invalidate(self, creds, tools: Iterable[str]):
+        """Mark digests built from these credentials dirty if they hold an affected tool."""
+        if not set(tools) & set(DIGEST_CALLS):
+            return
+        key = credential_key(creds)
+        with self._lock:
+            # Digests loaded from disk aren't tied to credentials until their first refresh
+            self._dirty.update(u for u in self._users if self._credentials.get(u, key) == key)
+        self._wake.set()
+
+    # ----------------------
+    # Serving
+    # ----------------------
+    def lookup(self, user_id: str, intent: str, args: Dict):
+        """
+        The stored result for a tool call, or None if the digest can't
+        answer it. A stale digest is never served; it queues a refresh.
+        """
+        if intent not in DIGEST_CALLS or not self._watched(intent):
+            return None
+        digest = self.store.get(user_id)
+        result = None
+        if digest is None:
+            # Already due; the worker computes it at its next check
+            self._wake.set()
+        elif self._stale(user_id, digest):
+            with self._lock:
+                self._dirty.add(user_id)
+            self._wake.set()
+        else:
+            result = self._match(digest, intent, args)
+
+        CACHE_LOOKUPS.inc(cache="briefing", result="hit" if result is not None else "miss")
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def _match(self, digest: Dict, intent: str, args: Dict):
+        stored = digest["results"].get(intent)
+        key = call_key(intent, args)
+        if stored is None or key is None:
+            return None
+        if key == call_key(intent, DIGEST_CALLS[intent]):
+            return stored
+        # A shorter unread listing is a prefix of the stored one
+        if intent == "list_unread_emails":
+            wanted = json.loads(key[1]).get("max_results")
+            if isinstance(wanted, int) and 0 <= wanted <= BRIEFING_UNREAD_MAX:
+                return stored[:wanted]
+        return None
+
+    @staticmethod
+    def _watched(intent: str) -> bool:
+        """
+        Whether upstream changes to this tool's data reach the digest. Without
+        its sync mirror nothing would notice them for BRIEFING_MAX_AGE_SECONDS.
+        """
+        if intent in CALENDAR_TOOLS:
+            return CALENDAR_SYNC_ENABLED
+        if intent in GMAIL_TOOLS:
+            return GMAIL_SYNC_ENABLED
+        return False
+
+    def _stale(self, user_id: str, digest: Dict) -> bool:
+        return (
+            user_id in self._dirty
+            or digest["date"] != briefing_date()
+            or time.time() - digest["computed_at"] > BRIEFING_MAX_AGE_SECONDS
+            # A write handled by another worker
+            or digest.get("epoch", 0) != data_epoch(credential_key(credential_manager.get(user_id)))
+        )
+
+    def get(self, user_id: str, refresh: bool = False) -> Optional[Dict]:
+        """The digest with staleness metadata, recomputing it first if asked or too old."""
+        self.track(user_id)
+        digest = self.store.get(user_id)
+        if refresh or digest is None or self._stale(user_id, digest):
+            digest = self.refresh(user_id)
+        if digest is None:
+            return None
+        age = time.time() - digest["computed_at"]
+        return {
+            **digest,
+            "age_seconds": round(age, 1),
+            "stale": self._stale(user_id, digest),
+            "max_age_seconds": BRIEFING_MAX_AGE_SECONDS,
+        }
+
+    # ----------------------
+    # Refresh
+    # ----------------------
+    def refresh(self, user_id: str) -> Optional[Dict]:
+        """
+        Recompute and store a user's digest. Concurrent refreshes of one user
+        run once; while another worker holds the claim, its current digest
+        is returned.
+        """
+        with self._lock:
+            lock = self._refreshing.setdefault(user_id, threading.Lock())
+        requested = time.time()
+        with lock:
+            digest = self.store.get(user_id)
+            # Another caller finished a refresh while this one waited
+            if digest is not None and digest["computed_at"] >= requested:
+                return digest
+            if not state.add("briefing_refresh", user_id, True, BRIEFING_CLAIM_SECONDS):
+                return digest
+            with self._lock:
+                self._dirty.discard(user_id)
+
+            started = time.perf_counter()
+            try:
+                with span("briefing", "refresh"):
+                    digest = self._compute(user_id)
+            except Exception:
+                logger.warning("Briefing refresh failed for %s", user_id, exc_info=True)
+                with self._lock:
+                    self.failures += 1
+                return self.store.get(user_id)
+            finally:
+                state.delete("briefing_refresh", user_id)
+
+            self.store.put(digest)
+            with self._lock:
+                self.refreshes += 1
+                self.last_refresh_seconds = time.perf_counter() - started
+            return digest
+
+    def _compute(self, user_id: str) -> Dict:
+        creds = credential_manager.get(user_id)
+        cred = credential_key(creds)
+        with self._lock:
+            self._credentials[user_id] = cred
+        digest = {
+            "user_id": user_id,
+            "epoch": data_epoch(cred),
+            "date": briefing_date(),
+            "computed_at": time.time(),
+            "results": {},
+            "errors": {},
+            "summary": None,
+        }
+        for name, args in DIGEST_CALLS.items():
+            try:
+                result = registry.dispatch(name, creds, args)
+            except Exception as e:
+                digest["errors"][name] = str(e)
+                continue
+            if isinstance(result, dict) and "error" in result:
+                digest["errors"][name] = result["error"]
+            else:
+                digest["results"][name] = result
+
+        if BRIEFING_SUMMARY_ENABLED and digest["results"]:
+            try:
+                digest["summary"] = self._summarize(user_id, digest["results"])
+            except Exception as e:
+                digest["errors"]["summary"] = str(e)
+        return digest
+
+    def _summarize(self, user_id: str, results: Dict) -> str:
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": json.dumps(results)},
+        ]
+        response = scheduler.call(
+            "openai",
+            lambda: get_client().chat.completions.create(model=MODEL, messages=messages),
+            count_tokens(json.dumps(messages)),
+            user_id,
+            classify_openai_error,
+        )
+        return response.choices[0].message.content
+
+    # ----------------------
+    # Background thread
+    # ----------------------
+    def _start(self):
+        """Start the worker thread if it isn't running. Caller holds the lock."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="briefing", daemon=True)
+            self._thread.start()
+
+    def _due(self, user_id: str) -> bool:
+        digest = self.store.get(user_id)
+        return (
+            digest is None
+            or self._stale(user_id, digest)
+            or time.time() - digest["computed_at"] >= BRIEFING_REFRESH_SECONDS
+        )
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.check_seconds)
+            self._wake.clear()
+
+            now = time.monotonic()
+            with self._lock:
+                for user_id in [u for u, seen in self._users.items() if now - seen > BRIEFING_IDLE_SECONDS]:
+                    del self._users[user_id]
+                    self._credentials.pop(user_id, None)
+                    self._dirty.discard(user_id)
+                users = list(self._users)
+
+            for user_id in users:
+                if self._due(user_id):
+                    self.refresh(user_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._users),
+                "dirty": len(self._dirty),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "last_refresh_seconds": round(self.last_refresh_seconds, 3),
+            }
+
+
+briefing = BriefingService(DigestStore()) if BRIEFING_ENABLED else None
+
+if briefing:
+    # New mail or events edited outside the app reach the mirrors' syncs first
+    sync_engine.add_listener(lambda creds: briefing.invalidate(creds, CALENDAR_TOOLS))
+    gmail_sync_engine.add_listener(lambda creds: briefing.invalidate(creds, GMAIL_TOOLS))
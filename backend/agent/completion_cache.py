@@ -0,0 +1,158 @@
+# completion_cache.py
+
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from cache import TTLCache
+
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "1") == "1"
+COMPLETION_CACHE_TTL_SECONDS = float(os.getenv("COMPLETION_CACHE_TTL_SECONDS", "900"))
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "1024"))
+# Path of an SQLite file for the persistent tier; empty disables it
+COMPLETION_CACHE_DB = os.getenv("COMPLETION_CACHE_DB", "")
+
+# (content, tool_calls)
+Completion = Tuple[Optional[str], List[Dict]]
+
+
+def _normalize_text(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    return " ".join(text.split()).lower().rstrip("?!. ")
+
+
+def normalize_messages(messages: List[Dict]) -> List[Dict]:
+    """
+    Canonical form of a prompt for cache keys. User and summary text is
+    case- and whitespace-folded; tool results are kept verbatim so any
+    change in the data they carry produces a different key.
+    """
+    normalized = []
+    for m in messages:
+        m = dict(m)
+        if m["role"] in ("user", "system"):
+            m["content"] = _normalize_text(m.get("content"))
+        normalized.append(m)
+    return normalized
+
+
+def tool_dependencies(messages: List[Dict]) -> Set[str]:
+    """Names of the tools whose results appear in the prompt."""
+    names = set()
+    for m in messages:
+        for call in m.get("tool_calls") or []:
+            names.add(call["function"]["name"])
+    return names
+
+
+class SQLiteCompletionStore:
+    """Persistent tier: completions survive restarts and are shared by workers on one host."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY,"
+                " completion TEXT NOT NULL,"
+                " deps TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[Completion, Set[str]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT completion, deps FROM completions WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        content, tool_calls = json.loads(row[0])
+        return (content, tool_calls), set(json.loads(row[1]))
+
+    def set(self, key: str, completion: Completion, deps: Set[str], ttl_seconds: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, completion, deps, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(completion), json.dumps(sorted(deps)), time.time() + ttl_seconds),
+            )
+            self._conn.commit()
+
+    def invalidate_tools(self, names: Iterable[str]):
+        with self._lock:
+            for name in names:
+                self._conn.execute(
+                    "DELETE FROM completions WHERE deps LIKE ?", (f'%"{name}"%',)
+                )
+            self._conn.execute("DELETE FROM completions WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+
+class CompletionCache:
+    """
+    Two-tier cache of chat completions keyed on the normalized prompt, the
+    tool schema and the model. Entries record which tools' results they
+    were computed from so writes can invalidate them.
+    """
+
+    def __init__(self, model: str, tools: List[Dict], store: Optional[SQLiteCompletionStore] = None):
+        self.model = model
+        self.tools_hash = hashlib.sha256(json.dumps(tools, sort_keys=True).encode()).hexdigest()
+        # key -> (completion, tool dependencies)
+        self.memory = TTLCache(COMPLETION_CACHE_TTL_SECONDS, COMPLETION_CACHE_MAX_ENTRIES)
+        self.store = store
+        self.disk_hits = 0
+
+    def key(self, messages: List[Dict]) -> str:
+        payload = json.dumps(
+            [self.model, self.tools_hash, normalize_messages(messages)],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Completion]:
+        entry = self.memory.get(key)
+        if entry is not None:
+            return copy.deepcopy(entry[0])
+
+        if self.store is not None:
+            stored = self.store.get(key)
+            if stored is not None:
+                self.disk_hits += 1
+                completion, deps = stored
+                self.memory.set(key, (completion, deps))
+                return copy.deepcopy(completion)
+        return None
+
+    def set(self, key: str, content: Optional[str], tool_calls: List[Dict], messages: List[Dict]):
+        completion = (content, copy.deepcopy(tool_calls))
+        deps = tool_dependencies(messages)
+        self.memory.set(key, (completion, deps))
+        if self.store is not None:
+            self.store.set(key, completion, deps, COMPLETION_CACHE_TTL_SECONDS)
+
+    def invalidate_tools(self, names: Iterable[str]):
+        names = set(names)
+        self.memory.invalidate_entries(lambda k, entry: bool(entry[1] & names))
+        if self.store is not None:
+            self.store.invalidate_tools(names)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.memory.stats(), "disk_hits": self.disk_hits}
+
+
+def create_completion_cache(model: str, tools: List[Dict]) -> Optional[CompletionCache]:
+    if not COMPLETION_CACHE_ENABLED:
+        return None
+    store = SQLiteCompletionStore(COMPLETION_CACHE_DB) if COMPLETION_CACHE_DB else None
+    return CompletionCache(model, tools, store)
@@ -1,99 +1,59 @@
 # config.py
 
 import os
-from openai import OpenAI
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+import threading
+from scheduler import parse_retry_after
+from tools import registry
 
 MODEL = "gpt-4o-mini"
 
-TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "get_tomorrow_events",
-            "description": "Get calendar events for tomorrow",
-            "parameters": {
-                "type": "object",
-                "properties": {}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_free_slots",
-            "description": "Get available time slots for tomorrow",
-            "parameters": {
-                "type": "object",
-                "properties": {}
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "schedule_meeting",
-            "description": "Schedule a new meeting",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "title": {"type": "string"},
-                    "start_time": {"type": "string"},
-                    "end_time": {"type": "string"},
-                    "attendees": {
-                        "type": "array",
-                        "items": {"type": "string"}
-                    }
-                },
-                "required": ["title", "start_time", "end_time"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "list_unread_emails",
-            "description": "List unread emails",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "max_results": {
-                        "type": "integer",
-                        "description": "Maximum number of unread emails"
-                    }
-                }
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_unread_from_sender",
-            "description": "Get unread emails from a specific sender",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "sender_email": {"type": "string"}
-                },
-                "required": ["sender_email"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "send_email",
-            "description": "Send an email",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "to": {"type": "string"},
-                    "subject": {"type": "string"},
-                    "body": {"type": "string"}
-                },
-                "required": ["to", "subject", "body"]
-            }
-        }
-    }
-]
\ No newline at end of file
+# ----------------------
+# OpenAI clients
+# ----------------------
+# The SDK is the slowest import in the backend, so it is loaded and the
+# clients created on first use (or by the startup warm-up), not on import
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client(kind: str):
+    client = _clients.get(kind)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(kind)
+            if client is None:
+                from openai import AsyncOpenAI, OpenAI
+
+                cls = AsyncOpenAI if kind == "async" else OpenAI
+                # Retries are handled by the outbound scheduler, not the SDK
+                client = _clients[kind] = cls(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return client
+
+
+def get_client():
+    return _client("sync")
+
+
+def get_async_client():
+    return _client("async")
+
+
+def classify_openai_error(error):
+    """(retryable, throttled, Retry-After seconds) for an OpenAI client error."""
+    import openai
+
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True, False, None
+    if isinstance(error, openai.APIStatusError):
+        throttled = error.status_code == 429
+        retry_after = parse_retry_after(error.response.headers.get("retry-after"))
+        return throttled or error.status_code >= 500, throttled, retry_after
+    return False, False, None
+
+
+# Tool calls from one assistant turn run concurrently, up to this many at once.
+MAX_PARALLEL_TOOLS = int(os.getenv("MAX_PARALLEL_TOOLS", "4"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "20"))
+
+# Generated from the @tool registrations in tools.py; built once at startup
+TOOLS = registry.schemas()
@@ -0,0 +1,210 @@
+# context.py
+
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+# Tool results the model has already answered from are cut down to this size
+TOOL_RESULT_KEEP_CHARS = int(os.getenv("TOOL_RESULT_KEEP_CHARS", "400"))
+
+# Role/separator tokens the API adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+DIGEST_CHARS = 150
+DIGEST_CACHE_SIZE = 4096
+
+
+@dataclass
+class Context:
+    messages: List[Dict]
+    tokens: int
+    raw_tokens: int
+    summarized_turns: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.raw_tokens - self.tokens
+
+
+# ----------------------
+# Token counting
+# ----------------------
+@functools.lru_cache(maxsize=None)
+def _encoding():
+    """
+    The tiktoken encoding, loaded on first use (or by the startup warm-up)
+    since it reads a large BPE file. tiktoken is optional; without it token
+    counts fall back to ~4 chars/token.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text) -> int:
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(message.get("content"))
+    if message.get("tool_calls"):
+        tokens += count_tokens(json.dumps(message["tool_calls"]))
+    return tokens
+
+
+# ----------------------
+# Turn grouping and trimming
+# ----------------------
+def group_turns(messages: List[Dict]) -> List[List[Dict]]:
+    """
+    Split history into units that are kept or dropped together: an assistant
+    tool-call message with its tool results, or any other single message.
+    Tool results whose call is no longer in history are discarded, and so is
+    a tool-call message missing a result for any of its calls, which the
+    API would reject.
+    """
+    units = []
+    for m in messages:
+        if m["role"] == "tool":
+            if units and units[-1][0].get("tool_calls"):
+                units[-1].append(m)
+            continue
+        units.append([m])
+    return [u for u in units if _complete(u)]
+
+
+def _complete(unit: List[Dict]) -> bool:
+    calls = unit[0].get("tool_calls")
+    if not calls:
+        return True
+    answered = {m.get("tool_call_id") for m in unit[1:]}
+    return all(c["id"] in answered for c in calls)
+
+
+def trim_consumed(units: List[List[Dict]]) -> List[List[Dict]]:
+    """
+    Shorten tool results that a later assistant message has already consumed.
+    The latest results are left intact since the model has not seen them yet.
+    """
+    last_assistant = max(
+        (i for i, u in enumerate(units) if u[0]["role"] == "assistant"),
+        default=-1,
+    )
+
+    trimmed = []
+    for i, unit in enumerate(units):
+        if i < last_assistant and len(unit) > 1:
+            unit = [unit[0]] + [_trim_tool_result(m) for m in unit[1:]]
+        trimmed.append(unit)
+    return trimmed
+
+
+def _trim_tool_result(message: Dict) -> Dict:
+    content = message.get("content") or ""
+    if len(content) <= TOOL_RESULT_KEEP_CHARS:
+        return message
+    cut = len(content) - TOOL_RESULT_KEEP_CHARS
+    return {**message, "content": f"{content[:TOOL_RESULT_KEEP_CHARS]}... [trimmed {cut} chars]"}
+
+
+# ----------------------
+# Rolling summary
+# ----------------------
+# Context is built on worker threads, so the memo is shared between them
+_digests: "OrderedDict[str, str]" = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def _digest(unit: List[Dict]) -> str:
+    """One-line summary of a unit, memoized so each turn is summarized once."""
+    key = hashlib.sha1(json.dumps(unit, sort_keys=True, default=str).encode()).hexdigest()
+    with _digests_lock:
+        line = _digests.get(key)
+        if line is not None:
+            _digests.move_to_end(key)
+            return line
+
+    first = unit[0]
+    if first.get("tool_calls"):
+        names = [c["function"]["name"] for c in first["tool_calls"]]
+        line = f"Assistant used tools: {', '.join(names)}"
+    else:
+        text = " ".join((first.get("content") or "").split())
+        if len(text) > DIGEST_CHARS:
+            text = text[:DIGEST_CHARS] + "..."
+        line = f"{first['role'].capitalize()}: {text}"
+
+    with _digests_lock:
+        _digests[key] = line
+        _digests.move_to_end(key)
+        if len(_digests) > DIGEST_CACHE_SIZE:
+            _digests.popitem(last=False)
+    return line
+
+
+def summarize(units: List[List[Dict]], max_tokens: int = SUMMARY_MAX_TOKENS) -> str:
+    """Summarize folded turns, keeping the most recent lines that fit max_tokens."""
+    lines = []
+    used = count_tokens("Summary of earlier conversation:")
+    for unit in reversed(units):
+        line = f"- {_digest(unit)}"
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    lines.reverse()
+    return "\n".join(["Summary of earlier conversation:"] + lines)
+
+
+# ----------------------
+# Context builder
+# ----------------------
+def build_context(messages: List[Dict], budget: int = CONTEXT_TOKEN_BUDGET) -> Context:
+    """
+    Build the prompt messages for one completion within a token budget.
+    Newest turns are kept verbatim; older turns are folded into a summary.
+    The newest turn is always kept, even if it alone exceeds the budget.
+    """
+    raw_tokens = sum(message_tokens(m) for m in messages)
+    units = trim_consumed(group_turns(messages))
+    costs = [sum(message_tokens(m) for m in u) for u in units]
+
+    keep = len(units)
+    if sum(costs) > budget:
+        available = budget - SUMMARY_MAX_TOKENS - MESSAGE_OVERHEAD_TOKENS
+        used = 0
+        keep = 0
+        for cost in reversed(costs):
+            if keep and used + cost > available:
+                break
+            used += cost
+            keep += 1
+
+    folded = units[:len(units) - keep]
+    kept = units[len(units) - keep:]
+
+    result = []
+    if folded:
+        result.append({"role": "system", "content": summarize(folded, SUMMARY_MAX_TOKENS)})
+    result.extend(m for unit in kept for m in unit)
+
+    return Context(
+        messages=result,
+        tokens=sum(message_tokens(m) for m in result),
+        raw_tokens=raw_tokens,
+        summarized_turns=len(folded),
+    )
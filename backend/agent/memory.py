@@ -1,17 +1,263 @@
 # memory.py
 
-conversation_history = []
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
 
-def add_message(role, content):
-    conversation_history.append({
+from context import Context, build_context
+from state import STATE_BACKEND, state
+
+DEFAULT_SESSION = "default"
+
+# Per-session ring buffer size and how many sessions stay resident in process
+MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "30"))
+MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", "1000"))
+SESSION_TTL_SECONDS = float(os.getenv("MEMORY_SESSION_TTL_SECONDS", "3600"))
+
+# "memory" keeps sessions in process only; "sqlite" also persists them to disk;
+# "state" keeps them in the shared state so any worker can serve any turn
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "memory" if STATE_BACKEND == "memory" else "state")
+MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", "memory.db")
+DB_RETENTION_SECONDS = float(os.getenv("MEMORY_DB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+
+# ----------------------
+# Backends
+# ----------------------
+class InProcessBackend:
+    """No persistence: a session evicted from the in-process LRU is gone."""
+
+    shared = False
+
+    def load(self, session_id: str) -> Optional[List[Dict]]:
+        return None
+
+    def save(self, session_id: str, messages: List[Dict]):
+        pass
+
+    def delete(self, session_id: str):
+        pass
+
+    def purge(self, older_than: float):
+        pass
+
+
+class SQLiteBackend:
+    """Persists each session's buffer as one JSON row so sessions survive restarts."""
+
+    shared = False
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " messages TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def load(self, session_id: str) -> Optional[List[Dict]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id: str, messages: List[Dict]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, messages, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(session_id) DO UPDATE SET"
+                " messages = excluded.messages, updated_at = excluded.updated_at",
+                (session_id, json.dumps(messages), time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def purge(self, older_than: float):
+        """Delete sessions not updated since the given wall-clock time."""
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (older_than,))
+            self._conn.commit()
+
+
+class StateBackend:
+    """
+    Sessions in the shared state (see state.py). Other workers write to it
+    too, so the store reloads a session on every access instead of trusting
+    its resident copy, and appends through state.append so two workers
+    adding to one session never overwrite each other's turns.
+    """
+
+    shared = True
+    namespace = "session"
+
+    def __init__(self, retention_seconds: float = DB_RETENTION_SECONDS):
+        self.retention_seconds = retention_seconds
+
+    def load(self, session_id: str) -> Optional[List[Dict]]:
+        return state.get(self.namespace, session_id)
+
+    def save(self, session_id: str, messages: List[Dict]):
+        state.set(self.namespace, session_id, messages, self.retention_seconds)
+
+    def append(self, session_id: str, messages: List[Dict], max_messages: int) -> List[Dict]:
+        """Atomically append to the stored session; returns its new contents."""
+        return state.append(self.namespace, session_id, messages, max_messages, self.retention_seconds)
+
+    def delete(self, session_id: str):
+        state.delete(self.namespace, session_id)
+
+    def purge(self, older_than: float):
+        # Sessions expire on their own TTL
+        pass
+
+
+# ----------------------
+# Session store
+# ----------------------
+class _Session:
+    """A resident session: its ring buffer, last access time and its own lock."""
+
+    def __init__(self, max_messages: int, now: float):
+        self.buffer: deque = deque(maxlen=max_messages)
+        self.last_access = now
+        self.loaded = False
+        # Held across backend I/O, so only this session's callers wait on it
+        self.lock = threading.Lock()
+
+
+class SessionStore:
+    """
+    Session-keyed conversation memory.
+    Each session is a fixed-capacity ring buffer; at most max_sessions stay
+    resident, evicted least-recently-used first or once idle past ttl_seconds.
+    The store-wide lock only guards the resident set; backend reads and
+    writes happen under the session's own lock.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_messages: int = MAX_MESSAGES,
+        max_sessions: int = MAX_SESSIONS,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+    ):
+        self.backend = backend or InProcessBackend()
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        # session_id -> _Session, in LRU order
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, session_id: str, message: Dict):
+        self.extend(session_id, [message])
+
+    def extend(self, session_id: str, messages: List[Dict]):
+        """Append several messages with a single backend write."""
+        session = self._session(session_id)
+        with session.lock:
+            if self.backend.shared:
+                # A load-append-save here would drop turns another worker saved in between
+                stored = self.backend.append(session_id, messages, self.max_messages)
+                session.buffer = deque(stored, maxlen=self.max_messages)
+                session.loaded = True
+                return
+            self._load(session_id, session)
+            session.buffer.extend(messages)
+            self.backend.save(session_id, list(session.buffer))
+
+    def get(self, session_id: str) -> List[Dict]:
+        session = self._session(session_id)
+        with session.lock:
+            self._load(session_id, session)
+            return list(session.buffer)
+
+    def reset(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        self.backend.delete(session_id)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _session(self, session_id: str) -> _Session:
+        """Return the resident session, creating an unloaded one. Does no I/O."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self.max_messages, now)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                session.last_access = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def _load(self, session_id: str, session: _Session):
+        """Read the session from the backend if needed. Caller holds session.lock."""
+        # Another worker may have added turns to a shared session since this one last saw it
+        if session.loaded and not self.backend.shared:
+            return
+        session.buffer = deque(self.backend.load(session_id) or [], maxlen=self.max_messages)
+        session.loaded = True
+
+    def _expire(self, now: float):
+        """Drop idle sessions from the front of the LRU. Caller holds the lock."""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+
+
+def create_store() -> SessionStore:
+    if MEMORY_BACKEND == "sqlite":
+        backend = SQLiteBackend(MEMORY_DB_PATH)
+        backend.purge(time.time() - DB_RETENTION_SECONDS)
+    elif MEMORY_BACKEND == "state":
+        backend = StateBackend()
+    else:
+        backend = InProcessBackend()
+    return SessionStore(backend)
+
+
+store = create_store()
+
+
+def add_message(role, content, session_id=DEFAULT_SESSION, **fields):
+    # fields carries tool_calls / tool_call_id for tool-calling turns
+    store.add(session_id, {
         "role": role,
-        "content": content
+        "content": content,
+        **fields
     })
 
-def get_messages():
-    # limit memory size
-    return conversation_history[-30:]
+def add_messages(messages, session_id=DEFAULT_SESSION):
+    # One write for a turn's messages, e.g. a tool-call message and its results
+    store.extend(session_id, messages)
+
+def get_context(session_id=DEFAULT_SESSION) -> Context:
+    # token-budgeted view of the session, with token accounting
+    return build_context(store.get(session_id))
+
+def get_messages(session_id=DEFAULT_SESSION):
+    return get_context(session_id).messages
 
-def reset_memory():
-    global conversation_history
-    conversation_history = []
+def reset_memory(session_id=DEFAULT_SESSION):
+    store.reset(session_id)
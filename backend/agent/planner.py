@@ -0,0 +1,95 @@
+# planner.py
+
+import re
+import threading
+from typing import Dict, List, Optional
+
+from router import DETERMINISTIC_INTENTS, IntentMatch, classify
+
+# Clause boundaries in compound requests: sentence ends, semicolons and
+# connectives such as "and", "also", "plus", "then"
+CLAUSE_SPLIT_RE = re.compile(
+    r"\s*(?:[;?!]|\.(?=\s|$)|,?\s+(?:and also|and then|and|also|plus|then|as well as)\s+|,\s+)\s*",
+    re.IGNORECASE,
+)
+
+# Headings for formatter output that has none of its own, used when
+# several results are merged into one answer
+SECTION_TITLES = {
+    "list_unread_emails": "Unread emails:",
+    "get_unread_from_sender": "Unread emails from {sender_email}:",
+}
+
+
+def split_clauses(user_input: str) -> List[str]:
+    return [c for c in CLAUSE_SPLIT_RE.split(user_input) if re.search(r"\w", c)]
+
+
+class Planner:
+    """
+    Splits compound requests into deterministic intents with their tool
+    arguments. A request only gets a plan when every clause maps to a
+    deterministic intent; anything else falls back to the agent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.single = 0
+        self.multi = 0
+        self.fallbacks = 0
+
+    def _parse(self, user_input: str) -> Optional[List[IntentMatch]]:
+        clauses = split_clauses(user_input)
+        if len(clauses) <= 1:
+            match = classify(user_input)
+            return [match] if match.intent in DETERMINISTIC_INTENTS else None
+
+        steps: List[IntentMatch] = []
+        for clause in clauses:
+            # A day named in one clause scopes the others: "what's on
+            # tomorrow and when am I free" asks about tomorrow twice, while
+            # "what's on friday and when am I free" is beyond the tomorrow-only tools
+            match = classify(clause, scope=user_input)
+            if match.intent not in DETERMINISTIC_INTENTS:
+                return None
+            if not any(s.intent == match.intent and s.args == match.args for s in steps):
+                steps.append(match)
+        return steps
+
+    def plan(self, user_input: str) -> Optional[List[IntentMatch]]:
+        """The deterministic steps answering the message, or None to use the agent."""
+        steps = self._parse(user_input)
+        with self._lock:
+            if steps is None:
+                self.fallbacks += 1
+            elif len(steps) == 1:
+                self.single += 1
+            else:
+                self.multi += 1
+        return steps
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.single + self.multi + self.fallbacks
+            return {
+                "single_intent": self.single,
+                "multi_intent": self.multi,
+                "fallbacks": self.fallbacks,
+                "fallback_rate": self.fallbacks / total if total else 0.0,
+            }
+
+
+def merge_outputs(steps: List[IntentMatch], texts: List[str]) -> str:
+    """Join formatted tool outputs into one answer, titling untitled sections."""
+    if len(texts) == 1:
+        return texts[0]
+
+    sections = []
+    for step, text in zip(steps, texts):
+        title = SECTION_TITLES.get(step.intent)
+        text = text.rstrip()
+        sections.append(f"{title.format(**step.args)}\n{text}" if title else text)
+    return "\n\n".join(sections) + "\n"
+
+
+planner = Planner()
@@ -0,0 +1,112 @@
+# projection.py
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict
+
+from context import count_tokens
+from telemetry import metrics
+from tools import registry
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Projection configuration
+# ----------------------
+TOOL_PROJECTION_ENABLED = os.getenv("TOOL_PROJECTION_ENABLED", "1") == "1"
+# Comma-separated tools whose results go to the model as full JSON
+TOOL_PROJECTION_DISABLED = frozenset(
+    name.strip() for name in os.getenv("TOOL_PROJECTION_DISABLED", "").split(",") if name.strip()
+)
+
+PAYLOAD_BYTES = metrics.counter(
+    "assistant_tool_payload_bytes_total",
+    "Tool result bytes sent to the model (projected) and as full JSON (full)",
+    labels=("tool", "encoding"),
+)
+PAYLOAD_TOKENS = metrics.counter(
+    "assistant_tool_payload_tokens_total",
+    "Tool result tokens sent to the model (projected) and as full JSON (full)",
+    labels=("tool", "encoding"),
+)
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class PayloadEncoder:
+    """
+    Encodes tool results for the model's history. A tool with a registered
+    projector sends its projection or its plain result as compact JSON,
+    whichever is shorter (small results, like an empty list, gain nothing
+    from a table). Other results, and every error, are sent as full JSON
+    unchanged. Each call records what the full JSON would have cost next to
+    what was sent.
+    """
+
+    def __init__(self, enabled: bool = TOOL_PROJECTION_ENABLED, disabled=TOOL_PROJECTION_DISABLED):
+        self.enabled = enabled
+        self.disabled = disabled
+        # tool -> [calls, full bytes, sent bytes, full tokens, sent tokens]
+        self._totals: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, name: str, result: Any) -> str:
+        full = json.dumps(result)
+        projected = self._project(name, result)
+        sent = full if projected is None else min(compact_json(projected), compact_json(result), key=len)
+        self._record(name, full, sent)
+        return sent
+
+    def _project(self, name: str, result: Any):
+        spec = registry.get(name)
+        if (
+            not self.enabled
+            or spec is None
+            or spec.projector is None
+            or name in self.disabled
+            or (isinstance(result, dict) and "error" in result)
+        ):
+            return None
+        try:
+            return spec.projector(result)
+        except Exception:
+            logger.warning("Projection of %s failed; sending the full result", name, exc_info=True)
+            return None
+
+    def _record(self, name: str, full: str, sent: str):
+        full_bytes, sent_bytes = len(full.encode()), len(sent.encode())
+        full_tokens = count_tokens(full)
+        sent_tokens = full_tokens if sent is full else count_tokens(sent)
+        PAYLOAD_BYTES.inc(full_bytes, tool=name, encoding="full")
+        PAYLOAD_BYTES.inc(sent_bytes, tool=name, encoding="projected")
+        PAYLOAD_TOKENS.inc(full_tokens, tool=name, encoding="full")
+        PAYLOAD_TOKENS.inc(sent_tokens, tool=name, encoding="projected")
+        with self._lock:
+            totals = self._totals.setdefault(name, [0, 0, 0, 0, 0])
+            totals[0] += 1
+            totals[1] += full_bytes
+            totals[2] += sent_bytes
+            totals[3] += full_tokens
+            totals[4] += sent_tokens
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                name: {
+                    "calls": calls,
+                    "full_bytes": full_bytes,
+                    "bytes": sent_bytes,
+                    "full_tokens": full_tokens,
+                    "tokens": sent_tokens,
+                    "byte_reduction": round(1 - sent_bytes / full_bytes, 3) if full_bytes else 0.0,
+                    "token_reduction": round(1 - sent_tokens / full_tokens, 3) if full_tokens else 0.0,
+                }
+                for name, (calls, full_bytes, sent_bytes, full_tokens, sent_tokens) in self._totals.items()
+            }
+
+
+payloads = PayloadEncoder()
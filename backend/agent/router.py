@@ -1,24 +1,309 @@
 # router.py
 
-def route_intent(user_input: str):
-    text = user_input.lower()
+import math
+import os
+import re
+import threading
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Minimum cosine similarity to the nearest example, and the lead it must
+# have over the best example of any other intent
+CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.45"))
+CONFIDENCE_MARGIN = float(os.getenv("ROUTER_CONFIDENCE_MARGIN", "0.05"))
+
+HASH_DIM = 4096
+NGRAM_SIZES = (3, 4, 5)
+
+# Labeled utterances per intent. "agent" examples are requests the
+# deterministic paths cannot serve; they compete with the others so
+# look-alike requests (e.g. writes) are not misrouted.
+INTENT_EXAMPLES: Dict[str, List[str]] = {
+    "get_tomorrow_events": [
+        "what do i have tomorrow",
+        "what's on my calendar tomorrow",
+        "what meetings do i have tomorrow",
+        "show me tomorrow's schedule",
+        "tomorrow's agenda",
+        "any meetings tomorrow",
+        "what's happening tomorrow",
+        "list my events for tomorrow",
+        "am i busy tomorrow",
+        "what is on my schedule for tomorrow",
+        "do i have any calls tomorrow",
+        "anything on tomorrow",
+    ],
+    "get_free_slots": [
+        "find free slots tomorrow",
+        "when am i free tomorrow",
+        "what available time do i have tomorrow",
+        "show my free time tomorrow",
+        "do i have any openings tomorrow",
+        "free slots",
+        "when am i available",
+        "gaps in my calendar tomorrow",
+        "what's my availability tomorrow",
+        "when do i have time tomorrow",
+    ],
+    "list_unread_emails": [
+        "check email",
+        "check my email",
+        "show unread emails",
+        "any unread emails",
+        "do i have new mail",
+        "what's in my inbox",
+        "list my unread messages",
+        "any new emails",
+        "show me my latest unread emails",
+    ],
+    "get_unread_from_sender": [
+        "any email from alice@example.com",
+        "unread emails from bob@example.com",
+        "did john@example.com email me",
+        "show messages from sarah@company.com",
+        "check for mail from team@example.org",
+        "has support@vendor.com written to me",
+    ],
+    "agent": [
+        "schedule a meeting with alice tomorrow at 3pm",
+        "book a meeting with the team on friday",
+        "set up a call with bob next week",
+        "send an email to alice saying i'm running late",
+        "send email to bob@example.com about the budget",
+        "write to alice@example.com and ask for the slides",
+        "email bob the project update",
+        "reply to the last email",
+        "draft a note to the team",
+        "summarize my week",
+        "summarize my emails and tell me what needs a reply",
+        "which emails are important",
+        "cancel my 2pm meeting",
+        "move my standup to 10am",
+        "what did i talk about with alice last month",
+        "write a thank you message",
+        "help me plan my day",
+        "hello",
+        "thanks",
+    ],
+}
+
+# Intents handle_request can serve without the LLM
+DETERMINISTIC_INTENTS = {
+    "get_tomorrow_events",
+    "get_free_slots",
+    "list_unread_emails",
+    "get_unread_from_sender",
+}
+
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+COUNT_RE = re.compile(r"\b(?:last|latest|top|first)?\s*(\d{1,2})\s+(?:unread\s+)?(?:e-?mails?|messages?)\b")
+# The calendar fast-path tools only answer for tomorrow, so a message must
+# name tomorrow and no other date or period
+TOMORROW_RE = re.compile(r"\b(?:tomorrow|tmrw|tmr)\b")
+_MONTHS = "january|february|march|april|june|july|august|september|october|november|december"
+_MONTH_ABBREVIATIONS = "jan|feb|mar|apr|may|jun|jul|aug|sept?|oct|nov|dec"
+OTHER_DATE_RE = re.compile(
+    r"\b(?:today|tonight|yesterday|day after tomorrow|weekends?"
+    r"|(?:mon|tues|wednes|thurs|fri|satur|sun)days?"
+    rf"|{_MONTHS}"
+    # "may" is only a month next to a day number
+    rf"|(?:{_MONTH_ABBREVIATIONS})\.?\s+\d{{1,2}}(?:st|nd|rd|th)?|\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?may"
+    r"|\d{1,2}(?:st|nd|rd|th)"
+    r"|\d{1,2}/\d{1,2}(?:/\d{2,4})?|\d{4}-\d{1,2}-\d{1,2}"
+    r"|(?:next|this|last|coming|following)\s+(?:week|month|year|few\s+days|\d+\s+days)"
+    r"|(?:end\s+of|later)\s+(?:the\s+|this\s+)?(?:week|month)"
+    r"|in\s+(?:a|an|\d+|a\s+few|a\s+couple\s+of)\s+(?:days?|weeks?|months?)"
+    r"|\d+\s+(?:days?|weeks?)\s+from\s+now)\b"
+)
+# Verbs asking for a change; the deterministic tools only read, so these
+# requests always go to the agent however much they look like a read
+ACTION_RE = re.compile(
+    r"\b(?:cancel(?:s|l?ed|l?ing)?|delete[sd]?|deleting|remove[sd]?|removing|trash(?:es|ed|ing)?"
+    r"|forward(?:s|ed|ing)?|reply|respond|archive[sd]?|archiving|mark(?:s|ed|ing)?"
+    r"|unsubscribe|move[sd]?|moving|reschedule|send(?:s|ing)?|book"
+    # "schedule" is also a noun ("my schedule tomorrow")
+    r"|schedule\s+(?:a|an|the|some|time|meetings?|calls?|with|it|them))\b"
+)
+
+
+@dataclass
+class IntentMatch:
+    intent: str
+    score: float
+    # Tool keyword arguments extracted from the message
+    args: Dict = field(default_factory=dict)
+
+
+# ----------------------
+# Vectorizer
+# ----------------------
+def _normalize(text: str) -> str:
+    text = EMAIL_RE.sub(" emailaddr ", text.lower())
+    return " ".join(re.findall(r"[a-z0-9']+", text))
+
+
+def _features(text: str) -> Dict[int, float]:
+    """Hashed character n-grams plus word unigrams, L2-normalized."""
+    counts: Dict[int, float] = {}
+    padded = f" {text} "
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            h = zlib.crc32(padded[i:i + n].encode()) % HASH_DIM
+            counts[h] = counts.get(h, 0.0) + 1.0
+    for word in text.split():
+        h = zlib.crc32(b"w:" + word.encode()) % HASH_DIM
+        counts[h] = counts.get(h, 0.0) + 2.0
+
+    # Sublinear term frequency keeps repeated n-grams from dominating
+    weights = {h: 1.0 + math.log(c) for h, c in counts.items()}
+    norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+    return {h: w / norm for h, w in weights.items()}
+
+
+class SemanticRouter:
+    """Nearest-example intent classifier over precomputed hashed n-gram vectors."""
+
+    def __init__(self, examples: Dict[str, List[str]]):
+        self.labels: List[str] = []
+        self._vectors: List[Dict[int, float]] = []
+        for intent, utterances in examples.items():
+            for utterance in utterances:
+                self.labels.append(intent)
+                self._vectors.append(_features(_normalize(utterance)))
+
+        self.intents = list(examples)
+        self._matrix = None
+        # NumPy is optional; without it scoring falls back to sparse dot products
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        self._np = np
+        if np is not None:
+            self._matrix = np.zeros((len(self._vectors), HASH_DIM), dtype=np.float32)
+            for row, vec in enumerate(self._vectors):
+                self._matrix[row, list(vec)] = list(vec.values())
+            self._label_ids = np.array([self.intents.index(l) for l in self.labels])
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Best cosine similarity per intent."""
+        query = _features(_normalize(text))
+        np = self._np
+
+        if self._matrix is not None:
+            q = np.zeros(HASH_DIM, dtype=np.float32)
+            q[list(query)] = list(query.values())
+            sims = self._matrix @ q
+            best = np.full(len(self.intents), -1.0, dtype=np.float32)
+            np.maximum.at(best, self._label_ids, sims)
+            return {intent: float(best[i]) for i, intent in enumerate(self.intents)}
 
-    if "tomorrow" in text and ("what" in text or "do i have" in text):
-        return "get_tomorrow_events"
+        best: Dict[str, float] = {}
+        for label, vec in zip(self.labels, self._vectors):
+            sim = sum(w * vec.get(h, 0.0) for h, w in query.items())
+            if sim > best.get(label, -1.0):
+                best[label] = sim
+        return best
 
-    if "free slot" in text or "available time" in text:
-        return "get_free_slots"
+    def classify(self, text: str) -> IntentMatch:
+        ranked = sorted(self.scores(text).items(), key=lambda kv: kv[1], reverse=True)
+        (intent, score), runner_up = ranked[0], ranked[1][1] if len(ranked) > 1 else 0.0
+        if score < CONFIDENCE_THRESHOLD or score - runner_up < CONFIDENCE_MARGIN:
+            return IntentMatch("agent", score)
+        return IntentMatch(intent, score)
 
-    if "schedule" in text or "book meeting" in text:
-        return "schedule_meeting"
-    
-    if "unread email" in text or "check email" in text:
-        return "list_unread_emails"
 
-    if "email from" in text:
-        return "get_unread_from_sender"
+_router: Optional[SemanticRouter] = None
+_router_lock = threading.Lock()
 
-    if "send email" in text:
-        return "send_email"
 
-    return "agent"
+def get_router() -> SemanticRouter:
+    """The example router, built on first use (or by the startup warm-up) so importing stays cheap."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = SemanticRouter(INTENT_EXAMPLES)
+    return _router
+
+
+# ----------------------
+# Slot extraction
+# ----------------------
+def extract_slots(intent: str, text: str, scope: Optional[str] = None) -> Optional[Dict]:
+    """
+    Tool arguments for a deterministic intent, or None when a required
+    slot is missing or the request falls outside what the tool can answer.
+    scope is the whole message when text is one clause of it.
+    """
+    lowered = text.lower()
+
+    if intent in ("get_tomorrow_events", "get_free_slots"):
+        # Dates anywhere in the request scope this part of it too
+        scope = (scope or text).lower()
+        if not TOMORROW_RE.search(scope) or OTHER_DATE_RE.search(scope):
+            return None
+        return {}
+
+    if intent == "get_unread_from_sender":
+        email = EMAIL_RE.search(text)
+        return {"sender_email": email.group(0)} if email else None
+
+    if intent == "list_unread_emails":
+        count = COUNT_RE.search(lowered)
+        return {"max_results": int(count.group(1))} if count else {}
+
+    return None
+
+
+def classify(user_input: str, scope: Optional[str] = None) -> IntentMatch:
+    """
+    Route a message to a deterministic intent with its tool arguments, or
+    to the agent. scope is the whole message when user_input is one clause.
+    """
+    match = get_router().classify(user_input)
+
+    # Addresses are masked so a sender like mark@x.com isn't read as a verb
+    if ACTION_RE.search(EMAIL_RE.sub(" ", user_input.lower())):
+        return IntentMatch("agent", match.score)
+
+    # A sender address turns an unread-mail request into a sender lookup
+    if match.intent == "list_unread_emails" and EMAIL_RE.search(user_input):
+        match.intent = "get_unread_from_sender"
+
+    if match.intent not in DETERMINISTIC_INTENTS:
+        return IntentMatch("agent", match.score)
+
+    args = extract_slots(match.intent, user_input, scope)
+    if args is None:
+        return IntentMatch("agent", match.score)
+
+    match.args = args
+    return match
+
+
+def predict(user_input: str, min_score: float, limit: int) -> List[IntentMatch]:
+    """
+    Deterministic intents a message plausibly needs, best first, with their
+    tool arguments. Looser than classify(): requests routed to the agent
+    still return the reads the model is likely to ask for.
+    """
+    ranked = sorted(get_router().scores(user_input).items(), key=lambda kv: kv[1], reverse=True)
+    matches: List[IntentMatch] = []
+    for intent, score in ranked:
+        if len(matches) >= limit or score < min_score:
+            break
+        if intent not in DETERMINISTIC_INTENTS:
+            continue
+        if intent == "list_unread_emails" and EMAIL_RE.search(user_input):
+            intent = "get_unread_from_sender"
+        args = extract_slots(intent, user_input)
+        if args is None or any(m.intent == intent for m in matches):
+            continue
+        matches.append(IntentMatch(intent, score, args))
+    return matches
+
+
+def route_intent(user_input: str):
+    return classify(user_input).intent
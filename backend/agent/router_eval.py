@@ -0,0 +1,108 @@
+# router_eval.py
+#
+# Offline evaluation of the intent router. Run from backend/agent:
+#     python router_eval.py
+
+import json
+import time
+
+from router import DETERMINISTIC_INTENTS, classify, get_router
+
+# (message, expected intent, expected args) -- phrasings not in INTENT_EXAMPLES
+EVAL_SET = [
+    ("What do I have going on tomorrow?", "get_tomorrow_events", {}),
+    ("whats on tomorrow", "get_tomorrow_events", {}),
+    ("Do I have any calls tomorrow?", "get_tomorrow_events", {}),
+    ("give me tomorrow's meetings", "get_tomorrow_events", {}),
+    ("What's my schedule like tomorrow?", "get_tomorrow_events", {}),
+    ("What meetings do I have on Friday?", "agent", None),
+    ("Any free slots tomorrow afternoon?", "get_free_slots", {}),
+    ("When do I have availability tomorrow?", "get_free_slots", {}),
+    ("find me some free time tomorrow", "get_free_slots", {}),
+    ("what available time do I have tmrw", "get_free_slots", {}),
+    ("check email please", "list_unread_emails", {}),
+    ("Do I have unread emails?", "list_unread_emails", {}),
+    ("show me my last 3 unread emails", "list_unread_emails", {"max_results": 3}),
+    ("anything new in my inbox?", "list_unread_emails", {}),
+    ("any new messages?", "list_unread_emails", {}),
+    ("Did I get an email from alice@example.com?", "get_unread_from_sender", {"sender_email": "alice@example.com"}),
+    ("unread mail from bob.smith@corp.io", "get_unread_from_sender", {"sender_email": "bob.smith@corp.io"}),
+    ("anything from ceo@startup.com in my inbox", "get_unread_from_sender", {"sender_email": "ceo@startup.com"}),
+    ("email from my manager", "agent", None),
+    ("Schedule a 30 minute sync with dana tomorrow at 10", "agent", None),
+    ("book meeting with the design team", "agent", None),
+    ("send email to carl@example.com about the launch", "agent", None),
+    ("Can you draft a reply to Alice?", "agent", None),
+    ("What's the weather like?", "agent", None),
+    ("Summarize my unread emails and tell me which need replies", "agent", None),
+    ("reschedule my 1:1 to thursday", "agent", None),
+    # Writes and other changes that read like a fast-path question
+    ("cancel everything tomorrow", "agent", None),
+    ("forward the unread email from bob@x.com to alice@x.com", "agent", None),
+    ("delete the unread emails from bob@x.com", "agent", None),
+    ("reply to the unread email from bob@x.com", "agent", None),
+    ("unsubscribe me from newsletter@x.com", "agent", None),
+    ("archive my unread emails", "agent", None),
+    ("mark all unread emails as read", "agent", None),
+    ("move my meetings tomorrow to the afternoon", "agent", None),
+    ("send my free slots tomorrow to dana@x.com", "agent", None),
+    ("what do i have the day after tomorrow", "agent", None),
+    ("am I free the day after tomorrow?", "agent", None),
+    # The calendar tools only answer for tomorrow; any other day or period,
+    # or none at all, needs the agent
+    ("what is on my calendar on the 25th", "agent", None),
+    ("what do I have on October 30", "agent", None),
+    ("what meetings do I have next month", "agent", None),
+    ("what do I have in 3 days", "agent", None),
+    ("when am I free this weekend", "agent", None),
+    ("any free slots on 10/20", "agent", None),
+    ("what is my schedule", "agent", None),
+    ("when am I free next week", "agent", None),
+    ("what's on my calendar today", "agent", None),
+    ("any meetings on may 4?", "agent", None),
+    ("what available time do I have", "agent", None),
+    # Reads that mention such words in passing stay on the fast path
+    ("any unread email from mark@example.com?", "get_unread_from_sender", {"sender_email": "mark@example.com"}),
+    ("any replies from bob@x.com?", "get_unread_from_sender", {"sender_email": "bob@x.com"}),
+]
+
+
+def evaluate(eval_set=EVAL_SET):
+    correct = 0
+    fast_expected = 0
+    fast_hits = 0
+    false_fast = 0
+    misses = []
+
+    # Build the router first so the timing covers classification only
+    get_router()
+    start = time.perf_counter()
+    for message, expected, expected_args in eval_set:
+        match = classify(message)
+        ok = match.intent == expected and (expected_args is None or match.args == expected_args)
+        correct += ok
+
+        if expected in DETERMINISTIC_INTENTS:
+            fast_expected += 1
+            fast_hits += ok
+        elif match.intent != "agent":
+            false_fast += 1
+
+        if not ok:
+            misses.append({"message": message, "expected": expected, "got": match.intent, "score": round(match.score, 3)})
+    elapsed = time.perf_counter() - start
+
+    return {
+        "examples": len(eval_set),
+        "accuracy": correct / len(eval_set),
+        # Share of deterministic-servable requests that took the fast path correctly
+        "deterministic_hit_rate": fast_hits / fast_expected if fast_expected else 0.0,
+        # Agent-only requests wrongly sent down a fast path
+        "false_fast_path": false_fast,
+        "ms_per_request": elapsed * 1000 / len(eval_set),
+        "misses": misses,
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(evaluate(), indent=2))
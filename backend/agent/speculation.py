@@ -0,0 +1,154 @@
+# speculation.py
+
+import asyncio
+import collections
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from router import predict
+from tools import registry
+
+SPECULATIVE_TOOLS_ENABLED = os.getenv("SPECULATIVE_TOOLS_ENABLED", "0") == "1"
+# Router score a read-only intent needs before it is fetched speculatively
+SPECULATION_MIN_SCORE = float(os.getenv("SPECULATION_MIN_SCORE", "0.3"))
+SPECULATION_MAX_TOOLS = int(os.getenv("SPECULATION_MAX_TOOLS", "2"))
+# Speculation pauses once this many results were thrown away in the last minute
+SPECULATION_MAX_WASTED_PER_MINUTE = int(os.getenv("SPECULATION_MAX_WASTED_PER_MINUTE", "30"))
+
+# (tool name, canonical JSON arguments)
+CallKey = Tuple[str, str]
+
+
+def call_key(name: str, args: Dict) -> Optional[CallKey]:
+    """
+    Key identifying a tool call by its effective arguments, so a call that
+    spells out a default matches one that omits it. None if args don't bind.
+    """
+    spec = registry.get(name)
+    if spec is None:
+        return None
+    try:
+        bound = inspect.signature(spec.func).bind(None, **args)
+    except TypeError:
+        return None
+    bound.apply_defaults()
+    effective = dict(list(bound.arguments.items())[1:])
+    return name, json.dumps(effective, sort_keys=True, default=str)
+
+
+class Speculation:
+    """Read-only tool fetches started for one request ahead of the model asking."""
+
+    def __init__(self, speculator: "Speculator"):
+        self.speculator = speculator
+        # key -> task; finished[key] is set once the fetch completes
+        self.pending: Dict[CallKey, asyncio.Task] = {}
+        self.started_at = time.monotonic()
+        self.finished: Dict[CallKey, float] = {}
+
+    def add(self, key: CallKey, coro: Awaitable):
+        task = asyncio.ensure_future(coro)
+        task.add_done_callback(lambda _: self.finished.setdefault(key, time.monotonic()))
+        self.pending[key] = task
+
+    def take(self, name: str, arguments: str) -> Optional[asyncio.Task]:
+        """The speculative fetch for this call if one was started, else None."""
+        try:
+            key = call_key(name, json.loads(arguments or "{}"))
+        except ValueError:
+            return None
+        task = self.pending.pop(key, None)
+        if task is None:
+            return None
+
+        # Fetch time already spent when the model asked for the tool
+        done_at = self.finished.get(key, time.monotonic())
+        self.speculator.record_hit(done_at - self.started_at)
+        return task
+
+    def discard(self):
+        """Cancel and count every fetch the model never asked for."""
+        for task in self.pending.values():
+            task.cancel()
+        self.speculator.record_waste(len(self.pending))
+        self.pending.clear()
+
+
+class Speculator:
+    """
+    Starts the read-only tools the router predicts for a message while the
+    first completion is in flight. Wasted fetches are capped per request
+    and per minute.
+    """
+
+    def __init__(self):
+        self._wasted_at = collections.deque()
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+        self.skipped_budget = 0
+        self.latency_saved_seconds = 0.0
+
+    def _over_budget(self) -> bool:
+        cutoff = time.monotonic() - 60
+        with self._lock:
+            while self._wasted_at and self._wasted_at[0] < cutoff:
+                self._wasted_at.popleft()
+            return len(self._wasted_at) >= SPECULATION_MAX_WASTED_PER_MINUTE
+
+    def start(self, user_input: str, run: Callable[[str, str], Awaitable]) -> Optional[Speculation]:
+        """
+        Launch run(name, arguments) for each predicted read-only tool.
+        Returns None when nothing was started.
+        """
+        if self._over_budget():
+            with self._lock:
+                self.skipped_budget += 1
+            return None
+
+        speculation = Speculation(self)
+        for match in predict(user_input, SPECULATION_MIN_SCORE, SPECULATION_MAX_TOOLS):
+            spec = registry.get(match.intent)
+            key = call_key(match.intent, match.args)
+            if spec is None or not spec.read_only or key is None:
+                continue
+            speculation.add(key, run(match.intent, json.dumps(match.args)))
+
+        if not speculation.pending:
+            return None
+        with self._lock:
+            self.started += len(speculation.pending)
+        return speculation
+
+    def record_hit(self, saved_seconds: float):
+        with self._lock:
+            self.hits += 1
+            self.latency_saved_seconds += saved_seconds
+
+    def record_waste(self, count: int):
+        if not count:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self.wasted += count
+            self._wasted_at.extend([now] * count)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": SPECULATIVE_TOOLS_ENABLED,
+                "started": self.started,
+                "hits": self.hits,
+                "wasted": self.wasted,
+                "skipped_budget": self.skipped_budget,
+                "hit_rate": self.hits / self.started if self.started else 0.0,
+                "latency_saved_seconds": round(self.latency_saved_seconds, 3),
+            }
+
+
+speculator = Speculator() if SPECULATIVE_TOOLS_ENABLED else None
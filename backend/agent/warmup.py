@@ -0,0 +1,125 @@
+# warmup.py
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import get_async_client, get_client
+from context import count_tokens
+from router import get_router
+from service_pool import warm as warm_google
+from timezones import local_tz
+from tools import registry
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Warm-up configuration
+# ----------------------
+# With this off nothing is preloaded and the process reports ready at once;
+# each dependency then loads on the first request that needs it
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+
+
+class NotConfigured(Exception):
+    """A step whose dependency loaded but can't be used as configured; it doesn't block readiness."""
+
+
+def _warm_openai():
+    if not os.getenv("OPENAI_API_KEY"):
+        # The SDK still loads, so setting the key later costs only a client
+        import openai  # noqa: F401
+        raise NotConfigured("OPENAI_API_KEY is not set; agent requests will fail")
+    get_client()
+    get_async_client()
+
+
+def _warm_google_auth():
+    # Loading credentials imports google-auth (and cryptography); refreshes
+    # also import the requests transport
+    import google.auth.exceptions  # noqa: F401
+    import google.auth.transport.requests  # noqa: F401
+    import google.oauth2.credentials  # noqa: F401
+
+
+# (name, step) in the order they run
+STEPS: List[Tuple[str, Callable[[], object]]] = [
+    ("router", get_router),
+    ("tool_schemas", registry.schemas_json),
+    ("tokenizer", lambda: count_tokens("warm")),
+    ("google_discovery", warm_google),
+    ("google_auth", _warm_google_auth),
+    ("local_tz", local_tz),
+    ("openai", _warm_openai),
+]
+
+
+class Warmup:
+    """
+    Loads the dependencies imports now defer (the OpenAI SDK, the Google
+    client and its discovery documents, the router and the tokenizer) on a
+    background thread after startup, so the process accepts connections at
+    once and the first request pays for none of it. ready() turns true when
+    every step has succeeded; a failed step keeps the process unready. A
+    step that isn't configured (no OpenAI key) doesn't, but status()
+    reports it.
+    """
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], object]]] = STEPS, enabled: bool = WARMUP_ENABLED):
+        self.steps = steps
+        self.enabled = enabled
+        # name -> {"status": pending|ok|unconfigured|error, "seconds", "error"}
+        self._status: Dict[str, Dict] = {name: {"status": "pending"} for name, _ in steps}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._started = time.monotonic()
+        self._finished: Optional[float] = None
+
+    def start(self):
+        """Run the steps on a background thread; a no-op when disabled or already started."""
+        with self._lock:
+            if not self.enabled or self._thread is not None:
+                return
+            self._started = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        for name, step in self.steps:
+            started = time.perf_counter()
+            try:
+                step()
+                result = {"status": "ok"}
+            except NotConfigured as e:
+                logger.warning("Warm-up step %s: %s", name, e)
+                result = {"status": "unconfigured", "error": str(e)}
+            except Exception as e:
+                logger.warning("Warm-up step %s failed", name, exc_info=True)
+                result = {"status": "error", "error": str(e)}
+            result["seconds"] = round(time.perf_counter() - started, 3)
+            with self._lock:
+                self._status[name] = result
+        with self._lock:
+            self._finished = time.monotonic()
+
+    def ready(self) -> bool:
+        if not self.enabled:
+            return True
+        with self._lock:
+            return all(s["status"] in ("ok", "unconfigured") for s in self._status.values())
+
+    def status(self) -> Dict:
+        ready = self.ready()
+        with self._lock:
+            return {
+                "ready": ready,
+                "enabled": self.enabled,
+                "unconfigured": [name for name, s in self._status.items() if s["status"] == "unconfigured"],
+                "seconds": round((self._finished or time.monotonic()) - self._started, 3) if self._thread else 0.0,
+                "steps": {name: dict(s) for name, s in self._status.items()},
+            }
+
+
+warmup = Warmup()
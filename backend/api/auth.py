@@ -0,0 +1,30 @@
+# auth.py
+
+import hmac
+import os
+from typing import Dict, Optional
+
+# ----------------------
+# API authentication
+# ----------------------
+# Comma-separated token:user_id pairs. When set, every request must send
+# "Authorization: Bearer <token>" and acts as that token's user. Without
+# it the API trusts the user_id it is sent (only configured users are
+# accepted), which is only safe behind a trusted network boundary.
+API_TOKENS: Dict[str, str] = dict(
+    pair.strip().split(":", 1) for pair in os.getenv("API_TOKENS", "").split(",") if ":" in pair
+)
+
+
+def authenticate(authorization: Optional[str]) -> Optional[str]:
+    """The user an Authorization header's bearer token belongs to, or None."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    token = token.strip()
+    # Compare against every token so timing doesn't reveal a partial match
+    owner = None
+    for known, user_id in API_TOKENS.items():
+        if hmac.compare_digest(known.encode(), token.encode()):
+            owner = user_id
+    return owner
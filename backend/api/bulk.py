@@ -0,0 +1,134 @@
+# bulk.py
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from paging import chunked
+from scheduler import execute
+from service_pool import credential_key, get_service
+from state import state
+
+# ----------------------
+# Bulk configuration
+# ----------------------
+# Items accepted by one bulk call
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "100"))
+# Calls per Google HTTP batch; Google recommends at most 50
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "50"))
+# Batches one bulk call keeps in flight
+BULK_MAX_CONCURRENT_BATCHES = int(os.getenv("BULK_MAX_CONCURRENT_BATCHES", "2"))
+# How long a completed idempotency key keeps returning its first result
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# How long an in-flight claim holds off retries; it lapses sooner if the
+# worker dies mid-write, so keep it above the longest bulk call
+IDEMPOTENCY_PENDING_SECONDS = float(os.getenv("IDEMPOTENCY_PENDING_SECONDS", "300"))
+
+# Record status while an item's write is in flight
+PENDING = "pending"
+
+
+def idempotency_key(creds, kind: str, item: Dict, explicit: Optional[str] = None) -> str:
+    """
+    Key for one bulk item, scoped to the user and the operation. Without an
+    explicit key the item's content is used, so a retry of the same request
+    after a timeout maps to the same key.
+    """
+    basis = explicit if explicit else json.dumps(item, sort_keys=True, default=str)
+    raw = json.dumps([str(credential_key(creds)), kind, basis])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# ----------------------
+# Idempotency store
+# ----------------------
+class IdempotencyStore:
+    """
+    First result per idempotency key, kept in the shared state so a retry
+    that lands on another worker still finds it. begin() claims a key
+    atomically, so two concurrent retries of one item never both reach Google.
+    The claim is a lease: if its worker dies before finish(), the key can be
+    claimed again after pending_seconds instead of the full TTL.
+    """
+
+    namespace = "idempotency"
+
+    def __init__(
+        self,
+        ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS,
+        pending_seconds: float = IDEMPOTENCY_PENDING_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.pending_seconds = pending_seconds
+
+    def begin(self, key: str) -> Optional[Dict]:
+        """Claim key and return None, or return the record of an earlier attempt."""
+        if state.add(self.namespace, key, {"status": PENDING}, self.pending_seconds):
+            return None
+        # The claim may have expired in between; treat it as still in flight
+        return state.get(self.namespace, key) or {"status": PENDING}
+
+    def finish(self, key: str, record: Dict):
+        state.set(self.namespace, key, record, self.ttl_seconds)
+
+    def release(self, key: str):
+        """Forget a key whose write definitely did not happen, so it can be retried."""
+        state.delete(self.namespace, key)
+
+
+idempotency_store = IdempotencyStore()
+
+
+# ----------------------
+# Batched execution
+# ----------------------
+# One batched call: (item index, builds the request from a service)
+BatchCall = Tuple[int, Callable[[Any], Any]]
+
+
+def run_batched(
+    creds,
+    api: str,
+    version: str,
+    calls: List[BatchCall],
+    units_per_call: float = 1,
+    idempotent: bool = True,
+) -> Dict[int, Tuple[Any, Optional[Exception]]]:
+    """
+    Send calls as Google HTTP batch requests of BULK_BATCH_SIZE, with at
+    most BULK_MAX_CONCURRENT_BATCHES of this call's batches in flight; other
+    bulk calls get their own. Returns index -> (response, exception) for
+    every call; a batch that fails as a whole gives each of its calls that
+    batch's exception. api doubles as the scheduler upstream.
+    """
+    def run_chunk(chunk: List[BatchCall]) -> Dict[int, Tuple[Any, Optional[Exception]]]:
+        # The pooled service sends through this thread's own transport
+        service = get_service(api, version, creds)
+        results: Dict[int, Tuple[Any, Optional[Exception]]] = {}
+
+        def on_response(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        batch = service.new_batch_http_request(callback=on_response)
+        for index, build in chunk:
+            batch.add(build(service), request_id=str(index))
+        try:
+            execute(batch, creds, upstream=api, units=units_per_call * len(chunk), idempotent=idempotent)
+        except Exception as e:
+            return {index: (None, e) for index, _ in chunk}
+        return results
+
+    chunks = list(chunked(calls, BULK_BATCH_SIZE))
+    merged: Dict[int, Tuple[Any, Optional[Exception]]] = {}
+    if len(chunks) <= 1:
+        for chunk in chunks:
+            merged.update(run_chunk(chunk))
+        return merged
+    # A pool per call, so one large request can't hold up everyone else's batches
+    workers = min(BULK_MAX_CONCURRENT_BATCHES, len(chunks))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk") as pool:
+        for results in pool.map(run_chunk, chunks):
+            merged.update(results)
+    return merged
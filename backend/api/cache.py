@@ -0,0 +1,106 @@
+# cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+# ----------------------
+# Cache configuration
+# ----------------------
+CALENDAR_CACHE_TTL_SECONDS = float(os.getenv("CALENDAR_CACHE_TTL_SECONDS", "60"))
+INBOX_CACHE_TTL_SECONDS = float(os.getenv("INBOX_CACHE_TTL_SECONDS", "30"))
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "512"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe read-through cache with a per-entry TTL and LRU eviction.
+    Writers call invalidate() with a predicate over keys to evict what they touched.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> (expires_at, value), in LRU order
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]):
+        """Return the cached value, calling loader() and caching its result on a miss."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Evict every entry whose key matches predicate. Returns the number evicted."""
+        with self._lock:
+            stale = [k for k in self._entries if predicate(k)]
+            for k in stale:
+                del self._entries[k]
+        return len(stale)
+
+    def invalidate_entries(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Like invalidate(), but the predicate also sees the cached value."""
+        with self._lock:
+            stale = [k for k, (_, v) in self._entries.items() if predicate(k, v)]
+            for k in stale:
+                del self._entries[k]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Keyed by (credential, calendar id, window start, window end)
+calendar_cache = TTLCache(CALENDAR_CACHE_TTL_SECONDS, READ_CACHE_MAX_ENTRIES)
+
+# Keyed by (credential, query, max results)
+inbox_cache = TTLCache(INBOX_CACHE_TTL_SECONDS, READ_CACHE_MAX_ENTRIES)
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Return hit/miss counters for the read caches."""
+    return {
+        "calendar": calendar_cache.stats(),
+        "inbox": inbox_cache.stats(),
+    }
@@ -1,26 +1,47 @@
-from googleapiclient.discovery import build
-from datetime import datetime, timedelta
-from dateutil import tz
-from typing import List, Dict, Optional
+import base64
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Dict, Optional
+
+from googleapiclient.errors import HttpError
+
+from bulk import PENDING, idempotency_key, idempotency_store, run_batched
+from cache import calendar_cache
+from calendar_sync import sync_engine
+from freebusy import merge_intervals, subtract_intervals
+from paging import iter_items
+from scheduler import execute
+from service_pool import credential_key, get_service
+from state import bump_epoch, data_epoch
+from timezones import local_tz
 
 # ----------------------
 # Google Calendar service
 # ----------------------
 def get_calendar_service(creds):
-    """Return a Google Calendar service object from credentials."""
-    return build("calendar", "v3", credentials=creds)
+    """Return a pooled Google Calendar service object for the credentials."""
+    return get_service("calendar", "v3", creds)
+
+# Events per page; the API's maximum
+EVENTS_PAGE_SIZE = 2500
+# Field mask for callers that only need event times
+BUSY_FIELDS = "nextPageToken,items(start,end)"
 
 # ----------------------
 # Helper functions
 # ----------------------
 def local_now() -> datetime:
     """Return current local datetime."""
-    return datetime.now(tz=tz.tzlocal())
+    return datetime.now(tz=local_tz())
 
 def start_of_day(dt: datetime) -> datetime:
     """Return datetime set to start of the day (00:00 local time)."""
     return dt.replace(hour=0, minute=0, second=0, microsecond=0)
 
+def as_aware(dt: datetime) -> datetime:
+    """Treat naive datetimes as UTC, matching how schedule_meeting sends them."""
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
 # ----------------------
 # Event retrieval
 # ----------------------
@@ -34,21 +55,66 @@ def get_events(
     """
     Retrieve calendar events between start and end datetimes.
     Optionally filter by a keyword in the title.
+    Served from the local sync store when it covers the window, otherwise
+    from the read cache or the API.
     """
-    service = get_calendar_service(creds)
-    events_result = service.events().list(
-        calendarId=calendar_id,
-        timeMin=start.isoformat(),
-        timeMax=end.isoformat(),
-        singleEvents=True,
-        orderBy="startTime",
-    ).execute()
-
-    events = events_result.get("items", [])
+    events = sync_engine.query(creds, start, end, calendar_id)
+    if events is None:
+        cred = credential_key(creds)
+        key = (cred, calendar_id, start, end, data_epoch(cred))
+        events = calendar_cache.get_or_load(
+            key, lambda: _fetch_events(creds, start, end, calendar_id)
+        )
+
     if keyword:
         events = [e for e in events if keyword.lower() in e.get("summary", "").lower()]
 
-    return events
+    return list(events)
+
+def _fetch_events(creds, start: datetime, end: datetime, calendar_id: str) -> List[Dict]:
+    return list(iter_events(creds, start, end, calendar_id))
+
+def iter_events(
+    creds,
+    start: datetime,
+    end: datetime,
+    calendar_id: str = "primary",
+    fields: Optional[str] = None,
+    page_size: int = EVENTS_PAGE_SIZE,
+) -> Iterator[Dict]:
+    """
+    Stream events between start and end from the API in start-time order,
+    following every page. fields is a partial-response mask such as
+    BUSY_FIELDS; it must keep nextPageToken for paging to continue.
+    """
+    def fetch(page_token: Optional[str]) -> Dict:
+        service = get_calendar_service(creds)
+        return execute(service.events().list(
+            calendarId=calendar_id,
+            timeMin=start.isoformat(),
+            timeMax=end.isoformat(),
+            singleEvents=True,
+            orderBy="startTime",
+            maxResults=page_size,
+            pageToken=page_token,
+            fields=fields,
+        ), creds)
+
+    return iter_items(fetch, "items")
+
+def invalidate_events(creds, start: datetime, end: datetime, calendar_id: str = "primary") -> int:
+    """Evict cached windows of a calendar that overlap [start, end)."""
+    sync_engine.mark_stale(creds, calendar_id)
+    cred = credential_key(creds)
+    # Other workers drop their cached windows when the epoch moves
+    bump_epoch(cred)
+    start, end = as_aware(start), as_aware(end)
+    return calendar_cache.invalidate(
+        lambda k: k[0] == cred
+        and k[1] == calendar_id
+        and as_aware(k[2]) < end
+        and start < as_aware(k[3])
+    )
 
 def get_tomorrow_events(creds) -> List[Dict]:
     """Return all events for tomorrow."""
@@ -59,32 +125,36 @@ def get_tomorrow_events(creds) -> List[Dict]:
 # ----------------------
 # Busy/Free computation
 # ----------------------
-def get_busy_intervals(creds, start: datetime, end: datetime) -> List[tuple]:
-    """Return (start, end) datetime tuples for busy intervals."""
-    events = get_events(creds, start, end)
-    intervals = []
+def get_busy_intervals(creds, start: datetime, end: datetime) -> Iterator[tuple]:
+    """
+    Yield (start, end) datetime tuples for busy intervals.
+    Uses the sync store or a cached window when available; otherwise streams
+    only the event times from the API without holding the events in memory.
+    """
+    events = sync_engine.query(creds, start, end)
+    if events is None:
+        cred = credential_key(creds)
+        events = calendar_cache.get((cred, "primary", start, end, data_epoch(cred)))
+    if events is None:
+        events = iter_events(creds, start, end, fields=BUSY_FIELDS)
+
     for e in events:
         s = e["start"].get("dateTime") or e["start"].get("date")
         e_ = e["end"].get("dateTime") or e["end"].get("date")
-        intervals.append((datetime.fromisoformat(s), datetime.fromisoformat(e_)))
-    return intervals
+        yield datetime.fromisoformat(s), datetime.fromisoformat(e_)
 
 def get_free_slots(creds, start: datetime, end: datetime, min_duration_minutes: int = 30):
     """Return free time slots between start and end."""
-    busy = get_busy_intervals(creds, start, end)
-    busy.sort()
-    free_slots = []
-
-    current = start
-    for s, e in busy:
-        if current < s and (s - current).total_seconds() >= min_duration_minutes * 60:
-            free_slots.append((current, s))
-        current = max(current, e)
+    busy = merge_intervals([
+        (s.timestamp(), e.timestamp()) for s, e in get_busy_intervals(creds, start, end)
+    ])
+    free = subtract_intervals([(start.timestamp(), end.timestamp())], busy)
 
-    if current < end and (end - current).total_seconds() >= min_duration_minutes * 60:
-        free_slots.append((current, end))
-
-    return free_slots
+    return [
+        (datetime.fromtimestamp(s, start.tzinfo), datetime.fromtimestamp(e, start.tzinfo))
+        for s, e in free
+        if e - s >= min_duration_minutes * 60
+    ]
 
 # ----------------------
 # Utility functions
@@ -108,13 +178,78 @@ def schedule_meeting(creds, start: datetime, end: datetime, title: str, attendee
     """
     Schedule a new meeting.
     Returns the Google Calendar event link.
+
+    The insert carries a fresh event id, so when the scheduler retries it
+    after a timeout or 5xx that actually went through, Google answers 409
+    instead of creating a second event and sending invitations twice.
     """
     service = get_calendar_service(creds)
-    event = {
+    event = meeting_body(start, end, title, attendees)
+    event["id"] = event_id_for(secrets.token_hex(20))
+    try:
+        created = execute(service.events().insert(calendarId="primary", body=event, sendUpdates="all"), creds)
+    except HttpError as e:
+        if e.resp.status != 409:
+            raise
+        # An earlier attempt created it
+        created = execute(service.events().get(calendarId="primary", eventId=event["id"]), creds)
+    invalidate_events(creds, start, end)
+    return created.get("htmlLink")
+
+def meeting_body(start: datetime, end: datetime, title: str, attendees: Optional[List[str]] = None) -> Dict:
+    return {
         "summary": title,
         "start": {"dateTime": start.isoformat(), "timeZone": "UTC"},
         "end": {"dateTime": end.isoformat(), "timeZone": "UTC"},
         "attendees": [{"email": a} for a in attendees] if attendees else [],
     }
-    created = service.events().insert(calendarId="primary", body=event, sendUpdates="all").execute()
-    return created.get("htmlLink")
+
+def event_id_for(key: str) -> str:
+    """A valid Calendar event id (base32hex, lowercase) derived from an idempotency key."""
+    return base64.b32hexencode(bytes.fromhex(key)[:20]).decode().lower()
+
+def schedule_meetings(creds, meetings: List[Dict]) -> List[Dict]:
+    """
+    Schedule many meetings through Calendar HTTP batch requests. Each
+    meeting has start, end (datetimes), title, and optional attendees and
+    idempotency_key. Returns one result per meeting, in order.
+
+    Every insert carries an event id derived from its idempotency key, so
+    a retry of a meeting that was already created gets a 409 from Google
+    instead of a second event.
+    """
+    results: List[Optional[Dict]] = [None] * len(meetings)
+    keys: Dict[int, str] = {}
+    calls = []
+
+    for i, m in enumerate(meetings):
+        body = meeting_body(m["start"], m["end"], m["title"], m.get("attendees"))
+        key = idempotency_key(creds, "calendar.insert", body, m.get("idempotency_key"))
+        prior = idempotency_store.begin(key)
+        if prior is not None:
+            results[i] = {"status": "in_progress"} if prior["status"] == PENDING else {**prior, "replayed": True}
+            continue
+        keys[i] = key
+        body["id"] = event_id_for(key)
+        calls.append((i, lambda service, body=body: service.events().insert(
+            calendarId="primary", body=body, sendUpdates="all"
+        )))
+
+    for i, (response, error) in run_batched(creds, "calendar", "v3", calls).items():
+        event_id = event_id_for(keys[i])
+        if error is None:
+            record = {"status": "scheduled", "event_id": event_id, "event_link": response.get("htmlLink")}
+        elif isinstance(error, HttpError) and error.resp.status == 409:
+            record = {"status": "already_scheduled", "event_id": event_id}
+        else:
+            # Safe to retry: the fixed event id turns a duplicate into a 409
+            idempotency_store.release(keys[i])
+            results[i] = {"status": "error", "error": str(error)}
+            continue
+        idempotency_store.finish(keys[i], record)
+        results[i] = record
+
+    if keys:
+        sent = [meetings[i] for i in keys]
+        invalidate_events(creds, min(m["start"] for m in sent), max(m["end"] for m in sent))
+    return results
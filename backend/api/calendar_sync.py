@@ -0,0 +1,283 @@
+# calendar_sync.py
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from scheduler import execute
+from service_pool import credential_key, get_service
+from state import data_epoch
+from timezones import local_tz
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Sync configuration
+# ----------------------
+CALENDAR_SYNC_ENABLED = os.getenv("CALENDAR_SYNC_ENABLED", "1") == "1"
+SYNC_INTERVAL_SECONDS = float(os.getenv("CALENDAR_SYNC_INTERVAL_SECONDS", "60"))
+# Reads force an inline incremental sync when the store is older than this
+SYNC_STALE_SECONDS = float(os.getenv("CALENDAR_SYNC_STALE_SECONDS", "120"))
+# How far back and ahead the full sync reaches; windows outside go to the API.
+# singleEvents expands recurring events, so the window needs an upper bound.
+SYNC_PAST_DAYS = int(os.getenv("CALENDAR_SYNC_PAST_DAYS", "30"))
+SYNC_FUTURE_DAYS = int(os.getenv("CALENDAR_SYNC_FUTURE_DAYS", "365"))
+# Stores nobody has queried for this long stop syncing and are dropped
+STORE_IDLE_SECONDS = float(os.getenv("CALENDAR_STORE_IDLE_SECONDS", "3600"))
+
+
+def parse_event_time(value: str) -> datetime:
+    """Parse an event dateTime or all-day date; dates are local midnight."""
+    dt = datetime.fromisoformat(value)
+    return dt if dt.tzinfo else dt.replace(tzinfo=local_tz())
+
+
+def event_bounds(event: Dict) -> Tuple[datetime, datetime]:
+    s = event["start"].get("dateTime") or event["start"].get("date")
+    e = event["end"].get("dateTime") or event["end"].get("date")
+    return parse_event_time(s), parse_event_time(e)
+
+
+# ----------------------
+# Local event index
+# ----------------------
+class EventIndex:
+    """Events of one calendar, kept sorted by start time for range queries."""
+
+    def __init__(self):
+        self._events: Dict[str, Tuple[float, float, Dict]] = {}
+        self._starts: List[Tuple[float, str]] = []
+        # Longest event seen; bounds how far back an overlapping event can start
+        self._max_duration = 0.0
+
+    def upsert(self, event: Dict):
+        event_id = event["id"]
+        self.remove(event_id)
+        start, end = event_bounds(event)
+        s, e = start.timestamp(), end.timestamp()
+        self._events[event_id] = (s, e, event)
+        insort(self._starts, (s, event_id))
+        self._max_duration = max(self._max_duration, e - s)
+
+    def remove(self, event_id: str):
+        entry = self._events.pop(event_id, None)
+        if entry is not None:
+            del self._starts[bisect_left(self._starts, (entry[0], event_id))]
+
+    def clear(self):
+        self._events.clear()
+        self._starts.clear()
+        self._max_duration = 0.0
+
+    def between(self, start: datetime, end: datetime) -> List[Dict]:
+        """Return events overlapping [start, end), ordered by start time."""
+        start_ts, end_ts = start.timestamp(), end.timestamp()
+        lo = bisect_left(self._starts, (start_ts - self._max_duration,))
+        hi = bisect_left(self._starts, (end_ts,))
+
+        events = []
+        for _, event_id in self._starts[lo:hi]:
+            _, e, event = self._events[event_id]
+            if e > start_ts:
+                events.append(event)
+        return events
+
+    def __len__(self):
+        return len(self._events)
+
+
+class CalendarStore:
+    """Local mirror of one calendar, kept current with Calendar API sync tokens."""
+
+    def __init__(self, creds, calendar_id: str):
+        self.creds = creds
+        self.calendar_id = calendar_id
+        self.index = EventIndex()
+        self.sync_token: Optional[str] = None
+        self.window_start: Optional[datetime] = None
+        self.window_end: Optional[datetime] = None
+        self.last_synced = 0.0
+        self.last_used = time.monotonic()
+        self.stale = True
+        # data_epoch at the last sync; a newer one means another worker wrote
+        self.epoch = 0
+        self.lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.sync_token is not None
+
+    def covers(self, start: datetime, end: datetime) -> bool:
+        return (
+            self.ready
+            and start.timestamp() >= self.window_start.timestamp()
+            and end.timestamp() <= self.window_end.timestamp()
+        )
+
+    def sync(self) -> bool:
+        """
+        Apply changes since the last sync, or do a full sync if there is no
+        token. Returns whether a mirror that was already in sync changed.
+        """
+        with self.lock:
+            ready = self.ready
+            try:
+                changed = self._sync()
+            except HttpError as e:
+                if e.resp.status != 410:
+                    raise
+                # 410 Gone: the sync token expired, start over from scratch
+                self.sync_token = None
+                changed = self._sync()
+            self.last_synced = time.monotonic()
+            self.stale = False
+            return ready and changed
+
+    def between(self, start: datetime, end: datetime) -> List[Dict]:
+        with self.lock:
+            self.last_used = time.monotonic()
+            return self.index.between(start, end)
+
+    def _sync(self) -> bool:
+        """One full or incremental sync; returns whether anything was applied."""
+        service = get_service("calendar", "v3", self.creds)
+        full = self.sync_token is None
+
+        if full:
+            self.index.clear()
+            now = datetime.now(tz=local_tz())
+            window_start = now - timedelta(days=SYNC_PAST_DAYS)
+            window_end = now + timedelta(days=SYNC_FUTURE_DAYS)
+            params = {"timeMin": window_start.isoformat(), "timeMax": window_end.isoformat()}
+        else:
+            params = {"syncToken": self.sync_token}
+
+        changed = full
+        page_token = None
+        while True:
+            response = execute(service.events().list(
+                calendarId=self.calendar_id,
+                singleEvents=True,
+                pageToken=page_token,
+                **params,
+            ), self.creds)
+
+            for event in response.get("items", []):
+                changed = True
+                if event.get("status") == "cancelled":
+                    self.index.remove(event["id"])
+                else:
+                    self.index.upsert(event)
+
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+        self.sync_token = response.get("nextSyncToken")
+        if full:
+            self.window_start = window_start
+            self.window_end = window_end
+        return changed
+
+
+# ----------------------
+# Background sync engine
+# ----------------------
+class CalendarSyncEngine:
+    """
+    Keeps a CalendarStore per (credential, calendar) in sync on a background
+    thread. Reads are answered from the local index once the initial sync
+    has finished; until then query() returns None and callers use the API.
+    Listeners hear about changes a sync finds upstream.
+    """
+
+    def __init__(self, interval_seconds: float = SYNC_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._stores: Dict[Tuple, CalendarStore] = {}
+        self._listeners: List[Callable] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, creds, calendar_id: str = "primary") -> CalendarStore:
+        key = (credential_key(creds), calendar_id)
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                store = CalendarStore(creds, calendar_id)
+                self._stores[key] = store
+                self._start()
+                # Run the initial sync now rather than at the next interval
+                self._wake.set()
+            return store
+
+    def add_listener(self, listener: Callable):
+        """Call listener(creds) whenever a sync finds that a calendar changed."""
+        self._listeners.append(listener)
+
+    def _sync(self, store: CalendarStore):
+        if store.sync():
+            for listener in self._listeners:
+                try:
+                    listener(store.creds)
+                except Exception:
+                    logger.warning("Calendar change listener failed", exc_info=True)
+
+    def mark_stale(self, creds, calendar_id: str = "primary"):
+        """Force the next read to sync first, e.g. after a local write."""
+        with self._lock:
+            store = self._stores.get((credential_key(creds), calendar_id))
+        if store is not None:
+            store.stale = True
+
+    def query(self, creds, start: datetime, end: datetime, calendar_id: str = "primary") -> Optional[List[Dict]]:
+        """Return events overlapping [start, end) from the local store, or None if it can't answer."""
+        if not CALENDAR_SYNC_ENABLED:
+            return None
+
+        store = self.track(creds, calendar_id)
+        if not store.covers(start, end):
+            return None
+
+        epoch = data_epoch(credential_key(creds))
+        if store.stale or store.epoch != epoch or time.monotonic() - store.last_synced > SYNC_STALE_SECONDS:
+            try:
+                self._sync(store)
+            except Exception:
+                logger.warning("Inline calendar sync failed", exc_info=True)
+                return None
+            store.epoch = epoch
+
+        return store.between(start, end)
+
+    def _start(self):
+        """Start the sync thread if it isn't running. Caller holds the lock."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="calendar-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+
+            now = time.monotonic()
+            with self._lock:
+                for key in [k for k, s in self._stores.items() if now - s.last_used > STORE_IDLE_SECONDS]:
+                    del self._stores[key]
+                stores = list(self._stores.values())
+
+            for store in stores:
+                try:
+                    self._sync(store)
+                except Exception:
+                    logger.warning("Calendar sync failed for %s", store.calendar_id, exc_info=True)
+
+
+sync_engine = CalendarSyncEngine()
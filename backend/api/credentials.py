@@ -0,0 +1,392 @@
+# credentials.py
+
+import asyncio
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Optional
+
+from state import state
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Credential configuration
+# ----------------------
+DEFAULT_USER = "default"
+# The default user's token file; other users live in GOOGLE_TOKEN_DIR as <user>.json
+GOOGLE_TOKEN_FILE = os.getenv("GOOGLE_TOKEN_FILE", "token.json")
+GOOGLE_TOKEN_DIR = os.getenv("GOOGLE_TOKEN_DIR", "tokens")
+# Refresh this long before the access token expires
+REFRESH_MARGIN_SECONDS = float(os.getenv("CREDENTIAL_REFRESH_MARGIN_SECONDS", "300"))
+REFRESH_CHECK_SECONDS = float(os.getenv("CREDENTIAL_REFRESH_CHECK_SECONDS", "30"))
+# Overrides the OAuth token endpoint, e.g. to refresh against a local fake
+GOOGLE_TOKEN_URI = os.getenv("GOOGLE_TOKEN_URI", "")
+# With shared state, one worker refreshes a user's token and the others adopt
+# it; a claim on the refresh lapses after this long if its worker dies
+REFRESH_CLAIM_SECONDS = float(os.getenv("CREDENTIAL_REFRESH_CLAIM_SECONDS", "30"))
+REFRESH_POLL_SECONDS = 0.25
+# Comma-separated user ids the server acts for. Empty means the default user
+# plus every user with a token file in GOOGLE_TOKEN_DIR; other ids are refused.
+ALLOWED_USERS = frozenset(u.strip() for u in os.getenv("ALLOWED_USERS", "").split(",") if u.strip())
+
+SCOPES = ["https://www.googleapis.com/auth/calendar.readonly",
+          "https://www.googleapis.com/auth/gmail.readonly",
+          "https://www.googleapis.com/auth/calendar",
+          "https://www.googleapis.com/auth/gmail.send"
+          ]
+
+
+def token_path(user_id: str) -> str:
+    if user_id == DEFAULT_USER:
+        return GOOGLE_TOKEN_FILE
+    safe = re.sub(r"[^A-Za-z0-9_.@-]", "_", user_id)
+    return os.path.join(GOOGLE_TOKEN_DIR, f"{safe}.json")
+
+
+def save_credentials(creds: "Credentials", path: str):
+    """Write credentials via a temp file and rename, so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(creds.to_json())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def copy_credentials(creds: "Credentials", keep_token: bool = True) -> "Credentials":
+    """A separate Credentials object for the same grant."""
+    from google.oauth2.credentials import Credentials
+
+    return Credentials(
+        token=creds.token if keep_token else None,
+        expiry=creds.expiry if keep_token else None,
+        refresh_token=creds.refresh_token,
+        token_uri=GOOGLE_TOKEN_URI or creds.token_uri,
+        client_id=creds.client_id,
+        client_secret=creds.client_secret,
+        scopes=creds.scopes,
+    )
+
+
+def seconds_until_expiry(creds: "Credentials") -> float:
+    # google-auth keeps expiry as naive UTC
+    if creds.expiry is None:
+        return float("inf")
+    return (creds.expiry - datetime.utcnow()).total_seconds()
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+@dataclass
+class _Entry:
+    creds: Optional["Credentials"]
+    path: str
+    # The initial load, which a user's first request waits for
+    loading: Optional[Future] = None
+    # The in-flight refresh, shared by every caller that asks meanwhile
+    refreshing: Optional[Future] = None
+    # Token file mtime as last loaded or written; a change means re-authorization
+    mtime: Optional[float] = None
+    # Set when the refresh token was rejected, until the user re-authorizes
+    revoked: bool = False
+    # No automatic refresh before this monotonic time, after a failure
+    retry_at: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class CredentialManager:
+    """
+    Per-user Google credentials held in memory.
+
+    get() only reads memory. Loading from disk, refreshing ahead of expiry
+    and persisting refreshed tokens happen on background threads, and
+    concurrent refreshes of one user are coalesced into a single request.
+    With shared state, refreshed tokens are published there and refreshes
+    are coalesced across workers too.
+    """
+
+    def __init__(self, margin_seconds: float = REFRESH_MARGIN_SECONDS):
+        self.margin_seconds = margin_seconds
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="credentials")
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self.refreshes = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    # ----------------------
+    # Hot path
+    # ----------------------
+    def get(self, user_id: str = DEFAULT_USER) -> Optional["Credentials"]:
+        """
+        The user's credentials from memory. A user seen for the first time is
+        loaded in the background and gets None until then (see aget). A
+        token inside the refresh margin is returned as is while a refresh is
+        scheduled. Users that aren't configured get None.
+        """
+        entry = self._entry(user_id)
+        if entry is None:
+            return None
+        if self._due(entry):
+            self.refresh(user_id)
+        return entry.creds
+
+    async def aget(self, user_id: str = DEFAULT_USER) -> Optional["Credentials"]:
+        """Like get(), but a user's first request waits for the initial load."""
+        entry = self._entry(user_id)
+        if entry is not None and entry.loading is not None and not entry.loading.done():
+            await asyncio.wrap_future(entry.loading)
+        return self.get(user_id)
+
+    def configured(self, user_id: str) -> bool:
+        """Whether the server acts for this user at all."""
+        if ALLOWED_USERS:
+            return user_id in ALLOWED_USERS
+        with self._lock:
+            if user_id in self._entries:
+                return True
+        return user_id == DEFAULT_USER or os.path.exists(token_path(user_id))
+
+    def _entry(self, user_id: str) -> Optional[_Entry]:
+        """The user's entry, created with a background load on first use."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is not None:
+            return entry
+        # Only configured users get an entry, so arbitrary ids can't grow the map
+        if not self.configured(user_id):
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = _Entry(None, token_path(user_id))
+                self._entries[user_id] = entry
+                entry.loading = self._executor.submit(self._load, user_id, entry)
+                self._start()
+            return entry
+
+    def _due(self, entry: _Entry) -> bool:
+        return (
+            entry.creds is not None
+            and not entry.revoked
+            and time.monotonic() >= entry.retry_at
+            and seconds_until_expiry(entry.creds) < self.margin_seconds
+        )
+
+    # ----------------------
+    # Background work
+    # ----------------------
+    def load(self, user_id: str = DEFAULT_USER) -> Optional["Credentials"]:
+        """Load a user's token file now; for startup, not request handling."""
+        entry = _Entry(None, token_path(user_id))
+        with self._lock:
+            self._entries[user_id] = entry
+            self._start()
+        self._load(user_id, entry)
+        return entry.creds
+
+    def _load(self, user_id: str, entry: _Entry, from_file: bool = False):
+        # Another worker may hold a newer token than the file, unless the
+        # file was just rewritten by re-authorization
+        shared = None if from_file else self._shared_credentials(user_id)
+        if shared is not None:
+            entry.creds = shared
+            if self._due(entry):
+                self.refresh(user_id)
+            return
+        if not os.path.exists(entry.path):
+            logger.info("No token file for %s at %s", user_id, entry.path)
+            return
+        from google.oauth2.credentials import Credentials
+
+        try:
+            entry.mtime = os.path.getmtime(entry.path)
+            entry.creds = copy_credentials(Credentials.from_authorized_user_file(entry.path, SCOPES))
+        except Exception:
+            logger.warning("Could not load credentials for %s", user_id, exc_info=True)
+            return
+        if from_file and state.shared:
+            state.set("credentials", user_id, json.loads(entry.creds.to_json()))
+        if self._due(entry):
+            self.refresh(user_id)
+
+    def refresh(self, user_id: str = DEFAULT_USER) -> Future:
+        """
+        Refresh a user's access token on a worker thread. Callers that ask
+        while a refresh is in flight share its Future.
+        """
+        with self._lock:
+            entry = self._entries[user_id]
+        with entry.lock:
+            if entry.refreshing is not None:
+                self.coalesced += 1
+                return entry.refreshing
+            entry.refreshing = self._executor.submit(self._refresh, user_id, entry)
+            return entry.refreshing
+
+    def _refresh(self, user_id: str, entry: _Entry) -> Optional["Credentials"]:
+        # google-auth pulls in cryptography, so it's imported on first use
+        from google.auth.exceptions import RefreshError
+
+        claimed = False
+        try:
+            current = entry.creds
+            if current is None or not current.refresh_token:
+                return current
+
+            if state.shared:
+                if self._adopt(user_id, entry):
+                    return entry.creds
+                claimed = state.add("credential_refresh", user_id, True, REFRESH_CLAIM_SECONDS)
+                if not claimed:
+                    return self._await_shared(user_id, entry)
+
+            # The transport pulls in requests, so it's imported on the first refresh
+            from google.auth.transport.requests import Request
+
+            # Refresh a copy and swap it in, so readers never see a half-updated object
+            fresh = copy_credentials(current, keep_token=False)
+            fresh.refresh(Request())
+            entry.creds = fresh
+            self.refreshes += 1
+
+            save_credentials(fresh, entry.path)
+            entry.mtime = os.path.getmtime(entry.path)
+            if state.shared:
+                state.set("credentials", user_id, json.loads(fresh.to_json()))
+            return fresh
+
+        except RefreshError:
+            self.failures += 1
+            entry.revoked = True
+            logger.error("Refresh token for %s was rejected; re-authorization required", user_id, exc_info=True)
+            return entry.creds
+
+        except Exception:
+            self.failures += 1
+            entry.retry_at = time.monotonic() + REFRESH_CHECK_SECONDS
+            logger.warning("Credential refresh failed for %s", user_id, exc_info=True)
+            return entry.creds
+
+        finally:
+            if claimed:
+                state.delete("credential_refresh", user_id)
+            with entry.lock:
+                entry.refreshing = None
+
+    # ----------------------
+    # Shared state
+    # ----------------------
+    def _shared_credentials(self, user_id: str) -> Optional["Credentials"]:
+        if not state.shared:
+            return None
+        info = state.get("credentials", user_id)
+        if info is None:
+            return None
+        from google.oauth2.credentials import Credentials
+
+        try:
+            return copy_credentials(Credentials.from_authorized_user_info(info, SCOPES))
+        except Exception:
+            logger.warning("Ignoring unreadable shared credentials for %s", user_id, exc_info=True)
+            return None
+
+    def _adopt(self, user_id: str, entry: _Entry) -> bool:
+        """Take another worker's token if it is fresher than the refresh margin."""
+        shared = self._shared_credentials(user_id)
+        if shared is None or seconds_until_expiry(shared) < self.margin_seconds:
+            return False
+        entry.creds = shared
+        self.coalesced += 1
+        return True
+
+    def _reauthorized(self, user_id: str, entry: _Entry) -> bool:
+        """Whether a revoked user has a new grant: a rewritten token file, or another worker's."""
+        mtime = _mtime(entry.path)
+        if mtime is not None and mtime != entry.mtime:
+            return True
+        shared = self._shared_credentials(user_id)
+        return (
+            shared is not None
+            and entry.creds is not None
+            and shared.refresh_token != entry.creds.refresh_token
+        )
+
+    def _await_shared(self, user_id: str, entry: _Entry) -> Optional["Credentials"]:
+        """Wait for the worker holding the refresh claim to publish its token."""
+        deadline = time.monotonic() + REFRESH_CLAIM_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(REFRESH_POLL_SECONDS)
+            if self._adopt(user_id, entry):
+                break
+            # The claimer finished without publishing; the next check retries
+            if state.get("credential_refresh", user_id) is None:
+                break
+        return entry.creds
+
+    def _start(self):
+        """Start the refresh thread if it isn't running. Caller holds the lock."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="credential-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(REFRESH_CHECK_SECONDS)
+            self._wake.clear()
+            try:
+                self.check()
+            except Exception:
+                logger.warning("Credential check failed", exc_info=True)
+
+    def check(self):
+        """Refresh tokens that are due, and reload revoked users who re-authorized."""
+        with self._lock:
+            entries = list(self._entries.items())
+        for user_id, entry in entries:
+            if entry.revoked and self._reauthorized(user_id, entry):
+                logger.info("Reloading credentials for %s after re-authorization", user_id)
+                from_file = entry.mtime != _mtime(entry.path)
+                entry.revoked = False
+                entry.retry_at = 0.0
+                self._load(user_id, entry, from_file=from_file)
+            elif self._due(entry):
+                self.refresh(user_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "users": len(self._entries),
+                "loaded": sum(1 for e in self._entries.values() if e.creds is not None),
+                "revoked": sum(1 for e in self._entries.values() if e.revoked),
+                "refreshes": self.refreshes,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+            }
+
+
+credential_manager = CredentialManager()
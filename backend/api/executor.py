@@ -0,0 +1,25 @@
+# executor.py
+
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# ----------------------
+# Blocking-call pool
+# ----------------------
+# Tools, Google client calls and other blocking work run here rather than on
+# asyncio's default executor, which is only min(32, cpu + 4) threads. The
+# default matches the 40-thread pool Starlette gives sync handlers.
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "40"))
+
+executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Like asyncio.to_thread, but on the shared blocking pool."""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. the OpenTelemetry span) into the thread
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(executor, call)
@@ -0,0 +1,190 @@
+# freebusy.py
+
+from datetime import datetime, time, timedelta
+from typing import Dict, List, Sequence, Tuple
+
+from scheduler import execute
+from service_pool import get_service
+from timezones import local_tz
+
+# (start, end) in epoch seconds
+Interval = Tuple[float, float]
+
+# freebusy.query accepts at most 50 calendars per request
+FREEBUSY_MAX_ITEMS = 50
+# Above this many intervals the NumPy sweep beats sorting tuples in Python
+VECTORIZE_THRESHOLD = 2000
+
+WORKDAY_START = time(9, 0)
+WORKDAY_END = time(17, 0)
+WORKDAYS = (0, 1, 2, 3, 4)
+
+
+# ----------------------
+# Free/busy lookup
+# ----------------------
+def query_freebusy(
+    creds,
+    calendar_ids: Sequence[str],
+    start: datetime,
+    end: datetime,
+) -> Tuple[Dict[str, List[Interval]], Dict[str, List[Dict]]]:
+    """
+    Return busy intervals per calendar (or attendee email) between start and end,
+    plus the per-calendar errors Google reported (e.g. no access).
+    """
+    service = get_service("calendar", "v3", creds)
+    busy: Dict[str, List[Interval]] = {}
+    errors: Dict[str, List[Dict]] = {}
+
+    for offset in range(0, len(calendar_ids), FREEBUSY_MAX_ITEMS):
+        chunk = calendar_ids[offset:offset + FREEBUSY_MAX_ITEMS]
+        response = execute(service.freebusy().query(body={
+            "timeMin": start.isoformat(),
+            "timeMax": end.isoformat(),
+            "items": [{"id": c} for c in chunk],
+        }), creds)
+
+        for cal_id, info in response.get("calendars", {}).items():
+            if info.get("errors"):
+                errors[cal_id] = info["errors"]
+            busy[cal_id] = [
+                (datetime.fromisoformat(b["start"]).timestamp(), datetime.fromisoformat(b["end"]).timestamp())
+                for b in info.get("busy", [])
+            ]
+
+    return busy, errors
+
+
+# ----------------------
+# Interval algebra
+# ----------------------
+def _numpy():
+    """
+    NumPy if installed, imported on the first large merge rather than at
+    startup. Without it every merge uses the pure-Python sweep.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def merge_intervals(intervals: Sequence[Interval]) -> List[Interval]:
+    """Union of intervals as a sorted list of disjoint intervals."""
+    np = _numpy() if len(intervals) >= VECTORIZE_THRESHOLD else None
+    if np is not None:
+        return _merge_intervals_numpy(np, intervals)
+
+    merged: List[Interval] = []
+    for s, e in sorted(intervals):
+        if merged and s <= merged[-1][1]:
+            if e > merged[-1][1]:
+                merged[-1] = (merged[-1][0], e)
+        else:
+            merged.append((s, e))
+    return merged
+
+
+def _merge_intervals_numpy(np, intervals: Sequence[Interval]) -> List[Interval]:
+    arr = np.asarray(intervals, dtype=float)
+    arr = arr[np.argsort(arr[:, 0], kind="stable")]
+    starts, ends = arr[:, 0], arr[:, 1]
+
+    # An interval opens a new group when it starts after everything before it ended
+    reach = np.maximum.accumulate(ends)
+    opens = np.empty(len(arr), dtype=bool)
+    opens[0] = True
+    opens[1:] = starts[1:] > reach[:-1]
+
+    first = np.flatnonzero(opens)
+    last = np.append(first[1:] - 1, len(arr) - 1)
+    return list(zip(starts[first].tolist(), reach[last].tolist()))
+
+
+def subtract_intervals(windows: Sequence[Interval], busy: Sequence[Interval]) -> List[Interval]:
+    """
+    Parts of windows not covered by busy.
+    Both inputs must be sorted and disjoint (e.g. from merge_intervals).
+    """
+    free: List[Interval] = []
+    j = 0
+    for ws, we in windows:
+        current = ws
+        while j < len(busy) and busy[j][1] <= current:
+            j += 1
+
+        k = j
+        while k < len(busy) and busy[k][0] < we:
+            bs, be = busy[k]
+            if bs > current:
+                free.append((current, bs))
+            current = max(current, be)
+            k += 1
+
+        if current < we:
+            free.append((current, we))
+    return free
+
+
+def working_windows(
+    start: datetime,
+    end: datetime,
+    day_start: time = WORKDAY_START,
+    day_end: time = WORKDAY_END,
+    workdays: Sequence[int] = WORKDAYS,
+    tzinfo=None,
+) -> List[Interval]:
+    """Working-hours windows for each working day in [start, end), clipped to the range."""
+    tzinfo = tzinfo or local_tz()
+    lo, hi = start.timestamp(), end.timestamp()
+
+    windows: List[Interval] = []
+    day = start.astimezone(tzinfo).date()
+    last_day = end.astimezone(tzinfo).date()
+    while day <= last_day:
+        if day.weekday() in workdays:
+            ws = datetime.combine(day, day_start, tzinfo).timestamp()
+            we = datetime.combine(day, day_end, tzinfo).timestamp()
+            ws, we = max(ws, lo), min(we, hi)
+            if ws < we:
+                windows.append((ws, we))
+        day += timedelta(days=1)
+    return windows
+
+
+# ----------------------
+# Common availability
+# ----------------------
+def find_common_slots(
+    creds,
+    attendees: Sequence[str],
+    start: datetime,
+    end: datetime,
+    min_duration_minutes: int = 30,
+    working_hours: bool = True,
+    include_self: bool = True,
+    tzinfo=None,
+) -> Tuple[List[Tuple[datetime, datetime]], Dict[str, List[Dict]]]:
+    """
+    Slots of at least min_duration_minutes when every attendee is free.
+    Returns the slots and any calendars whose availability could not be read.
+    """
+    tzinfo = tzinfo or local_tz()
+    calendars = (["primary"] if include_self else []) + [a for a in attendees if a != "primary"]
+
+    busy, errors = query_freebusy(creds, calendars, start, end)
+    all_busy = merge_intervals([iv for intervals in busy.values() for iv in intervals])
+
+    if working_hours:
+        windows = working_windows(start, end, tzinfo=tzinfo)
+    else:
+        windows = [(start.timestamp(), end.timestamp())]
+
+    min_seconds = min_duration_minutes * 60
+    return [
+        (datetime.fromtimestamp(s, tzinfo), datetime.fromtimestamp(e, tzinfo))
+        for s, e in subtract_intervals(windows, all_busy)
+        if e - s >= min_seconds
+    ], errors
@@ -1,40 +1,172 @@
-from googleapiclient.discovery import build
-from typing import List, Dict, Optional
+import base64
+import time
+from email.mime.text import MIMEText
+from typing import Iterable, Iterator, List, Dict, Optional
+
+from googleapiclient.errors import HttpError
+
+from bulk import PENDING, idempotency_key, idempotency_store, run_batched
+from cache import inbox_cache
+from paging import chunked, iter_items
+from scheduler import MAX_RETRIES, backoff_delay, classify_google_error, execute, scheduler
+from service_pool import credential_key, get_service
+from state import bump_epoch, data_epoch
+
+# Headers the unread-email tools actually read.
+METADATA_HEADERS = ["From", "Subject", "Date"]
+
+# Gmail accepts at most 100 calls per batch request.
+BATCH_LIMIT = 100
+
+# Largest page messages.list returns
+MESSAGES_PAGE_SIZE = 500
+# Field mask for listings that only need message ids
+ID_FIELDS = "nextPageToken,messages(id,threadId)"
 
 # ----------------------
 # Gmail service
 # ----------------------
 def get_gmail_service(creds):
-    """Return Gmail service object from credentials."""
-    return build("gmail", "v1", credentials=creds)
+    """Return a pooled Gmail service object for the credentials."""
+    return get_service("gmail", "v1", creds)
 
 # ----------------------
 # Read emails
 # ----------------------
 def list_messages(creds, query: Optional[str] = None, max_results: int = 50) -> List[Dict]:
-    """List message IDs matching a query."""
-    service = get_gmail_service(creds)
-    response = service.users().messages().list(userId="me", q=query, maxResults=max_results).execute()
-    return response.get("messages", [])
+    """List message IDs matching a query, served from the read cache when fresh."""
+    cred = credential_key(creds)
+    key = (cred, query, max_results, data_epoch(cred))
+    return list(inbox_cache.get_or_load(
+        key, lambda: list(iter_messages(creds, query, limit=max_results))
+    ))
+
+def iter_messages(
+    creds,
+    query: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = ID_FIELDS,
+) -> Iterator[Dict]:
+    """
+    Stream {"id", "threadId"} entries matching a query, newest first,
+    following every page up to limit. Pages are sized to the limit so a
+    small listing costs one request.
+    """
+    page_size = min(limit, MESSAGES_PAGE_SIZE) if limit else MESSAGES_PAGE_SIZE
+
+    def fetch(page_token: Optional[str]) -> Dict:
+        service = get_gmail_service(creds)
+        return execute(service.users().messages().list(
+            userId="me",
+            q=query,
+            maxResults=page_size,
+            pageToken=page_token,
+            fields=fields,
+        ), creds)
+
+    return iter_items(fetch, "messages", limit=limit)
+
+def invalidate_messages(creds) -> int:
+    """Evict every cached message listing for a credential."""
+    # gmail_sync builds on this module, so it's imported here rather than at the top
+    from gmail_sync import gmail_sync_engine
+
+    gmail_sync_engine.mark_stale(creds)
+    cred = credential_key(creds)
+    bump_epoch(cred)
+    return inbox_cache.invalidate(lambda k: k[0] == cred)
 
 def get_message(creds, msg_id: str) -> Dict:
     """Retrieve full message by ID."""
     service = get_gmail_service(creds)
-    message = service.users().messages().get(userId="me", id=msg_id, format="full").execute()
+    message = execute(service.users().messages().get(userId="me", id=msg_id, format="full"), creds)
     return message
 
+def batch_get_metadata(
+    creds,
+    msg_ids: List[str],
+    headers: Optional[List[str]] = None,
+) -> List[Dict]:
+    """
+    Retrieve header metadata for many messages in a single HTTP batch request.
+    Results are returned in the same order as msg_ids; a message that failed
+    to load is returned as {"id": ..., "error": ...}. Items rejected with a
+    rate limit or 5xx inside an otherwise successful batch are sent again
+    in a smaller batch, with backoff, up to MAX_RETRIES times.
+    """
+    if not msg_ids:
+        return []
+
+    service = get_gmail_service(creds)
+    headers = headers or METADATA_HEADERS
+    results: List[Optional[Dict]] = [None] * len(msg_ids)
+    # Index -> (throttled, Retry-After) of items worth another attempt
+    retry: Dict[int, tuple] = {}
+
+    def on_response(request_id, response, exception):
+        i = int(request_id)
+        if exception is not None:
+            results[i] = {"id": msg_ids[i], "error": str(exception)}
+            retryable, throttled, retry_after = classify_google_error(exception)
+            if retryable:
+                retry[i] = (throttled, retry_after)
+        else:
+            results[i] = response
+
+    for offset in range(0, len(msg_ids), BATCH_LIMIT):
+        pending = list(range(offset, min(offset + BATCH_LIMIT, len(msg_ids))))
+        for attempt in range(MAX_RETRIES + 1):
+            retry.clear()
+            batch = service.new_batch_http_request(callback=on_response)
+            for i in pending:
+                request = service.users().messages().get(
+                    userId="me",
+                    id=msg_ids[i],
+                    format="metadata",
+                    metadataHeaders=headers,
+                )
+                batch.add(request, request_id=str(i))
+            # A batch costs the quota of the calls inside it
+            execute(batch, creds, upstream="gmail", units=5 * len(pending))
+
+            if not retry or attempt == MAX_RETRIES:
+                break
+            pending = sorted(retry)
+            throttled = any(t for t, _ in retry.values())
+            retry_after = max((r for _, r in retry.values() if r is not None), default=None)
+            scheduler.record_retry("gmail", throttled)
+            time.sleep(backoff_delay(attempt, retry_after))
+
+    return results
+
+def iter_metadata(
+    creds,
+    msg_ids: Iterable[str],
+    headers: Optional[List[str]] = None,
+) -> Iterator[Dict]:
+    """
+    Stream header metadata for an iterable of message IDs, one batch request
+    per BATCH_LIMIT ids, so only one batch is held in memory at a time.
+    """
+    for chunk in chunked(msg_ids, BATCH_LIMIT):
+        yield from batch_get_metadata(creds, chunk, headers)
+
+def message_headers(message: Dict) -> Dict[str, str]:
+    """Return a name -> value dict of a message's headers."""
+    return {h["name"]: h["value"] for h in message.get("payload", {}).get("headers", [])}
+
 def get_unread_from_sender(creds, sender_email: str, max_results: int = 10) -> List[Dict]:
-    """Get unread emails from a specific sender."""
+    """Get header metadata of unread emails from a specific sender."""
     query = f"from:{sender_email} is:unread"
     messages = list_messages(creds, query=query, max_results=max_results)
-    return [get_message(creds, m["id"]) for m in messages]
+    return list(iter_metadata(creds, (m["id"] for m in messages)))
 
 def has_responded(creds, thread_id: str) -> bool:
     """
     Check if a thread has any messages from others (i.e., a reply exists).
     """
     service = get_gmail_service(creds)
-    thread = service.users().threads().get(userId="me", id=thread_id).execute()
+    thread = execute(service.users().threads().get(userId="me", id=thread_id), creds)
     messages = thread.get("messages", [])
     for m in messages:
         headers = {h["name"]: h["value"] for h in m["payload"]["headers"]}
@@ -50,15 +182,62 @@ def send_email(creds, to: str, subject: str, body: str):
     Send an email using Gmail API.
     Requires 'https://www.googleapis.com/auth/gmail.send' scope.
     """
-    import base64
-    from email.mime.text import MIMEText
-
     service = get_gmail_service(creds)
+    raw = encode_message(to, subject, body)
+    sent = execute(service.users().messages().send(userId="me", body={"raw": raw}), creds, idempotent=False)
+    invalidate_messages(creds)
+    return sent.get("id")
 
+def encode_message(to: str, subject: str, body: str) -> str:
+    """A plain-text message as the base64url "raw" field messages.send expects."""
     message = MIMEText(body)
     message["to"] = to
     message["subject"] = subject
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
 
-    raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-    sent = service.users().messages().send(userId="me", body={"raw": raw}).execute()
-    return sent.get("id")
+def send_emails(creds, emails: List[Dict]) -> List[Dict]:
+    """
+    Send many emails through Gmail HTTP batch requests. Each email has to,
+    subject, body and an optional idempotency_key. Returns one result per
+    email, in order.
+
+    A key that already sent returns its first result. Gmail has no
+    server-side dedupe, so a send that failed in a way that may still have
+    been delivered (timeout, 5xx) is recorded as "unconfirmed" and never
+    retried under the same key.
+    """
+    results: List[Optional[Dict]] = [None] * len(emails)
+    keys: Dict[int, str] = {}
+    calls = []
+
+    for i, e in enumerate(emails):
+        content = {"to": e["to"], "subject": e["subject"], "body": e["body"]}
+        key = idempotency_key(creds, "gmail.send", content, e.get("idempotency_key"))
+        prior = idempotency_store.begin(key)
+        if prior is not None:
+            results[i] = {"status": "in_progress"} if prior["status"] == PENDING else {**prior, "replayed": True}
+            continue
+        keys[i] = key
+        raw = encode_message(e["to"], e["subject"], e["body"])
+        calls.append((i, lambda service, raw=raw: service.users().messages().send(userId="me", body={"raw": raw})))
+
+    responses = run_batched(
+        creds, "gmail", "v1", calls,
+        units_per_call=100, idempotent=False,
+    )
+    for i, (response, error) in responses.items():
+        if error is None:
+            record = {"status": "sent", "message_id": response.get("id")}
+        elif isinstance(error, HttpError) and error.resp.status < 500:
+            # Rejected before sending, e.g. an invalid address or a rate limit
+            idempotency_store.release(keys[i])
+            results[i] = {"status": "error", "error": str(error)}
+            continue
+        else:
+            record = {"status": "unconfirmed", "error": str(error)}
+        idempotency_store.finish(keys[i], record)
+        results[i] = record
+
+    if keys:
+        invalidate_messages(creds)
+    return results
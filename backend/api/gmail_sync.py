@@ -0,0 +1,329 @@
+# gmail_sync.py
+
+import logging
+import os
+import threading
+import time
+from email.utils import parseaddr
+from typing import Callable, Dict, List, Optional, Set
+
+from googleapiclient.errors import HttpError
+
+from gmail_api import iter_messages, iter_metadata, message_headers
+from scheduler import execute
+from service_pool import credential_key, get_service
+from state import data_epoch
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Sync configuration
+# ----------------------
+GMAIL_SYNC_ENABLED = os.getenv("GMAIL_SYNC_ENABLED", "1") == "1"
+SYNC_INTERVAL_SECONDS = float(os.getenv("GMAIL_SYNC_INTERVAL_SECONDS", "30"))
+SYNC_STALE_SECONDS = float(os.getenv("GMAIL_SYNC_STALE_SECONDS", "60"))
+# Upper bound on unread messages pulled by the bootstrap
+BOOTSTRAP_MAX_MESSAGES = int(os.getenv("GMAIL_BOOTSTRAP_MAX_MESSAGES", "500"))
+STORE_IDLE_SECONDS = float(os.getenv("GMAIL_STORE_IDLE_SECONDS", "3600"))
+
+# Messages with these labels never show up in an is:unread search
+EXCLUDED_LABELS = {"SPAM", "TRASH"}
+
+
+def is_unread(label_ids) -> bool:
+    labels = set(label_ids or [])
+    return "UNREAD" in labels and not labels & EXCLUDED_LABELS
+
+
+def sender_address(from_header: Optional[str]) -> str:
+    return parseaddr(from_header or "")[1].lower()
+
+
+# ----------------------
+# Local header index
+# ----------------------
+class UnreadIndex:
+    """
+    Compact records of unread messages: id, thread id, labels and the
+    From/Subject/Date headers, with a secondary index on sender address.
+    """
+
+    def __init__(self):
+        self._records: Dict[str, Dict] = {}
+        self._by_sender: Dict[str, Set[str]] = {}
+
+    def upsert(self, message: Dict):
+        self.remove(message["id"])
+        headers = message_headers(message)
+        record = {
+            "id": message["id"],
+            "threadId": message.get("threadId"),
+            "labelIds": message.get("labelIds", []),
+            "from": headers.get("From"),
+            "subject": headers.get("Subject"),
+            "date": headers.get("Date"),
+            "internalDate": int(message.get("internalDate", 0)),
+        }
+        self._records[record["id"]] = record
+        self._by_sender.setdefault(sender_address(record["from"]), set()).add(record["id"])
+
+    def set_labels(self, msg_id: str, label_ids: List[str]):
+        record = self._records.get(msg_id)
+        if record is not None:
+            record["labelIds"] = label_ids
+
+    def remove(self, msg_id: str):
+        record = self._records.pop(msg_id, None)
+        if record is None:
+            return
+        sender = sender_address(record["from"])
+        ids = self._by_sender.get(sender)
+        if ids is not None:
+            ids.discard(msg_id)
+            if not ids:
+                del self._by_sender[sender]
+
+    def clear(self):
+        self._records.clear()
+        self._by_sender.clear()
+
+    def __contains__(self, msg_id: str):
+        return msg_id in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def newest(self, max_results: int) -> List[Dict]:
+        records = sorted(self._records.values(), key=lambda r: r["internalDate"], reverse=True)
+        return records[:max_results]
+
+    def from_sender(self, sender: str, max_results: int) -> List[Dict]:
+        """Exact address lookup when sender is an address, substring match otherwise."""
+        sender = sender.lower()
+        if "@" in sender:
+            records = [self._records[i] for i in self._by_sender.get(sender, ())]
+        else:
+            records = [r for r in self._records.values() if sender in (r["from"] or "").lower()]
+        records.sort(key=lambda r: r["internalDate"], reverse=True)
+        return records[:max_results]
+
+
+class MailboxMirror:
+    """Unread mirror of one mailbox, kept current with users.history.list."""
+
+    def __init__(self, creds):
+        self.creds = creds
+        self.index = UnreadIndex()
+        self.history_id: Optional[str] = None
+        # False when the bootstrap hit BOOTSTRAP_MAX_MESSAGES
+        self.complete = False
+        self.last_synced = 0.0
+        self.last_used = time.monotonic()
+        self.stale = True
+        # data_epoch at the last sync; a newer one means another worker wrote
+        self.epoch = 0
+        self.lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.history_id is not None
+
+    def sync(self) -> bool:
+        """Bring the mirror up to date; returns whether a mirror already in sync changed."""
+        with self.lock:
+            changed = False
+            if self.history_id is None:
+                self._bootstrap()
+            else:
+                try:
+                    changed = self._apply_history()
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    # startHistoryId is too old to replay: bootstrap again
+                    self.history_id = None
+                    self._bootstrap()
+                    changed = True
+            self.last_synced = time.monotonic()
+            self.stale = False
+            return changed
+
+    def newest(self, max_results: int) -> List[Dict]:
+        with self.lock:
+            self.last_used = time.monotonic()
+            return self.index.newest(max_results)
+
+    def from_sender(self, sender: str, max_results: int) -> List[Dict]:
+        with self.lock:
+            self.last_used = time.monotonic()
+            return self.index.from_sender(sender, max_results)
+
+    def _bootstrap(self):
+        service = get_service("gmail", "v1", self.creds)
+        # Take the history id first so nothing between it and the listing is lost
+        history_id = execute(service.users().getProfile(userId="me"), self.creds)["historyId"]
+
+        # One id past the cap tells whether the mirror holds every unread message
+        ids = [m["id"] for m in iter_messages(self.creds, "is:unread", limit=BOOTSTRAP_MAX_MESSAGES + 1)]
+
+        self.index.clear()
+        self._index_messages(ids[:BOOTSTRAP_MAX_MESSAGES])
+        self.complete = len(ids) <= BOOTSTRAP_MAX_MESSAGES
+        self.history_id = history_id
+
+    def _apply_history(self) -> bool:
+        """Apply history since history_id; returns whether the unread set changed."""
+        service = get_service("gmail", "v1", self.creds)
+
+        # Latest known labels per message, and messages deleted outright
+        labels: Dict[str, List[str]] = {}
+        deleted: Set[str] = set()
+
+        page_token = None
+        while True:
+            response = execute(service.users().history().list(
+                userId="me",
+                startHistoryId=self.history_id,
+                pageToken=page_token,
+            ), self.creds)
+
+            for record in response.get("history", []):
+                for kind in ("messagesAdded", "labelsAdded", "labelsRemoved"):
+                    for change in record.get(kind, []):
+                        message = change["message"]
+                        labels[message["id"]] = message.get("labelIds", [])
+                        deleted.discard(message["id"])
+                for change in record.get("messagesDeleted", []):
+                    deleted.add(change["message"]["id"])
+                    labels.pop(change["message"]["id"], None)
+
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+        to_fetch = []
+        changed = any(msg_id in self.index for msg_id in deleted)
+        for msg_id in deleted:
+            self.index.remove(msg_id)
+        for msg_id, label_ids in labels.items():
+            if not is_unread(label_ids):
+                changed = changed or msg_id in self.index
+                self.index.remove(msg_id)
+            elif msg_id in self.index:
+                self.index.set_labels(msg_id, label_ids)
+            else:
+                to_fetch.append(msg_id)
+
+        self._index_messages(to_fetch)
+        self.history_id = response.get("historyId", self.history_id)
+        return changed or bool(to_fetch)
+
+    def _index_messages(self, msg_ids: List[str]):
+        for message in iter_metadata(self.creds, msg_ids):
+            if "error" not in message and is_unread(message.get("labelIds")):
+                self.index.upsert(message)
+
+
+# ----------------------
+# Background sync engine
+# ----------------------
+class GmailSyncEngine:
+    """
+    Keeps a MailboxMirror per credential in sync on a background thread.
+    Queries return None until the mirror can answer, and callers fall back
+    to a Gmail search. Listeners hear about changes a sync finds upstream.
+    """
+
+    def __init__(self, interval_seconds: float = SYNC_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._mirrors: Dict = {}
+        self._listeners: List[Callable] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, creds) -> MailboxMirror:
+        key = credential_key(creds)
+        with self._lock:
+            mirror = self._mirrors.get(key)
+            if mirror is None:
+                mirror = MailboxMirror(creds)
+                self._mirrors[key] = mirror
+                self._start()
+                self._wake.set()
+            return mirror
+
+    def add_listener(self, listener: Callable):
+        """Call listener(creds) whenever a sync finds that the unread set changed."""
+        self._listeners.append(listener)
+
+    def _sync(self, mirror: MailboxMirror):
+        if mirror.sync():
+            for listener in self._listeners:
+                try:
+                    listener(mirror.creds)
+                except Exception:
+                    logger.warning("Gmail change listener failed", exc_info=True)
+
+    def mark_stale(self, creds):
+        """Force the next read to sync first, e.g. after sending mail."""
+        with self._lock:
+            mirror = self._mirrors.get(credential_key(creds))
+        if mirror is not None:
+            mirror.stale = True
+
+    def unread(self, creds, max_results: int) -> Optional[List[Dict]]:
+        mirror = self._fresh_mirror(creds)
+        if mirror is None or (not mirror.complete and max_results > len(mirror.index)):
+            return None
+        return mirror.newest(max_results)
+
+    def unread_from(self, creds, sender: str, max_results: int) -> Optional[List[Dict]]:
+        mirror = self._fresh_mirror(creds)
+        if mirror is None or not mirror.complete:
+            return None
+        return mirror.from_sender(sender, max_results)
+
+    def _fresh_mirror(self, creds) -> Optional[MailboxMirror]:
+        if not GMAIL_SYNC_ENABLED:
+            return None
+
+        mirror = self.track(creds)
+        if not mirror.ready:
+            return None
+
+        epoch = data_epoch(credential_key(creds))
+        if mirror.stale or mirror.epoch != epoch or time.monotonic() - mirror.last_synced > SYNC_STALE_SECONDS:
+            try:
+                self._sync(mirror)
+            except Exception:
+                logger.warning("Inline Gmail sync failed", exc_info=True)
+                return None
+            mirror.epoch = epoch
+        return mirror
+
+    def _start(self):
+        """Start the sync thread if it isn't running. Caller holds the lock."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="gmail-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+
+            now = time.monotonic()
+            with self._lock:
+                for key in [k for k, m in self._mirrors.items() if now - m.last_used > STORE_IDLE_SECONDS]:
+                    del self._mirrors[key]
+                mirrors = list(self._mirrors.values())
+
+            for mirror in mirrors:
+                try:
+                    self._sync(mirror)
+                except Exception:
+                    logger.warning("Gmail sync failed", exc_info=True)
+
+
+gmail_sync_engine = GmailSyncEngine()
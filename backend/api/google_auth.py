@@ -2,21 +2,21 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 import os
+import sys
 
-# defines what your app is allowed to do --> read only
-SCOPES = ["https://www.googleapis.com/auth/calendar.readonly",
-          "https://www.googleapis.com/auth/gmail.readonly",
-          "https://www.googleapis.com/auth/calendar",
-          "https://www.googleapis.com/auth/gmail.send"
-          ]
+from credentials import DEFAULT_USER, SCOPES, save_credentials, token_path
 
 
-def get_google_service():
+# Interactive bootstrap, run once per user outside the server:
+#     python google_auth.py [user_id]
+# The server only reads the token files this writes (see credentials.py).
+def get_google_service(user_id=DEFAULT_USER):
     creds = None
+    path = token_path(user_id)
 
     # load existing credentials if present
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+    if os.path.exists(path):
+        creds = Credentials.from_authorized_user_file(path, SCOPES)
 
     # check if credentials are valid
     if not creds or not creds.valid:
@@ -31,8 +31,11 @@ def get_google_service():
             )
             creds = flow.run_local_server(port=0)
 
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
+        save_credentials(creds, path)
 
     return creds
 
+
+if __name__ == "__main__":
+    get_google_service(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_USER)
+
@@ -0,0 +1,95 @@
+# paging.py
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# ----------------------
+# Paging configuration
+# ----------------------
+# Fetch page N+1 on a worker thread while the caller consumes page N
+PAGE_PREFETCH_ENABLED = os.getenv("PAGE_PREFETCH_ENABLED", "1") == "1"
+PAGE_PREFETCH_WORKERS = int(os.getenv("PAGE_PREFETCH_WORKERS", "4"))
+
+# Fetches one page given its page token (None for the first page)
+PageFetcher = Callable[[Optional[str]], Dict]
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _prefetch_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PAGE_PREFETCH_WORKERS, thread_name_prefix="page-prefetch")
+        return _executor
+
+
+def iter_pages(
+    fetch: PageFetcher,
+    prefetch: bool = PAGE_PREFETCH_ENABLED,
+    wants_next: Optional[Callable[[Dict], bool]] = None,
+) -> Iterator[Dict]:
+    """
+    Yield the pages of a Google list call, following nextPageToken lazily.
+    With prefetch, the next page is requested as soon as the current one is
+    yielded, unless wants_next(page) says the caller will stop within it.
+    A consumer that stops early leaves at most one page in flight, and a
+    queued prefetch that has not started yet is cancelled.
+
+    fetch runs on a pool thread when prefetching; pooled services are safe
+    to share there, since each thread sends through its own transport.
+    """
+    page = fetch(None)
+    pending: Optional[Future] = None
+    try:
+        while True:
+            token = page.get("nextPageToken")
+            if token and prefetch and (wants_next is None or wants_next(page)):
+                pending = _prefetch_executor().submit(fetch, token)
+            yield page
+            if not token:
+                return
+            if pending is not None:
+                page, pending = pending.result(), None
+            else:
+                page = fetch(token)
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
+def iter_items(
+    fetch: PageFetcher,
+    key: str,
+    limit: Optional[int] = None,
+    prefetch: bool = PAGE_PREFETCH_ENABLED,
+) -> Iterator[Dict]:
+    """Yield up to limit items stored under key across every page."""
+    if limit is not None and limit <= 0:
+        return
+    count = 0
+
+    def wants_next(page: Dict) -> bool:
+        return limit is None or count + len(page.get(key, [])) < limit
+
+    for page in iter_pages(fetch, prefetch, wants_next):
+        for item in page.get(key, []):
+            yield item
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """Group an iterable into lists of at most size items."""
+    chunk: List = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,194 @@
+# registry.py
+
+import inspect
+import json
+import typing
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+# Python annotation -> JSON schema type
+_JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    dict: "object",
+}
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    name: str
+    func: Callable
+    description: str
+    parameters: Dict
+    # No side effects: safe to retry, prefetch or memoize
+    read_only: bool = True
+    # Result may be memoized for a short time
+    cacheable: bool = True
+    # Overrides the agent-wide TOOL_TIMEOUT_SECONDS when set
+    timeout: Optional[float] = None
+    # May run alongside other tool calls from the same turn
+    concurrent_safe: bool = True
+    # Read tools whose results this tool makes stale
+    invalidates: FrozenSet[str] = field(default_factory=frozenset)
+    # Renders the result as text for the deterministic fast path
+    formatter: Optional[Callable] = None
+    # Compacts the result to what the model needs before it enters history
+    projector: Optional[Callable] = None
+
+    def schema(self) -> Dict:
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters,
+            },
+        }
+
+
+def _json_type(annotation) -> Dict:
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    # Optional[X] -> X
+    if origin is typing.Union:
+        non_null = [a for a in args if a is not type(None)]
+        if len(non_null) == 1:
+            return _json_type(non_null[0])
+
+    if origin in (list, List):
+        item = _json_type(args[0]) if args else {}
+        return {"type": "array", "items": item}
+
+    if annotation in _JSON_TYPES:
+        return {"type": _JSON_TYPES[annotation]}
+
+    # TypedDict -> object with its fields
+    if typing.is_typeddict(annotation):
+        hints = typing.get_type_hints(annotation)
+        schema = {
+            "type": "object",
+            "properties": {name: _json_type(hint) for name, hint in hints.items()},
+        }
+        required = [name for name in hints if name in annotation.__required_keys__]
+        if required:
+            schema["required"] = required
+        return schema
+
+    return {}
+
+
+def parameters_schema(func: Callable, descriptions: Optional[Dict[str, str]] = None) -> Dict:
+    """JSON schema for a tool's arguments; the leading creds parameter is skipped."""
+    descriptions = descriptions or {}
+    hints = typing.get_type_hints(func)
+    params = list(inspect.signature(func).parameters.values())[1:]
+
+    properties = {}
+    required = []
+    for p in params:
+        prop = _json_type(hints.get(p.name, str))
+        if p.name in descriptions:
+            prop["description"] = descriptions[p.name]
+        properties[p.name] = prop
+        if p.default is inspect.Parameter.empty:
+            required.append(p.name)
+
+    schema = {"type": "object", "properties": properties}
+    if required:
+        schema["required"] = required
+    return schema
+
+
+class ToolRegistry:
+    """
+    Tools by name, with their OpenAI schemas and scheduling metadata.
+    Schemas are built once, on first use after all tools are registered.
+    """
+
+    def __init__(self):
+        self._tools: Dict[str, ToolSpec] = {}
+        self._schemas: Optional[List[Dict]] = None
+        self._schemas_json: Optional[str] = None
+
+    def tool(
+        self,
+        name: str,
+        description: Optional[str] = None,
+        params: Optional[Dict[str, str]] = None,
+        read_only: bool = True,
+        cacheable: Optional[bool] = None,
+        timeout: Optional[float] = None,
+        concurrent_safe: Optional[bool] = None,
+        invalidates: Optional[List[str]] = None,
+    ):
+        """
+        Register a tool function taking creds as its first argument.
+        cacheable and concurrent_safe default to read_only.
+        """
+        def decorator(func):
+            doc = (inspect.getdoc(func) or "").strip().splitlines()
+            self._tools[name] = ToolSpec(
+                name=name,
+                func=func,
+                description=description or (doc[0] if doc else name),
+                parameters=parameters_schema(func, params),
+                read_only=read_only,
+                cacheable=read_only if cacheable is None else cacheable,
+                timeout=timeout,
+                concurrent_safe=read_only if concurrent_safe is None else concurrent_safe,
+                invalidates=frozenset(invalidates or ()),
+            )
+            self._schemas = None
+            self._schemas_json = None
+            return func
+        return decorator
+
+    def formatter(self, *names: str):
+        """Register a function that formats the named tools' results as text."""
+        def decorator(func):
+            for name in names:
+                self._tools[name] = replace(self._tools[name], formatter=func)
+            return func
+        return decorator
+
+    def projector(self, *names: str):
+        """Register a function that projects the named tools' results for the model."""
+        def decorator(func):
+            for name in names:
+                self._tools[name] = replace(self._tools[name], projector=func)
+            return func
+        return decorator
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._tools.get(name)
+
+    def __contains__(self, name: str):
+        return name in self._tools
+
+    def names(self) -> List[str]:
+        return list(self._tools)
+
+    def dispatch(self, name: str, creds, args: Dict[str, Any]):
+        spec = self._tools.get(name)
+        if spec is None:
+            return {"error": "Unknown tool"}
+        return spec.func(creds, **args)
+
+    def schemas(self) -> List[Dict]:
+        if self._schemas is None:
+            self._schemas = [spec.schema() for spec in self._tools.values()]
+        return self._schemas
+
+    def schemas_json(self) -> str:
+        if self._schemas_json is None:
+            self._schemas_json = json.dumps(self.schemas(), sort_keys=True)
+        return self._schemas_json
+
+
+registry = ToolRegistry()
+tool = registry.tool
+formatter = registry.formatter
+projector = registry.projector
@@ -0,0 +1,368 @@
+# scheduler.py
+
+import asyncio
+import copy
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from service_pool import credential_key
+from telemetry import span
+
+logger = logging.getLogger(__name__)
+
+# ----------------------
+# Scheduler configuration
+# ----------------------
+MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOUND_BACKOFF_BASE_SECONDS", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOUND_BACKOFF_MAX_SECONDS", "30"))
+# How often per-user buckets that have refilled completely are dropped
+BUCKET_SWEEP_SECONDS = 60.0
+
+# upstream -> (units per second, burst) for the whole process and for each user.
+# Gmail limits are in quota units (250/user/second); Calendar counts requests;
+# OpenAI counts estimated tokens per second.
+LIMITS: Dict[str, Dict[str, Tuple[float, float]]] = {
+    "gmail": {
+        "global": (float(os.getenv("GMAIL_UNITS_PER_SECOND", "2000")), 4000),
+        "user": (float(os.getenv("GMAIL_USER_UNITS_PER_SECOND", "250")), 250),
+    },
+    "calendar": {
+        "global": (float(os.getenv("CALENDAR_REQUESTS_PER_SECOND", "50")), 100),
+        "user": (float(os.getenv("CALENDAR_USER_REQUESTS_PER_SECOND", "10")), 20),
+    },
+    "openai": {
+        "global": (float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "200000")) / 60, 20000),
+    },
+}
+
+# Worker processes serving the app (uvicorn --workers / gunicorn read the same
+# variable). Buckets live in each process, so each takes an equal share.
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+if WORKERS > 1:
+    LIMITS = {
+        upstream: {scope: (rate / WORKERS, burst / WORKERS) for scope, (rate, burst) in scopes.items()}
+        for upstream, scopes in LIMITS.items()
+    }
+
+# Gmail quota units per method; unlisted Gmail methods cost 5
+GMAIL_QUOTA_UNITS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.history.list": 2,
+    "gmail.users.messages.list": 5,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.send": 100,
+    "gmail.users.threads.get": 10,
+    "gmail.users.labels.list": 1,
+}
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+
+
+class TokenBucket:
+    """
+    Reservation-based token bucket. reserve() takes the units immediately,
+    letting the balance go negative, and returns how long the caller must
+    wait before its turn, so waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, units: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A request larger than the burst still goes through, just late
+            self._tokens -= min(units, self.burst)
+            return max(0.0, -self._tokens / self.rate)
+
+    def full(self, now: float) -> bool:
+        """Whether the bucket has refilled to its burst, so a new one would behave the same."""
+        with self._lock:
+            return self._tokens + (now - self._updated) * self.rate >= self.burst
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds; the header may be delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# (retryable, throttled, Retry-After seconds)
+ErrorClass = Tuple[bool, bool, Optional[float]]
+
+
+def classify_google_error(error: Exception) -> ErrorClass:
+    """Whether a Google client error is worth retrying, whether it was a rate limit, and its Retry-After."""
+    if not isinstance(error, HttpError):
+        # Transport errors (resets, timeouts) are transient
+        return isinstance(error, (ConnectionError, TimeoutError, OSError)), False, None
+
+    status = error.resp.status
+    throttled = status == 429
+    # Gmail and Calendar report per-user rate limits as 403
+    if status == 403:
+        reasons = {d.get("reason") for d in (error.error_details or []) if isinstance(d, dict)}
+        throttled = bool(reasons & RATE_LIMIT_REASONS) or "rate limit" in str(error).lower()
+    retryable = throttled or status in RETRYABLE_STATUS
+    return retryable, throttled, parse_retry_after(error.resp.get("retry-after"))
+
+
+def classify_unsafe_google_error(error: Exception) -> ErrorClass:
+    """
+    Like classify_google_error, for writes that must not run twice (e.g.
+    sends): only rate-limit rejections are retried, since Google refuses
+    those before doing any work. Timeouts and 5xx may have been applied.
+    """
+    retryable, throttled, retry_after = classify_google_error(error)
+    return retryable and throttled, throttled, retry_after
+
+
+class _UpstreamStats:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    def snapshot(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "queue_delay_avg_ms": round(self.queue_delay_total * 1000 / self.requests, 2) if self.requests else 0.0,
+            "queue_delay_max_ms": round(self.queue_delay_max * 1000, 2),
+        }
+
+
+class OutboundScheduler:
+    """
+    Shared gate for calls to Google and OpenAI: token buckets per upstream
+    and per user, retries with jittered backoff that honour Retry-After, and
+    coalescing of identical reads that are already in flight.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, Tuple[float, float]]] = LIMITS):
+        self.limits = limits
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+        self._inflight: Dict[Hashable, Future] = {}
+        self._stats: Dict[str, _UpstreamStats] = {}
+        self._lock = threading.Lock()
+        self._swept = time.monotonic()
+
+    def _bucket(self, upstream: str, scope: str, key: Hashable) -> Optional[TokenBucket]:
+        limit = self.limits.get(upstream, {}).get(scope)
+        if limit is None:
+            return None
+        with self._lock:
+            self._sweep()
+            bucket = self._buckets.get((upstream, scope, key))
+            if bucket is None:
+                bucket = self._buckets[(upstream, scope, key)] = TokenBucket(*limit)
+            return bucket
+
+    def _sweep(self):
+        """Drop per-user buckets that are full again. Caller holds the lock."""
+        now = time.monotonic()
+        if now - self._swept < BUCKET_SWEEP_SECONDS:
+            return
+        self._swept = now
+        for key in [k for k, b in self._buckets.items() if k[1] == "user" and b.full(now)]:
+            del self._buckets[key]
+
+    def _stat(self, upstream: str) -> _UpstreamStats:
+        with self._lock:
+            return self._stats.setdefault(upstream, _UpstreamStats())
+
+    def reserve(self, upstream: str, units: float = 1, user: Hashable = None) -> float:
+        """Take units from the upstream's buckets; returns the time to wait first."""
+        delay = 0.0
+        for scope, key in (("global", None), ("user", user)):
+            bucket = self._bucket(upstream, scope, key)
+            if bucket is not None:
+                delay = max(delay, bucket.reserve(units))
+
+        stat = self._stat(upstream)
+        with self._lock:
+            stat.requests += 1
+            stat.queue_delay_total += delay
+            stat.queue_delay_max = max(stat.queue_delay_max, delay)
+        return delay
+
+    def record_retry(self, upstream: str, throttled: bool):
+        stat = self._stat(upstream)
+        with self._lock:
+            stat.retries += 1
+            stat.throttled += throttled
+
+    def record_failure(self, upstream: str):
+        stat = self._stat(upstream)
+        with self._lock:
+            stat.failures += 1
+
+    # ----------------------
+    # Blocking calls (Google client, worker threads)
+    # ----------------------
+    def call(
+        self,
+        upstream: str,
+        fn: Callable[[], Any],
+        units: float = 1,
+        user: Hashable = None,
+        classify: Callable[[Exception], ErrorClass] = None,
+    ):
+        """
+        Run fn() under the upstream's rate limits. Failures that classify()
+        marks retryable are retried with backoff.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            time.sleep(self.reserve(upstream, units, user))
+            try:
+                return fn()
+            except Exception as e:
+                retryable, throttled, wait = classify(e) if classify else (False, False, None)
+                if not retryable or attempt == MAX_RETRIES:
+                    self.record_failure(upstream)
+                    raise
+                self.record_retry(upstream, throttled)
+                delay = backoff_delay(attempt, wait)
+                logger.info("Retrying %s call in %.2fs after: %s", upstream, delay, e)
+                time.sleep(delay)
+
+    def coalesced(self, key: Hashable, upstream: str, fn: Callable[[], Any]):
+        """
+        Run fn() once for every caller asking with the same key at the same
+        time; the others wait and receive copies of the leader's result.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._stats.setdefault(upstream, _UpstreamStats()).coalesced += 1
+
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    # ----------------------
+    # Async calls (OpenAI)
+    # ----------------------
+    async def acall(
+        self,
+        upstream: str,
+        fn: Callable[[], Any],
+        units: float = 1,
+        user: Hashable = None,
+        classify: Callable[[Exception], ErrorClass] = None,
+    ):
+        """Async form of call(): fn returns an awaitable and waits don't block the loop."""
+        for attempt in range(MAX_RETRIES + 1):
+            delay = self.reserve(upstream, units, user)
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                return await fn()
+            except Exception as e:
+                retryable, throttled, wait = classify(e) if classify else (False, False, None)
+                if not retryable or attempt == MAX_RETRIES:
+                    self.record_failure(upstream)
+                    raise
+                self.record_retry(upstream, throttled)
+                delay = backoff_delay(attempt, wait)
+                logger.info("Retrying %s call in %.2fs after: %s", upstream, delay, e)
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: s.snapshot() for name, s in self._stats.items()}
+
+
+scheduler = OutboundScheduler()
+
+
+# ----------------------
+# Google requests
+# ----------------------
+def request_units(request) -> Tuple[str, float]:
+    """The upstream and quota cost of a googleapiclient HttpRequest."""
+    method_id = getattr(request, "methodId", "") or ""
+    upstream = method_id.split(".", 1)[0] or "google"
+    if upstream == "gmail":
+        return upstream, GMAIL_QUOTA_UNITS.get(method_id, 5)
+    return upstream, 1
+
+
+def execute(
+    request,
+    creds,
+    upstream: Optional[str] = None,
+    units: Optional[float] = None,
+    idempotent: bool = True,
+):
+    """
+    Execute a Google API request through the scheduler. GETs with the same
+    URI for the same user share one in-flight call. Batch requests carry no
+    method id, so callers pass their upstream and summed quota cost.
+    Non-idempotent writes are only retried after a rate-limit rejection.
+    """
+    default_upstream, default_units = request_units(request)
+    upstream = upstream or default_upstream
+    units = default_units if units is None else units
+    user = credential_key(creds)
+    classify = classify_google_error if idempotent else classify_unsafe_google_error
+
+    def run():
+        return scheduler.call(upstream, request.execute, units, user, classify)
+
+    with span("google_request", getattr(request, "methodId", None) or f"{upstream}.batch"):
+        if getattr(request, "method", None) == "GET":
+            return scheduler.coalesced((user, request.uri), upstream, run)
+        return run()
@@ -0,0 +1,239 @@
+# service_pool.py
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+# ----------------------
+# Pool configuration
+# ----------------------
+IDLE_TTL_SECONDS = 600
+MAX_ENTRIES = 256
+
+# The APIs the backend calls, pre-warmed at startup
+APIS = (("calendar", "v3"), ("gmail", "v1"))
+
+# When set, new services send requests through factory() instead of an
+# authorized transport; the benchmark suite points this at an offline fake
+_http_factory: Optional[Callable[[], Any]] = None
+
+
+@dataclass
+class _Entry:
+    service: Any
+    token: Optional[str]
+    last_used: float
+
+
+def credential_key(creds) -> Hashable:
+    """
+    Return a stable identity for a credential object.
+    The refresh token survives access-token refreshes, so it identifies the user.
+    """
+    if creds is None:
+        return "anonymous"
+    refresh_token = getattr(creds, "refresh_token", None)
+    if refresh_token:
+        return (getattr(creds, "client_id", None), refresh_token)
+    return id(creds)
+
+
+# (api, version) -> discovery document text, read once from googleapiclient's bundle
+_documents: Dict[Tuple[str, str], str] = {}
+
+
+def discovery_document(api: str, version: str) -> str:
+    """
+    The discovery document bundled with googleapiclient, so no build ever
+    fetches one over the network. googleapiclient is imported here on first
+    use rather than when the backend is imported. The text is cached, not
+    the parsed document: building a service mutates the parsed copy.
+    """
+    doc = _documents.get((api, version))
+    if doc is None:
+        from googleapiclient.discovery_cache import get_static_doc
+
+        doc = get_static_doc(api, version)
+        if doc is None:
+            raise ValueError(f"No bundled discovery document for {api} {version}")
+        _documents[(api, version)] = doc
+    return doc
+
+
+class _ThreadLocalHttp:
+    """
+    An httplib2-compatible transport that gives each thread its own
+    underlying Http. httplib2 is not thread-safe, so this is what lets one
+    service object be shared by every worker thread; each thread's
+    connection stays alive for as long as the service does.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = self._factory()
+        return http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    def close(self):
+        http = getattr(self._local, "http", None)
+        if http is not None:
+            http.close()
+
+    def __getattr__(self, name):
+        # e.g. .credentials, which the client reads to authorize batches
+        return getattr(self._http(), name)
+
+
+def _authorized_http(creds):
+    import google_auth_httplib2
+    from googleapiclient.http import build_http
+
+    return google_auth_httplib2.AuthorizedHttp(creds, http=build_http())
+
+
+def _build_service(api: str, version: str, creds):
+    """Build a service from the bundled discovery document, with a per-thread transport."""
+    from googleapiclient.discovery import build_from_document
+
+    doc = discovery_document(api, version)
+    if _http_factory is not None:
+        factory = _http_factory
+    else:
+        factory = lambda: _authorized_http(creds)  # noqa: E731
+    return build_from_document(doc, http=_ThreadLocalHttp(factory))
+
+
+def warm(apis: Iterable[Tuple[str, str]] = APIS):
+    """
+    Load the Google client library and each API's discovery document, and
+    build one throwaway service per API so the first request pays for none of it.
+    """
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+
+    for api, version in apis:
+        build_from_document(discovery_document(api, version), http=httplib2.Http())
+
+
+# ----------------------
+# Service registry
+# ----------------------
+class ServicePool:
+    """
+    Registry of built Google API service objects, one per
+    (api, version, credential), shared by every thread. Each thread sends
+    through its own transport (see _ThreadLocalHttp).
+    """
+
+    def __init__(self, idle_ttl_seconds: float = IDLE_TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, api: str, version: str, creds):
+        """Return a pooled service, building it on first use."""
+        key = (api, version, credential_key(creds))
+        token = getattr(creds, "token", None)
+        now = time.monotonic()
+
+        with self._lock:
+            self._sweep(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry.token == token:
+                entry.last_used = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.service
+
+            # Token changed underneath us (refresh or re-auth): rebuild.
+            if entry is not None:
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+
+        # Build outside the lock so one slow build does not stall other users.
+        service = _build_service(api, version, creds)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            # Another thread built one meanwhile; everyone shares the first
+            if entry is not None and entry.token == token:
+                return entry.service
+            self._entries[key] = _Entry(service=service, token=token, last_used=now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return service
+
+    def invalidate(self, creds) -> int:
+        """Evict every service built for a credential. Returns the number evicted."""
+        cred = credential_key(creds)
+        with self._lock:
+            stale = [k for k in self._entries if k[2] == cred]
+            for k in stale:
+                del self._entries[k]
+            self.evictions += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _sweep(self, now: float):
+        """Drop entries idle for longer than the TTL. Caller holds the lock."""
+        # Entries are kept in LRU order, so the oldest are at the front.
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.last_used < self.idle_ttl_seconds:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+
+_pool = ServicePool()
+
+
+def get_service(api: str, version: str, creds):
+    """Return a pooled Google API service for the given credentials."""
+    return _pool.get(api, version, creds)
+
+
+def invalidate_credentials(creds) -> int:
+    """Evict pooled services for a credential, e.g. after a token refresh."""
+    return _pool.invalidate(creds)
+
+
+def set_http_factory(factory: Optional[Callable[[], Any]]):
+    """Route new services through factory()'s transport (None restores the default)."""
+    global _http_factory
+    _http_factory = factory
+    _pool.clear()
+
+
+def pool_stats() -> Dict[str, int]:
+    """Return hit/miss/eviction counters for the service pool."""
+    return _pool.stats()
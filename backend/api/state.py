@@ -0,0 +1,278 @@
+# state.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# ----------------------
+# State configuration
+# ----------------------
+# "memory" keeps per-user state in this process; "sqlite" and "redis" share
+# it between workers so any worker can serve any request
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "assistant:")
+# How often writes sweep expired keys out of the in-process state
+STATE_PURGE_SECONDS = 60.0
+
+
+def hashed(value: Any) -> str:
+    """A stable opaque key for a value, so secrets like refresh tokens never appear in keys."""
+    raw = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+# ----------------------
+# Backends
+# ----------------------
+class InProcessState:
+    """
+    Namespaced key-value state with optional TTLs, local to this process.
+    Values are stored as given, so callers must not mutate what they get.
+    Expired keys are dropped when read, and swept by writes at most every
+    STATE_PURGE_SECONDS so keys nobody reads again don't pile up.
+    """
+
+    shared = False
+
+    def __init__(self):
+        # (namespace, key) -> (expires_at wall time or None, value)
+        self._data: Dict[Tuple[str, str], Tuple[Optional[float], Any]] = {}
+        self._lock = threading.Lock()
+        self._purged_at = time.time()
+
+    def _purge(self, now: float):
+        """Drop expired keys if a sweep is due. Caller holds the lock."""
+        if now - self._purged_at < STATE_PURGE_SECONDS:
+            return
+        self._purged_at = now
+        for k in [k for k, (expires_at, _) in self._data.items() if expires_at is not None and expires_at <= now]:
+            del self._data[k]
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.time():
+                del self._data[(namespace, key)]
+                return None
+            return entry[1]
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            self._data[(namespace, key)] = (now + ttl if ttl else None, value)
+
+    def add(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set the key only if it is absent or expired. True if this call set it."""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            entry = self._data.get((namespace, key))
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                return False
+            self._data[(namespace, key)] = (now + ttl if ttl else None, value)
+            return True
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def incr(self, namespace: str, key: str) -> int:
+        with self._lock:
+            _, value = self._data.get((namespace, key), (None, 0))
+            self._data[(namespace, key)] = (None, value + 1)
+            return value + 1
+
+    def append(self, namespace: str, key: str, values: List, max_len: int, ttl: Optional[float] = None) -> List:
+        """Append to a list value, keeping its last max_len items; returns the new list."""
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            entry = self._data.get((namespace, key))
+            current = entry[1] if entry is not None and (entry[0] is None or entry[0] > now) else []
+            updated = (current + list(values))[-max_len:]
+            self._data[(namespace, key)] = (now + ttl if ttl else None, updated)
+            return updated
+
+
+class SQLiteState:
+    """
+    State in a SQLite file shared by every worker on the host. Values are
+    JSON; WAL mode lets readers proceed while another process writes.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ?"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(namespace, key) DO UPDATE SET"
+                " value = excluded.value, expires_at = excluded.expires_at",
+                (namespace, key, json.dumps(value), time.time() + ttl if ttl else None),
+            )
+            self._conn.commit()
+
+    def add(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(namespace, key) DO UPDATE SET"
+                " value = excluded.value, expires_at = excluded.expires_at"
+                " WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?",
+                (namespace, key, json.dumps(value), now + ttl if ttl else None, now),
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+            self._conn.commit()
+
+    def incr(self, namespace: str, key: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, '1', NULL)"
+                " ON CONFLICT(namespace, key) DO UPDATE SET value = CAST(CAST(value AS INTEGER) + 1 AS TEXT)"
+                " RETURNING value",
+                (namespace, key),
+            ).fetchone()
+            self._conn.commit()
+        return int(row[0])
+
+    def append(self, namespace: str, key: str, values: List, max_len: int, ttl: Optional[float] = None) -> List:
+        now = time.time()
+        with self._lock:
+            # Take the write lock before reading, so another process can't append in between
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM state WHERE namespace = ? AND key = ?"
+                    " AND (expires_at IS NULL OR expires_at > ?)",
+                    (namespace, key, now),
+                ).fetchone()
+                updated = ((json.loads(row[0]) if row else []) + list(values))[-max_len:]
+                self._conn.execute(
+                    "INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(namespace, key) DO UPDATE SET"
+                    " value = excluded.value, expires_at = excluded.expires_at",
+                    (namespace, key, json.dumps(updated), now + ttl if ttl else None),
+                )
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+        return updated
+
+
+class RedisState:
+    """State in Redis (or any server speaking its protocol), shared across hosts."""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = STATE_KEY_PREFIX):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self._prefix}{namespace}:{key}"
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        raw = self._redis.get(self._key(namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        self._redis.set(self._key(namespace, key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def add(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return bool(self._redis.set(
+            self._key(namespace, key), json.dumps(value), nx=True, px=int(ttl * 1000) if ttl else None
+        ))
+
+    def delete(self, namespace: str, key: str):
+        self._redis.delete(self._key(namespace, key))
+
+    def incr(self, namespace: str, key: str) -> int:
+        return int(self._redis.incr(self._key(namespace, key)))
+
+    def append(self, namespace: str, key: str, values: List, max_len: int, ttl: Optional[float] = None) -> List:
+        name = self._key(namespace, key)
+
+        def update(pipe):
+            # WATCH/MULTI: redis-py runs this again if another client wrote the key meanwhile
+            raw = pipe.get(name)
+            updated = ((json.loads(raw) if raw is not None else []) + list(values))[-max_len:]
+            pipe.multi()
+            pipe.set(name, json.dumps(updated), px=int(ttl * 1000) if ttl else None)
+            return updated
+
+        return self._redis.transaction(update, name, value_from_callable=True)
+
+
+def create_state():
+    if STATE_BACKEND == "sqlite":
+        return SQLiteState(STATE_DB_PATH)
+    if STATE_BACKEND == "redis":
+        return RedisState(STATE_REDIS_URL)
+    return InProcessState()
+
+
+state = create_state()
+
+
+# ----------------------
+# Data epochs
+# ----------------------
+def data_epoch(cred) -> int:
+    """
+    Counter bumped whenever this process or another worker writes to the
+    user's calendar or mailbox. Per-process caches and mirrors include it
+    in their keys so a write anywhere invalidates them everywhere. Always 0
+    when state isn't shared, since local invalidation already covers it.
+    """
+    if not state.shared:
+        return 0
+    return state.get("epoch", hashed(cred)) or 0
+
+
+def bump_epoch(cred):
+    if state.shared:
+        state.incr("epoch", hashed(cred))
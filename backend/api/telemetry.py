@@ -0,0 +1,216 @@
+# telemetry.py
+
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Spans are also sent to OpenTelemetry when enabled and the API is installed;
+# exporters are configured the usual way (opentelemetry-sdk / opentelemetry-instrument)
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+_tracer = None
+if OTEL_ENABLED:
+    try:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("ai-personal-assistant")
+    except ImportError:
+        _tracer = None
+
+# (labels, value) samples reported by a collector
+Samples = List[Tuple[Dict[str, str], float]]
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(n, "") for n in self.labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative:g}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-1]:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative:g}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics rendered in the Prometheus text format. Collectors
+    report values other modules already keep (cache stats, pool stats) at
+    scrape time instead of being updated on every request.
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Tuple[str, str, str, Callable[[], Samples]]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, name: str, kind: str, help: str, collect: Callable[[], Samples]):
+        """Register a callback returning (labels, value) samples for a gauge or counter."""
+        self._collectors.append((name, kind, help, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, kind, help, collect in self._collectors:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in collect():
+                lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# ----------------------
+# Pipeline metrics
+# ----------------------
+STAGE_LATENCY = metrics.histogram(
+    "assistant_stage_duration_seconds",
+    "Time spent in each pipeline stage",
+    labels=("stage", "name"),
+)
+TOKENS = metrics.histogram(
+    "assistant_llm_tokens",
+    "Tokens per completion call (prompt tokens are estimated)",
+    labels=("kind",),
+    buckets=TOKEN_BUCKETS,
+)
+REQUESTS = metrics.counter(
+    "assistant_requests_total",
+    "Chat requests by the path that served them",
+    labels=("path",),
+)
+CACHE_LOOKUPS = metrics.counter(
+    "assistant_cache_lookups_total",
+    "Cache lookups by cache and result",
+    labels=("cache", "result"),
+)
+
+
+# ----------------------
+# Spans
+# ----------------------
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("stage", "name", "attributes", "_start", "_otel")
+
+    def __init__(self, stage: str, name: str, attributes: Dict):
+        self.stage = stage
+        self.name = name
+        self.attributes = attributes
+        self._otel = None
+
+    def __enter__(self):
+        if _tracer is not None:
+            self._otel = _tracer.start_as_current_span(
+                self.stage, attributes={"name": self.name, **self.attributes}
+            )
+            self._otel.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_LATENCY.observe(time.perf_counter() - self._start, stage=self.stage, name=self.name)
+        if self._otel is not None:
+            self._otel.__exit__(*exc)
+        return False
+
+
+def span(stage: str, name: str = "", **attributes):
+    """
+    Time a block as one pipeline stage (e.g. span("tool", "get_free_slots")).
+    Records into the stage latency histogram and, when enabled, an
+    OpenTelemetry span. A shared no-op when metrics and tracing are off.
+    """
+    if not METRICS_ENABLED and _tracer is None:
+        return _NOOP
+    return _Span(stage, name, attributes)
+
+
+def stats_samples(stats: Dict[str, Dict], field: str, label: str) -> Samples:
+    """Samples of one numeric field from a {name: {field: value}} stats dict."""
+    return [({label: name}, s[field]) for name, s in stats.items() if isinstance(s, dict) and field in s]
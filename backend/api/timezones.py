@@ -0,0 +1,14 @@
+# timezones.py
+
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def local_tz():
+    """
+    The machine's local time zone, DST-aware. dateutil is imported on first
+    use (or by the startup warm-up) rather than with the server.
+    """
+    from dateutil import tz
+
+    return tz.tzlocal()
@@ -1,31 +1,65 @@
 # tools.py
 
-from datetime import datetime, timedelta
-from dateutil import tz
-from typing import List, Dict, Optional
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Optional, TypedDict
 
-from backend.calendar_api import (
+from bulk import BULK_MAX_ITEMS
+from calendar_api import (
     get_tomorrow_events,
     get_free_slots as api_get_free_slots,
     schedule_meeting as api_schedule_meeting,
+    schedule_meetings as api_schedule_meetings,
     local_now,
     start_of_day,
 )
 
-from backend.gmail_api import (
+from gmail_api import (
     list_messages,
-    get_message,
+    iter_metadata,
+    message_headers,
     get_unread_from_sender as api_get_unread_from_sender,
     send_email as api_send_email,
+    send_emails as api_send_emails,
 )
 
+from gmail_sync import gmail_sync_engine
+from freebusy import find_common_slots
+from registry import registry, tool, formatter, projector
+from timezones import local_tz
+
 # --------------------------------
 # Helpers
 # --------------------------------
 
+class _MeetingFields(TypedDict):
+    title: str
+    start_time: str
+    end_time: str
+
+
+class MeetingRequest(_MeetingFields, total=False):
+    attendees: List[str]
+    idempotency_key: str
+
+
+class _EmailFields(TypedDict):
+    to: str
+    subject: str
+    body: str
+
+
+class EmailRequest(_EmailFields, total=False):
+    idempotency_key: str
+
+
+# format_datetime output; projections parse it back
+DISPLAY_FORMAT = "%Y-%m-%d %I:%M %p"
+
+
 def format_datetime(dt: datetime) -> str:
     """Format datetime for human-readable output."""
-    return dt.astimezone(tz.tzlocal()).strftime("%Y-%m-%d %I:%M %p")
+    return dt.astimezone(local_tz()).strftime(DISPLAY_FORMAT)
 
 
 def parse_iso_datetime(dt_str: str) -> datetime:
@@ -40,6 +74,7 @@ def parse_iso_datetime(dt_str: str) -> datetime:
 # TOOL: Get Tomorrow Events
 # --------------------------------
 
+@tool("get_tomorrow_events", description="Get calendar events for tomorrow")
 def tool_get_tomorrow_events(creds):
     events = get_tomorrow_events(creds)
 
@@ -64,6 +99,11 @@ def tool_get_tomorrow_events(creds):
 # TOOL: Get Free Slots (Tomorrow)
 # --------------------------------
 
+@tool(
+    "get_free_slots",
+    description="Get available time slots for tomorrow",
+    params={"min_duration_minutes": "Minimum slot length in minutes"},
+)
 def tool_get_free_slots(creds, min_duration_minutes: int = 30):
     tomorrow_start = start_of_day(local_now() + timedelta(days=1))
     tomorrow_end = tomorrow_start + timedelta(days=1)
@@ -85,10 +125,62 @@ def tool_get_free_slots(creds, min_duration_minutes: int = 30):
     return formatted
 
 
+# --------------------------------
+# TOOL: Find Common Slots
+# --------------------------------
+
+@tool(
+    "find_common_slots",
+    description="Find times over the next few days when the user and all attendees are free during working hours",
+    params={
+        "attendees": "Attendee email addresses",
+        "days": "Number of days to search, starting tomorrow",
+        "duration_minutes": "Minimum slot length in minutes",
+        "max_slots": "Maximum number of slots to return",
+    },
+    timeout=30,
+)
+def tool_find_common_slots(
+    creds,
+    attendees: List[str],
+    days: int = 5,
+    duration_minutes: int = 30,
+    max_slots: int = 10,
+):
+    """
+    Find working-hours slots over the next `days` days, starting tomorrow,
+    when the user and every attendee are free.
+    """
+    search_start = start_of_day(local_now() + timedelta(days=1))
+    search_end = search_start + timedelta(days=days)
+
+    slots, errors = find_common_slots(
+        creds,
+        attendees,
+        search_start,
+        search_end,
+        min_duration_minutes=duration_minutes,
+    )
+
+    return {
+        "slots": [
+            {"start": format_datetime(s), "end": format_datetime(e)}
+            for s, e in slots[:max_slots]
+        ],
+        "unavailable_calendars": sorted(errors),
+    }
+
+
 # --------------------------------
 # TOOL: Schedule Meeting
 # --------------------------------
 
+@tool(
+    "schedule_meeting",
+    description="Schedule a new meeting",
+    read_only=False,
+    invalidates=["get_tomorrow_events", "get_free_slots", "find_common_slots"],
+)
 def tool_schedule_meeting(
     creds,
     title: str,
@@ -131,6 +223,7 @@ def tool_schedule_meeting(
 # FORMATTERS (for deterministic routing)
 # --------------------------------
 
+@formatter("get_tomorrow_events")
 def format_events(events: List[Dict]) -> str:
     if not events:
         return "You have no events tomorrow."
@@ -142,6 +235,7 @@ def format_events(events: List[Dict]) -> str:
     return response
 
 
+@formatter("get_free_slots")
 def format_slots(slots: List[Dict]) -> str:
     if not slots:
         return "No free slots available tomorrow."
@@ -157,18 +251,30 @@ def format_slots(slots: List[Dict]) -> str:
 # TOOL: List Unread Emails
 # --------------------------------
 
+@tool(
+    "list_unread_emails",
+    description="List unread emails",
+    params={"max_results": "Maximum number of unread emails"},
+)
 def tool_list_unread_emails(creds, max_results: int = 5):
+    # Answer from the local mirror when it is in sync
+    records = gmail_sync_engine.unread(creds, max_results)
+    if records is not None:
+        return [
+            {"id": r["id"], "from": r["from"], "subject": r["subject"], "date": r["date"]}
+            for r in records
+        ]
+
     messages = list_messages(creds, query="is:unread", max_results=max_results)
 
     formatted = []
 
-    for m in messages:
-        full = get_message(creds, m["id"])
+    for m in iter_metadata(creds, (msg["id"] for msg in messages)):
+        if "error" in m:
+            formatted.append({"id": m["id"], "error": m["error"]})
+            continue
 
-        headers = {
-            h["name"]: h["value"]
-            for h in full["payload"]["headers"]
-        }
+        headers = message_headers(m)
 
         formatted.append({
             "id": m["id"],
@@ -184,16 +290,29 @@ def tool_list_unread_emails(creds, max_results: int = 5):
 # TOOL: Get Unread From Sender
 # --------------------------------
 
-def tool_get_unread_from_sender(creds, sender_email: str):
-    messages = api_get_unread_from_sender(creds, sender_email)
+@tool(
+    "get_unread_from_sender",
+    description="Get unread emails from a specific sender",
+    params={"max_results": "Maximum number of emails"},
+)
+def tool_get_unread_from_sender(creds, sender_email: str, max_results: int = 10):
+    records = gmail_sync_engine.unread_from(creds, sender_email, max_results)
+    if records is not None:
+        return [
+            {"from": r["from"], "subject": r["subject"], "date": r["date"]}
+            for r in records
+        ]
+
+    messages = api_get_unread_from_sender(creds, sender_email, max_results=max_results)
 
     formatted = []
 
-    for full in messages:
-        headers = {
-            h["name"]: h["value"]
-            for h in full["payload"]["headers"]
-        }
+    for m in messages:
+        if "error" in m:
+            formatted.append({"id": m["id"], "error": m["error"]})
+            continue
+
+        headers = message_headers(m)
 
         formatted.append({
             "from": headers.get("From"),
@@ -208,6 +327,7 @@ def tool_get_unread_from_sender(creds, sender_email: str):
 # TOOL: Send Email
 # --------------------------------
 
+@tool("send_email", description="Send an email", read_only=False)
 def tool_send_email(creds, to: str, subject: str, body: str):
     try:
         msg_id = api_send_email(creds, to=to, subject=subject, body=body)
@@ -226,16 +346,217 @@ def tool_send_email(creds, to: str, subject: str, body: str):
         }
 
 
+# --------------------------------
+# TOOLS: Bulk scheduling and sending
+# --------------------------------
+
+@tool(
+    "schedule_meetings",
+    description="Schedule several meetings at once; returns one result per meeting",
+    params={"meetings": "Meetings to create; start_time and end_time are ISO strings"},
+    read_only=False,
+    timeout=60,
+    invalidates=["get_tomorrow_events", "get_free_slots", "find_common_slots"],
+)
+def tool_schedule_meetings(creds, meetings: List[MeetingRequest]):
+    """
+    Retrying the same meetings (or the same idempotency_key) never creates
+    a second event.
+    """
+    if len(meetings) > BULK_MAX_ITEMS:
+        return {"status": "error", "message": f"At most {BULK_MAX_ITEMS} meetings per call"}
+
+    results: List[Optional[Dict]] = [None] * len(meetings)
+    parsed = []
+    for i, m in enumerate(meetings):
+        try:
+            parsed.append((i, {
+                "title": m["title"],
+                "start": parse_iso_datetime(m["start_time"]),
+                "end": parse_iso_datetime(m["end_time"]),
+                "attendees": m.get("attendees"),
+                "idempotency_key": m.get("idempotency_key"),
+            }))
+        except (KeyError, TypeError, ValueError) as e:
+            results[i] = {"status": "error", "error": f"Invalid meeting: {e}"}
+
+    created = api_schedule_meetings(creds, [m for _, m in parsed])
+    for (i, m), result in zip(parsed, created):
+        results[i] = {
+            "title": m["title"],
+            "start": format_datetime(m["start"]),
+            "end": format_datetime(m["end"]),
+            **result,
+        }
+
+    return {"results": results}
+
+
+@tool(
+    "send_emails",
+    description="Send several emails at once; returns one result per email",
+    params={"emails": "Emails to send"},
+    read_only=False,
+    timeout=60,
+)
+def tool_send_emails(creds, emails: List[EmailRequest]):
+    """
+    Retrying the same emails (or the same idempotency_key) never sends twice.
+    """
+    if len(emails) > BULK_MAX_ITEMS:
+        return {"status": "error", "message": f"At most {BULK_MAX_ITEMS} emails per call"}
+
+    results: List[Optional[Dict]] = [None] * len(emails)
+    valid = []
+    for i, e in enumerate(emails):
+        if all(isinstance(e.get(k), str) for k in ("to", "subject", "body")):
+            valid.append((i, e))
+        else:
+            results[i] = {"status": "error", "error": "Invalid email: to, subject and body are required"}
+
+    sent = api_send_emails(creds, [e for _, e in valid])
+    for (i, e), result in zip(valid, sent):
+        results[i] = {"to": e["to"], "subject": e["subject"], **result}
+
+    return {"results": results}
+
+
+# --------------------------------
+# PROJECTIONS (compact payloads for the model)
+# --------------------------------
+
+def table(rows: List[Dict], columns: List[str]) -> Dict:
+    """Rows as one list of column names plus value lists, so keys aren't repeated per row."""
+    return {"columns": columns, "rows": [[row.get(c) for c in columns] for row in rows]}
+
+
+def day_label(day: date, today: date) -> str:
+    offset = (day - today).days
+    if offset == 0:
+        return "today"
+    if offset == 1:
+        return "tomorrow"
+    return day.strftime("%a %b %d")
+
+
+def _clock(text: str, is_end: bool):
+    """A display time as (day, "HH:MM"); an end at midnight is 24:00 of the day before."""
+    dt = datetime.strptime(text, DISPLAY_FORMAT)
+    if is_end and dt.hour == 0 and dt.minute == 0:
+        return dt.date() - timedelta(days=1), "24:00"
+    return dt.date(), f"{dt:%H:%M}"
+
+
+def clock_table(rows: List[Dict], columns: List[str]) -> Dict:
+    """
+    table() with the "start" and "end" display times shortened to 24-hour
+    HH:MM. When every time falls on one day, that day is given once relative
+    to today; otherwise each time carries its own day.
+    """
+    today = local_now().date()
+    parsed = [{c: _clock(r[c], c == "end") for c in ("start", "end")} for r in rows]
+    days = {day for p in parsed for day, _ in p.values()}
+    single = len(days) == 1
+
+    clocked = []
+    for r, p in zip(rows, parsed):
+        clocked.append({
+            **r,
+            **{c: clock if single else f"{day_label(day, today)} {clock}" for c, (day, clock) in p.items()},
+        })
+    projected = {"day": day_label(days.pop(), today)} if single else {}
+    projected.update(table(clocked, columns))
+    return projected
+
+
+def received_ago(header: Optional[str], now: datetime) -> Optional[str]:
+    """A Date header as an age like "3h ago"; headers that don't parse pass through."""
+    try:
+        sent = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return header
+    if sent.tzinfo is None:
+        sent = sent.replace(tzinfo=timezone.utc)
+    seconds = max(0.0, (now - sent).total_seconds())
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m ago"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)}h ago"
+    if seconds < 7 * 86400:
+        return f"{int(seconds // 86400)}d ago"
+    return sent.date().isoformat()
+
+
+@projector("get_tomorrow_events")
+def project_events(events: List[Dict]) -> Dict:
+    return clock_table(events, ["summary", "start", "end"])
+
+
+@projector("get_free_slots")
+def project_slots(slots: List[Dict]) -> Dict:
+    return clock_table(slots, ["start", "end"])
+
+
+@projector("find_common_slots")
+def project_common_slots(result: Dict) -> Dict:
+    projected = {"slots": clock_table(result["slots"], ["start", "end"])}
+    if result["unavailable_calendars"]:
+        projected["unavailable_calendars"] = result["unavailable_calendars"]
+    return projected
+
+
+@projector("list_unread_emails", "get_unread_from_sender")
+def project_emails(emails: List[Dict]) -> Dict:
+    """
+    Emails as a table whose "sender" column indexes the list of distinct
+    "senders", with dates as ages. Messages that failed to load go in "errors".
+    """
+    now = datetime.now(timezone.utc)
+    senders: Dict[Optional[str], int] = {}
+    rows = []
+    errors = []
+    for e in emails:
+        if e.get("error"):
+            errors.append({"id": e.get("id"), "error": e["error"]})
+            continue
+        rows.append({
+            **e,
+            "sender": senders.setdefault(e.get("from"), len(senders)),
+            "date": received_ago(e.get("date"), now),
+        })
+
+    columns = [c for c in ("id", "sender", "subject", "date") if any(c in r for r in rows)]
+    projected = {"senders": list(senders), **table(rows, columns)}
+    if errors:
+        projected["errors"] = errors
+    return projected
+
+
+@projector("schedule_meetings", "send_emails")
+def project_bulk_results(result: Dict) -> Dict:
+    if "results" not in result:
+        return result
+    rows = result["results"]
+    columns = list(dict.fromkeys(k for r in rows for k in r))
+    return {"results": table(rows, columns)}
+
+
 # --------------------------------
 # FORMATTERS (Deterministic Output)
 # --------------------------------
 
+@formatter("list_unread_emails", "get_unread_from_sender")
 def format_emails(emails):
     if not emails:
         return "No emails found."
 
     response = ""
     for i, e in enumerate(emails, 1):
+        if e.get("error"):
+            response += f"{i}. Could not load message {e.get('id')}: {e['error']}\n\n"
+            continue
         response += (
             f"{i}. From: {e.get('from')}\n"
             f"   Subject: {e.get('subject')}\n"
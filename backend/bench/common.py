@@ -0,0 +1,71 @@
+# common.py
+#
+# Shared helpers for the benchmark scripts in this directory.
+
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The backend modules use flat imports from agent/ and api/
+for _path in (os.path.join(BACKEND_DIR, "agent"), os.path.join(BACKEND_DIR, "api"), BACKEND_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Linear-interpolated percentile, q in [0, 100]."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize(samples: List[float], scale: float = 1000.0) -> Dict[str, float]:
+    """Latency summary of samples in seconds, reported in milliseconds by default."""
+    return {
+        "count": len(samples),
+        "mean": round(statistics.fmean(samples) * scale, 4) if samples else 0.0,
+        "p50": round(percentile(samples, 50) * scale, 4),
+        "p95": round(percentile(samples, 95) * scale, 4),
+        "p99": round(percentile(samples, 99) * scale, 4),
+        "max": round(max(samples) * scale, 4) if samples else 0.0,
+    }
+
+
+def bench(fn: Callable[[], object], repeat: int, warmup: int = 3) -> Dict[str, float]:
+    """Call fn repeatedly and summarize per-call latency in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def emit(suite: str, results: Dict, config: Dict, output: Optional[str] = None):
+    """Print the results as JSON and optionally write them to a file."""
+    report = {
+        "suite": suite,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
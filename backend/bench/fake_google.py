@@ -0,0 +1,433 @@
+# fake_google.py
+#
+# Offline stand-in for the Calendar and Gmail REST endpoints the backend
+# uses. FakeGoogle answers googleapiclient requests in-process (including
+# HTTP batch requests) from a generated dataset, with configurable latency.
+# Install it with service_pool.set_http_factory(fake.http).
+
+import email.parser
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parseaddr
+from typing import Dict, List, Optional, Tuple
+
+import httplib2
+
+SENDER_NAMES = ["Alice", "Bob", "Carol", "Dan", "Erin", "Frank", "Grace", "Heidi", "Ivan", "Judy"]
+TOPICS = ["Budget review", "Launch plan", "Standup", "1:1", "Design sync", "Hiring", "Customer call", "Retro"]
+
+
+class FakeGoogle:
+    """
+    Calendar and Gmail backed by generated data: `events` calendar events
+    spread over `days` days around today, and `messages` unread messages
+    from `senders` distinct senders. Every HTTP request (a batch counts as
+    one) sleeps latency_ms first.
+    """
+
+    def __init__(
+        self,
+        events: int = 2000,
+        messages: int = 20000,
+        senders: int = 200,
+        days: int = 30,
+        latency_ms: float = 0.0,
+        seed: int = 7,
+    ):
+        self.latency = latency_ms / 1000
+        self.requests = 0
+        self._lock = threading.Lock()
+        # Calendar sync tokens are change sequence numbers; tokens older than
+        # oldest_sync_token get 410 Gone, as expired tokens do in the real API
+        self.change_seq = 0
+        self.oldest_sync_token = 0
+        self.changed_at: Dict[str, int] = {}
+        # Gmail history: (history id, record) in order. startHistoryIds older
+        # than oldest_history_id get 404, as expired ones do in the real API
+        self.history_id = 1000
+        self.oldest_history_id = 1000
+        self.history: List[Tuple[int, Dict]] = []
+        # [path substring, remaining count, status, Retry-After, reason]
+        self._failures: List[List] = []
+        rng = random.Random(seed)
+
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.events: List[Dict] = []
+        for i in range(events):
+            start = today + timedelta(
+                days=rng.randrange(-days // 3, days),
+                hours=rng.randrange(8, 18),
+                minutes=rng.choice((0, 15, 30, 45)),
+            )
+            end = start + timedelta(minutes=rng.choice((15, 30, 45, 60, 90)))
+            self.events.append({
+                "id": f"evt{i}",
+                "status": "confirmed",
+                "summary": f"{rng.choice(TOPICS)} #{i}",
+                "start": {"dateTime": start.isoformat()},
+                "end": {"dateTime": end.isoformat()},
+            })
+        self.events.sort(key=lambda e: e["start"]["dateTime"])
+
+        self.messages: Dict[str, Dict] = {}
+        self.message_order: List[str] = []
+        self.by_sender: Dict[str, List[str]] = {}
+        now = datetime.now(timezone.utc)
+        for i in range(messages):
+            k = rng.randrange(senders)
+            sender = f"sender{k}@example.com"
+            sent = now - timedelta(minutes=i * 7)
+            msg_id = f"{i:012x}"
+            self.messages[msg_id] = {
+                "id": msg_id,
+                "threadId": f"t{msg_id}",
+                "labelIds": ["UNREAD", "INBOX"],
+                "internalDate": str(int(sent.timestamp() * 1000)),
+                "payload": {"headers": [
+                    {"name": "From", "value": f"{SENDER_NAMES[k % len(SENDER_NAMES)]} <{sender}>"},
+                    {"name": "Subject", "value": f"{rng.choice(TOPICS)} ({i})"},
+                    {"name": "Date", "value": format_datetime(sent)},
+                ]},
+            }
+            self.message_order.append(msg_id)
+            self.by_sender.setdefault(sender, []).append(msg_id)
+
+    def http(self):
+        """A transport for one googleapiclient service object."""
+        return _FakeHttp(self)
+
+    # ----------------------
+    # Error injection
+    # ----------------------
+    def fail_next(
+        self,
+        status: int,
+        count: int = 1,
+        retry_after: Optional[float] = None,
+        reason: Optional[str] = None,
+        match: str = "",
+    ):
+        """
+        Answer the next `count` requests whose path contains `match` with
+        `status`, e.g. 429 with a Retry-After, 403 with reason
+        "rateLimitExceeded", or a 5xx. Rules are used in the order added.
+        """
+        with self._lock:
+            self._failures.append([match, count, status, retry_after, reason])
+
+    def _injected_failure(self, path: str) -> Optional[Tuple[int, Dict, bytes]]:
+        with self._lock:
+            for rule in self._failures:
+                if rule[0] in path:
+                    rule[1] -= 1
+                    if rule[1] <= 0:
+                        self._failures.remove(rule)
+                    break
+            else:
+                return None
+        _, _, status, retry_after, reason = rule
+        error = {"code": status, "message": "Injected failure"}
+        if reason:
+            error["errors"] = [{"reason": reason, "message": reason}]
+        headers = {"content-type": "application/json"}
+        if retry_after is not None:
+            headers["retry-after"] = f"{retry_after:g}"
+        return status, headers, json.dumps({"error": error}).encode()
+
+    # ----------------------
+    # Calendar changes
+    # ----------------------
+    def put_event(self, event: Dict) -> Dict:
+        """Add or replace an event, as a change incremental syncs will see."""
+        with self._lock:
+            self.events = [e for e in self.events if e["id"] != event["id"]]
+            self.events.append(event)
+            self.events.sort(key=lambda e: e["start"]["dateTime"])
+            self._changed(event["id"])
+        return event
+
+    def cancel_event(self, event_id: str):
+        """Mark an event cancelled; full listings skip it, incremental syncs report it."""
+        with self._lock:
+            for event in self.events:
+                if event["id"] == event_id:
+                    event["status"] = "cancelled"
+                    self._changed(event_id)
+
+    def expire_sync_tokens(self):
+        """Invalidate every sync token issued so far."""
+        with self._lock:
+            self.oldest_sync_token = self.change_seq + 1
+            self.change_seq += 1
+
+    def _changed(self, event_id: str):
+        self.change_seq += 1
+        self.changed_at[event_id] = self.change_seq
+
+    # ----------------------
+    # Gmail changes
+    # ----------------------
+    def add_message(self, sender: str, subject: str) -> Dict:
+        """Deliver a new unread message, as a change history syncs will see."""
+        with self._lock:
+            msg_id = f"new{len(self.history):08x}"
+            sent = datetime.now(timezone.utc)
+            message = {
+                "id": msg_id,
+                "threadId": f"t{msg_id}",
+                "labelIds": ["UNREAD", "INBOX"],
+                "internalDate": str(int(sent.timestamp() * 1000)),
+                "payload": {"headers": [
+                    {"name": "From", "value": sender},
+                    {"name": "Subject", "value": subject},
+                    {"name": "Date", "value": format_datetime(sent)},
+                ]},
+            }
+            self.messages[msg_id] = message
+            self.message_order.insert(0, msg_id)
+            self.by_sender.setdefault(parseaddr(sender)[1], []).insert(0, msg_id)
+            self._record({"messagesAdded": [{"message": self._history_message(message)}]})
+        return message
+
+    def mark_read(self, msg_id: str):
+        """Remove UNREAD from a message; it leaves is:unread listings."""
+        with self._lock:
+            message = self.messages[msg_id]
+            message["labelIds"] = [label for label in message["labelIds"] if label != "UNREAD"]
+            self.message_order.remove(msg_id)
+            for ids in self.by_sender.values():
+                if msg_id in ids:
+                    ids.remove(msg_id)
+            self._record({"labelsRemoved": [{"message": self._history_message(message), "labelIds": ["UNREAD"]}]})
+
+    def expire_history(self):
+        """Make every history id issued so far too old to replay."""
+        with self._lock:
+            self.history_id += 1
+            self.oldest_history_id = self.history_id
+
+    def _record(self, record: Dict):
+        self.history_id += 1
+        self.history.append((self.history_id, {"id": str(self.history_id), **record}))
+
+    @staticmethod
+    def _history_message(message: Dict) -> Dict:
+        return {"id": message["id"], "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+
+    def _list_history(self, q: Dict[str, str]) -> Tuple[int, Dict]:
+        start = int(q.get("startHistoryId") or 0)
+        if start < self.oldest_history_id:
+            return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+        records = [record for history_id, record in self.history if history_id > start]
+        return 200, {"history": records, "historyId": str(self.history_id)}
+
+    # ----------------------
+    # Request handling
+    # ----------------------
+    def handle(self, method: str, uri: str, body, headers: Dict) -> Tuple[int, Dict, bytes]:
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        parsed = urllib.parse.urlparse(uri)
+        failure = self._injected_failure(parsed.path)
+        if failure is not None:
+            return failure
+        if "/batch" in parsed.path:
+            return self._batch(body, headers)
+        status, payload = self._route(method, parsed.path, urllib.parse.parse_qs(parsed.query), body)
+        return status, {"content-type": "application/json"}, json.dumps(payload).encode()
+
+    def _route(self, method: str, path: str, params: Dict[str, List[str]], body) -> Tuple[int, Dict]:
+        path = urllib.parse.unquote(path)
+        q = {k: v[0] for k, v in params.items()}
+
+        m = re.search(r"/calendar/v3/calendars/([^/]+)/events$", path)
+        if m:
+            if method == "POST":
+                event = json.loads(body or "{}")
+                # Client-supplied ids are unique, as in the real API
+                if event.get("id") and any(e["id"] == event["id"] for e in self.events):
+                    return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+                event.setdefault("id", f"evt{len(self.events)}")
+                event.update({"status": "confirmed", "htmlLink": f"https://calendar.example/{event['id']}"})
+                self.events.append(event)
+                self._changed(event["id"])
+                return 200, event
+            if "syncToken" in q and int(q["syncToken"]) < self.oldest_sync_token:
+                return 410, {"error": {"code": 410, "message": "Sync token is no longer valid, a full sync is required."}}
+            return 200, self._list_events(q)
+
+        m = re.search(r"/calendar/v3/calendars/([^/]+)/events/([^/]+)$", path)
+        if m and method == "GET":
+            event = next((e for e in self.events if e["id"] == m.group(2)), None)
+            if event is None:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            return 200, event
+
+        if path.endswith("/calendar/v3/freeBusy"):
+            return 200, self._freebusy(json.loads(body or "{}"))
+
+        m = re.search(r"/gmail/v1/users/[^/]+/(.*)$", path)
+        if m:
+            return self._gmail(method, m.group(1), q, params)
+
+        return 404, {"error": {"code": 404, "message": f"No fake for {method} {path}"}}
+
+    def _list_events(self, q: Dict[str, str]) -> Dict:
+        if "syncToken" in q:
+            # Everything changed since the token, cancellations included
+            since = int(q["syncToken"])
+            items = [e for e in self.events if self.changed_at.get(e["id"], 0) > since]
+        else:
+            time_min = q.get("timeMin")
+            time_max = q.get("timeMax")
+            lo = datetime.fromisoformat(time_min) if time_min else None
+            hi = datetime.fromisoformat(time_max) if time_max else None
+            items = [
+                e for e in self.events
+                if e.get("status") != "cancelled"
+                and (lo is None or datetime.fromisoformat(e["end"]["dateTime"]) > lo)
+                and (hi is None or datetime.fromisoformat(e["start"]["dateTime"]) < hi)
+            ]
+
+        offset = int(q.get("pageToken") or 0)
+        page_size = int(q.get("maxResults") or 250)
+        page = items[offset:offset + page_size]
+        response = {"items": page}
+        if offset + page_size < len(items):
+            response["nextPageToken"] = str(offset + page_size)
+        else:
+            response["nextSyncToken"] = str(self.change_seq)
+        return response
+
+    def _freebusy(self, body: Dict) -> Dict:
+        lo = datetime.fromisoformat(body["timeMin"])
+        hi = datetime.fromisoformat(body["timeMax"])
+        calendars = {}
+        for item in body.get("items", []):
+            cal_id = item["id"]
+            if cal_id == "primary":
+                busy = [
+                    {"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]}
+                    for e in self._list_events({"timeMin": body["timeMin"], "timeMax": body["timeMax"], "maxResults": "100000"})["items"]
+                ]
+            else:
+                # Attendees get a stable pseudo-random schedule
+                rng = random.Random(cal_id)
+                busy = []
+                day = lo.replace(hour=0, minute=0, second=0, microsecond=0)
+                while day < hi:
+                    for _ in range(rng.randrange(0, 5)):
+                        start = day + timedelta(hours=rng.randrange(8, 18), minutes=rng.choice((0, 30)))
+                        busy.append({"start": start.isoformat(), "end": (start + timedelta(minutes=30)).isoformat()})
+                    day += timedelta(days=1)
+            calendars[cal_id] = {"busy": busy}
+        return {"kind": "calendar#freeBusy", "calendars": calendars}
+
+    def _gmail(self, method: str, rest: str, q: Dict[str, str], params: Dict[str, List[str]]) -> Tuple[int, Dict]:
+        if rest == "profile":
+            return 200, {"emailAddress": "me@example.com", "historyId": str(self.history_id)}
+
+        if rest == "history":
+            return self._list_history(q)
+
+        if rest == "messages/send" and method == "POST":
+            return 200, {"id": f"sent{self.requests}", "labelIds": ["SENT"]}
+
+        if rest == "messages":
+            return 200, self._list_messages(q)
+
+        m = re.match(r"messages/([^/]+)$", rest)
+        if m:
+            message = self.messages.get(m.group(1))
+            if message is None:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            wanted = set(params.get("metadataHeaders", []))
+            if wanted:
+                headers = [h for h in message["payload"]["headers"] if h["name"] in wanted]
+                message = {**message, "payload": {"headers": headers}}
+            return 200, message
+
+        m = re.match(r"threads/([^/]+)$", rest)
+        if m:
+            msg_id = m.group(1)[1:]
+            return 200, {"id": m.group(1), "messages": [self.messages[msg_id]] if msg_id in self.messages else []}
+
+        return 404, {"error": {"code": 404, "message": f"No fake for gmail {rest}"}}
+
+    def _list_messages(self, q: Dict[str, str]) -> Dict:
+        query = q.get("q") or ""
+        sender = re.search(r"from:(\S+)", query)
+        ids = self.by_sender.get(sender.group(1), []) if sender else self.message_order
+
+        offset = int(q.get("pageToken") or 0)
+        page_size = min(int(q.get("maxResults") or 100), 500)
+        page = ids[offset:offset + page_size]
+        response = {
+            "messages": [{"id": i, "threadId": self.messages[i]["threadId"]} for i in page],
+            "resultSizeEstimate": len(ids),
+        }
+        if offset + page_size < len(ids):
+            response["nextPageToken"] = str(offset + page_size)
+        return response
+
+    def _batch(self, body, headers: Dict) -> Tuple[int, Dict, bytes]:
+        """Answer a multipart/mixed batch by routing each embedded request."""
+        if isinstance(body, bytes):
+            body = body.decode()
+        content_type = {k.lower(): v for k, v in headers.items()}["content-type"]
+        request = email.parser.Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n{body}")
+
+        boundary = "fake_batch_boundary"
+        parts = []
+        for part in request.get_payload():
+            inner = part.get_payload()
+            request_line, _, rest = inner.partition("\n")
+            method, target, _ = request_line.strip().split(" ", 2)
+            inner_body = rest.split("\r\n\r\n", 1)[1] if "\r\n\r\n" in rest else rest.split("\n\n", 1)[-1]
+            parsed = urllib.parse.urlparse(target)
+            # fail_next rules apply to the calls inside a batch too
+            failure = self._injected_failure(parsed.path)
+            if failure is not None:
+                status, part_headers, content = failure
+                payload = json.loads(content)
+            else:
+                status, payload = self._route(method, parsed.path, urllib.parse.parse_qs(parsed.query), inner_body or None)
+                part_headers = {"content-type": "application/json"}
+            content_id = part["Content-ID"].strip("<>")
+            header_lines = "".join(f"{k.title()}: {v}\r\n" for k, v in part_headers.items())
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"{header_lines}\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        content = "".join(parts) + f"--{boundary}--\r\n"
+        return 200, {"content-type": f"multipart/mixed; boundary={boundary}"}, content.encode()
+
+    def stats(self) -> Dict:
+        return {"requests": self.requests, "events": len(self.events), "messages": len(self.messages)}
+
+
+class _FakeHttp:
+    """Minimal httplib2.Http replacement that answers from a FakeGoogle."""
+
+    def __init__(self, fake: FakeGoogle):
+        self.fake = fake
+        self.timeout: Optional[float] = None
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        status, response_headers, content = self.fake.handle(method, uri, body, headers or {})
+        return httplib2.Response({"status": str(status), **response_headers}), content
+
+    def close(self):
+        pass
@@ -0,0 +1,97 @@
+# fake_openai.py
+#
+# Local stand-in for the OpenAI chat completions API. It streams (or
+# returns) a tool call for the first turn of a request and a short answer
+# once tool results are in, with configurable latency. Point the backend at
+# it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 before importing it.
+
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# First matching keyword picks the tool the fake model calls
+TOOL_KEYWORDS = [
+    (("free", "available", "availability"), "get_free_slots"),
+    (("email", "inbox", "mail", "unread"), "list_unread_emails"),
+    (("calendar", "meeting", "tomorrow", "schedule", "week"), "get_tomorrow_events"),
+]
+
+
+def choose_tool(text: str) -> Optional[str]:
+    lowered = text.lower()
+    for keywords, tool in TOOL_KEYWORDS:
+        if any(k in lowered for k in keywords):
+            return tool
+    return None
+
+
+def create_app(first_token_ms: float = 300.0, token_ms: float = 10.0, answer_tokens: int = 40) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        messages: List[Dict] = body["messages"]
+        last = messages[-1]
+        created = int(time.time())
+
+        tool = choose_tool(last.get("content") or "") if last["role"] == "user" else None
+        if tool:
+            call = {"index": 0, "id": f"call_{app.state.requests}", "type": "function",
+                    "function": {"name": tool, "arguments": "{}"}}
+            deltas = [{"role": "assistant", "tool_calls": [call]}]
+            finish = "tool_calls"
+        else:
+            words = [f"word{i} " for i in range(answer_tokens)]
+            deltas = [{"role": "assistant", "content": ""}] + [{"content": w} for w in words]
+            finish = "stop"
+
+        await asyncio.sleep(first_token_ms / 1000)
+
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": "".join(d.get("content", "") for d in deltas) or None}
+            if tool:
+                message["tool_calls"] = [{k: v for k, v in deltas[0]["tool_calls"][0].items() if k != "index"}]
+            return JSONResponse({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": body["model"],
+                "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(deltas), "total_tokens": len(deltas)},
+            })
+
+        async def stream():
+            for delta in deltas:
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                         "model": body["model"], "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                if token_ms:
+                    await asyncio.sleep(token_ms / 1000)
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                     "model": body["model"], "choices": [{"index": 0, "delta": {}, "finish_reason": finish}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def serve(app: FastAPI, host: str = "127.0.0.1", port: int = 0) -> uvicorn.Server:
+    """Run an ASGI app on a background thread; returns once it is accepting connections."""
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def bound_port(server: uvicorn.Server) -> int:
+    return server.servers[0].sockets[0].getsockname()[1]
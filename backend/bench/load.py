@@ -0,0 +1,220 @@
+# load.py
+#
+# End-to-end load test of /chat (or /chat/stream) against offline fakes for
+# OpenAI, Calendar and Gmail. Run from backend/bench:
+#     python load.py [--requests 500] [--concurrency 20] [--agent-ratio 0.3] [--output load.json]
+# With --workers N the backend runs under uvicorn with N worker processes
+# sharing STATE_BACKEND=sqlite; --scaling 1,2,4 repeats the run for each
+# worker count and reports throughput relative to the first.
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import emit, summarize
+
+import fake_openai
+from fake_google import FakeGoogle
+
+# Served by the deterministic planner without the model
+FAST_MESSAGES = [
+    "what's on my calendar tomorrow",
+    "when am i free tomorrow",
+    "check my email",
+    "any unread emails from sender3@example.com",
+    "what's on tomorrow and any unread email from sender7@example.com",
+]
+
+# Routed to the agent loop and the fake model
+AGENT_MESSAGES = [
+    "summarize my emails and tell me what needs a reply",
+    "help me plan my day around my meetings",
+    "which emails are important this week",
+    "write a thank you message",
+]
+
+
+async def run_load(base_url: str, total: int, concurrency: int, agent_ratio: float, stream: bool, seed: int):
+    import httpx
+
+    rng = random.Random(seed)
+    plan = [
+        ("agent", rng.choice(AGENT_MESSAGES)) if rng.random() < agent_ratio else ("fast", rng.choice(FAST_MESSAGES))
+        for _ in range(total)
+    ]
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    latencies = {"all": [], "fast": [], "agent": []}
+    first_event = []
+    errors = []
+
+    async def worker(worker_id: int, client):
+        session = f"load-{worker_id}"
+        while not queue.empty():
+            kind, message = queue.get_nowait()
+            payload = {"message": message, "session_id": session}
+            start = time.perf_counter()
+            try:
+                if stream:
+                    async with client.stream("POST", "/chat/stream", json=payload) as response:
+                        first = None
+                        async for line in response.aiter_lines():
+                            if first is None and line.startswith("data:"):
+                                first = time.perf_counter() - start
+                            if '"type": "error"' in line:
+                                errors.append(line)
+                        first_event.append(first or 0.0)
+                else:
+                    response = await client.post("/chat", json=payload)
+                    response.raise_for_status()
+            except Exception as e:
+                errors.append(repr(e))
+                continue
+            elapsed = time.perf_counter() - start
+            latencies["all"].append(elapsed)
+            latencies[kind].append(elapsed)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i, client) for i in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    results = {
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies["all"]) / wall, 2) if wall else 0.0,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "latency_ms": {kind: summarize(samples) for kind, samples in latencies.items()},
+    }
+    if stream:
+        results["first_event_ms"] = summarize(first_event)
+    return results
+
+
+def start_workers(workers: int, args) -> tuple:
+    """Serve serve:app with this many uvicorn workers on shared SQLite state."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    state_dir = tempfile.mkdtemp(prefix="load-state-")
+    env = {
+        **os.environ,
+        "STATE_BACKEND": "sqlite",
+        "STATE_DB_PATH": os.path.join(state_dir, "state.db"),
+        "WEB_CONCURRENCY": str(workers),
+        "BENCH_EVENTS": str(args.events),
+        "BENCH_MESSAGES": str(args.messages),
+        "BENCH_GOOGLE_LATENCY_MS": str(args.google_latency_ms),
+    }
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "serve:app",
+            "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    wait_until_up(base_url, process)
+    return process, base_url
+
+
+def wait_until_up(base_url: str, process: subprocess.Popen, timeout: float = 60.0):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/stats", timeout=1).raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("uvicorn workers did not come up")
+
+
+def run_scaling(counts: list, args) -> dict:
+    runs = []
+    for workers in counts:
+        process, base_url = start_workers(workers, args)
+        try:
+            result = asyncio.run(run_load(
+                base_url, args.requests, args.concurrency, args.agent_ratio, args.stream, args.seed,
+            ))
+        finally:
+            process.terminate()
+            process.wait()
+        runs.append({"workers": workers, **result})
+    baseline = runs[0]["throughput_rps"]
+    for run in runs:
+        run["speedup"] = round(run["throughput_rps"] / baseline, 2) if baseline else 0.0
+    return {"runs": runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /chat against offline OpenAI and Google fakes")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--agent-ratio", type=float, default=0.3, help="share of requests that need the model")
+    parser.add_argument("--stream", action="store_true", help="load /chat/stream and report time to first event")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--google-latency-ms", type=float, default=30.0)
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-token-ms", type=float, default=5.0)
+    parser.add_argument("--completion-cache", action="store_true", help="leave the completion cache enabled")
+    parser.add_argument("--workers", type=int, default=0, help="serve with this many uvicorn workers")
+    parser.add_argument("--scaling", help="comma-separated worker counts to compare, e.g. 1,2,4")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    llm = fake_openai.create_app(args.llm_first_token_ms, args.llm_token_ms)
+    llm_server = fake_openai.serve(llm)
+
+    # The OpenAI clients read these when the backend is imported
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{fake_openai.bound_port(llm_server)}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    if not args.completion_cache:
+        os.environ["COMPLETION_CACHE_ENABLED"] = "0"
+
+    if args.scaling or args.workers:
+        counts = [int(n) for n in args.scaling.split(",")] if args.scaling else [args.workers]
+        results = run_scaling(counts, args)
+        results["llm_requests"] = llm.state.requests
+        llm_server.should_exit = True
+        emit("load", results, vars(args), args.output)
+        return
+
+    fake = FakeGoogle(events=args.events, messages=args.messages, latency_ms=args.google_latency_ms)
+    import service_pool
+    service_pool.set_http_factory(fake.http)
+
+    import main as backend
+    app_server = fake_openai.serve(backend.app)
+    base_url = f"http://127.0.0.1:{fake_openai.bound_port(app_server)}"
+
+    results = asyncio.run(run_load(
+        base_url, args.requests, args.concurrency, args.agent_ratio, args.stream, args.seed,
+    ))
+    results["llm_requests"] = llm.state.requests
+    results["google_requests"] = fake.requests
+
+    app_server.should_exit = True
+    llm_server.should_exit = True
+    emit("load", results, vars(args), args.output)
+
+
+if __name__ == "__main__":
+    main()
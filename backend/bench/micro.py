@@ -0,0 +1,93 @@
+# micro.py
+#
+# Microbenchmarks for the hot in-process paths, plus the size of each tool's
+# payload to the model with and without projection. Run from backend/bench:
+#     python micro.py [--events 5000] [--repeat 200] [--output micro.json]
+
+import argparse
+import itertools
+import random
+from email.utils import parseaddr
+
+from common import bench, emit
+
+from fake_google import FakeGoogle
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for routing, free-slot and formatting paths")
+    parser.add_argument("--events", type=int, default=5000, help="calendar events in the fake dataset")
+    parser.add_argument("--messages", type=int, default=20000, help="unread messages in the fake dataset")
+    parser.add_argument("--items", type=int, default=200, help="list size passed to the formatters")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    fake = FakeGoogle(events=args.events, messages=args.messages)
+    import service_pool
+    service_pool.set_http_factory(fake.http)
+
+    from datetime import timedelta
+
+    from calendar_api import get_free_slots, local_now, start_of_day
+    from freebusy import merge_intervals, subtract_intervals
+    from planner import planner
+    from projection import PayloadEncoder
+    from router import route_intent
+    from router_eval import EVAL_SET
+    from tools import format_emails, format_events, format_slots, registry
+
+    results = {}
+
+    messages = itertools.cycle([m for m, _, _ in EVAL_SET])
+    results["route_intent"] = bench(lambda: route_intent(next(messages)), args.repeat * 5)
+    results["planner.plan"] = bench(lambda: planner.plan(next(messages)), args.repeat * 5)
+
+    # Served from the synced calendar index after the first call
+    start = start_of_day(local_now() + timedelta(days=1))
+    week = start + timedelta(days=7)
+    results["get_free_slots.day"] = bench(lambda: get_free_slots(None, start, start + timedelta(days=1)), args.repeat)
+    results["get_free_slots.week"] = bench(lambda: get_free_slots(None, start, week), args.repeat)
+
+    rng = random.Random(1)
+    base = start.timestamp()
+    intervals = []
+    for _ in range(args.events):
+        s = base + rng.uniform(0, 7 * 86400)
+        intervals.append((s, s + rng.choice((900, 1800, 3600))))
+    results["merge_intervals"] = bench(lambda: merge_intervals(intervals), args.repeat)
+    merged = merge_intervals(intervals)
+    results["subtract_intervals"] = bench(lambda: subtract_intervals([(base, base + 7 * 86400)], merged), args.repeat)
+
+    events = [
+        {"summary": e["summary"], "start": e["start"]["dateTime"], "end": e["end"]["dateTime"]}
+        for e in fake.events[:args.items]
+    ]
+    slots = [{"start": e["start"], "end": e["end"]} for e in events]
+    emails = [
+        {"id": m["id"], **{h["name"].lower(): h["value"] for h in m["payload"]["headers"]}}
+        for m in list(fake.messages.values())[:args.items]
+    ]
+    results["format_events"] = bench(lambda: format_events(events), args.repeat)
+    results["format_slots"] = bench(lambda: format_slots(slots), args.repeat)
+    results["format_emails"] = bench(lambda: format_emails(emails), args.repeat)
+
+    # Real tool results from the fake dataset, encoded both ways
+    calls = {
+        "get_tomorrow_events": {},
+        "get_free_slots": {},
+        "find_common_slots": {"attendees": ["a@example.com", "b@example.com"]},
+        "list_unread_emails": {"max_results": 50},
+        "get_unread_from_sender": {"sender_email": parseaddr(emails[0]["from"])[1], "max_results": 20},
+    }
+    encoder = PayloadEncoder(enabled=True, disabled=frozenset())
+    for name, call_args in calls.items():
+        result = registry.dispatch(name, None, call_args)
+        results[f"encode.{name}"] = bench(lambda: encoder.encode(name, result), args.repeat)
+    results["payloads"] = encoder.stats()
+
+    emit("micro", results, {**vars(args), "unit": "ms", "fake_google": fake.stats()}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+# serve.py
+#
+# The backend app with the offline Google fake installed, importable by
+# uvicorn so it can run with several worker processes:
+#     uvicorn serve:app --app-dir backend/bench --workers 4
+# load.py --workers / --scaling starts it this way. Each worker gets its own
+# FakeGoogle, configured by BENCH_EVENTS, BENCH_MESSAGES and
+# BENCH_GOOGLE_LATENCY_MS; point OPENAI_BASE_URL at a fake_openai server.
+
+import os
+
+import common  # noqa: F401  (puts the backend on sys.path)
+
+import service_pool
+from fake_google import FakeGoogle
+
+fake = FakeGoogle(
+    events=int(os.getenv("BENCH_EVENTS", "2000")),
+    messages=int(os.getenv("BENCH_MESSAGES", "20000")),
+    latency_ms=float(os.getenv("BENCH_GOOGLE_LATENCY_MS", "30")),
+)
+service_pool.set_http_factory(fake.http)
+
+from main import app  # noqa: E402
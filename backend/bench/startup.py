@@ -0,0 +1,129 @@
+# startup.py
+#
+# Startup benchmark: how long `import main` takes in a fresh interpreter,
+# which modules dominate it, and how long a uvicorn worker takes to answer
+# /health and then /ready. Run from backend/bench:
+#     python startup.py [--repeat 5] [--top 15] [--budget-ms 1500] [--output startup.json]
+# With --budget-ms the script exits non-zero when the median import time is
+# over budget, so CI can catch startup regressions.
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from common import BACKEND_DIR, emit, summarize
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Imports the backend the way serve.py does, in a clean interpreter
+IMPORT_MAIN = (
+    "import sys, time; "
+    f"sys.path[:0] = [{os.path.join(BACKEND_DIR, 'agent')!r}, {os.path.join(BACKEND_DIR, 'api')!r}, {BACKEND_DIR!r}]; "
+    "start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+)
+
+
+def _env() -> Dict[str, str]:
+    # The OpenAI client must never be needed to import the backend
+    return {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "fake")}
+
+
+def import_times(repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_MAIN], env=_env(), capture_output=True, text=True, check=True,
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def slowest_imports(top: int) -> List[Dict]:
+    """Top-level packages by cumulative import time, from python -X importtime."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_MAIN], env=_env(), capture_output=True, text=True, check=True,
+    )
+    totals: Dict[str, int] = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Count each top-level package once, at its outermost import
+        package = name.strip().split(".")[0]
+        totals[package] = max(totals.get(package, 0), int(cumulative))
+    ranked = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)
+    return [{"module": name, "ms": round(us / 1000, 1)} for name, us in ranked if name != "main"][:top]
+
+
+def time_to_ready(timeout: float = 120.0) -> Dict[str, float]:
+    """Start serve:app under uvicorn and time the first 200 from /health and from /ready."""
+    import httpx
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "serve:app", "--app-dir", BENCH_DIR,
+            "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+        ],
+        # A small fake dataset, so the fake's own setup doesn't dominate
+        env={**_env(), "BENCH_EVENTS": "50", "BENCH_MESSAGES": "50"},
+    )
+    results: Dict[str, float] = {}
+    try:
+        for path in ("/health", "/ready"):
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"{path} did not return 200 within {timeout:g}s")
+                try:
+                    if httpx.get(base_url + path, timeout=1).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                time.sleep(0.02)
+            results[f"{path.strip('/')}_seconds"] = round(time.perf_counter() - started, 3)
+        results["warmup"] = httpx.get(base_url + "/ready", timeout=1).json()
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and time-to-ready benchmark for the backend")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters to time the import in")
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--no-serve", action="store_true", help="skip the uvicorn time-to-ready run")
+    parser.add_argument("--budget-ms", type=float, help="fail if the median import time exceeds this")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    samples = import_times(args.repeat)
+    results = {
+        "import_main_ms": summarize(samples),
+        "slowest_imports": slowest_imports(args.top),
+    }
+    if not args.no_serve:
+        results["serve"] = time_to_ready()
+    emit("startup", results, vars(args), args.output)
+
+    median_ms = statistics.median(samples) * 1000
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        print(f"Import took {median_ms:.0f}ms, over the {args.budget_ms:.0f}ms budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,287 @@
 # backend/main.py
 
-from fastapi import FastAPI
+import asyncio
+import json
+from typing import List, Optional
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from router import route_intent
-from agent import run_agent
-from tools import (
-    tool_get_tomorrow_events,
-    tool_get_free_slots,
-    format_events,
-    format_slots,
-    tool_list_unread_emails,
-    format_emails
-)
+from planner import merge_outputs, planner
+from projection import payloads
+from agent import completion_cache, run_agent, run_agent_stream
+from auth import API_TOKENS, authenticate
+from briefing import briefing
+from speculation import speculator
+from memory import DEFAULT_SESSION
+from cache import cache_stats
+from credentials import DEFAULT_USER, credential_manager
+from executor import executor, run_blocking
+from scheduler import scheduler
+from service_pool import pool_stats
+from telemetry import REQUESTS, metrics, span, stats_samples
+from tools import registry
+from warmup import warmup
 
 app = FastAPI()
 
 class ChatRequest(BaseModel):
     message: str
+    session_id: str = DEFAULT_SESSION
+    user_id: str = DEFAULT_USER
+
+
+class MeetingItem(BaseModel):
+    title: str
+    start_time: str
+    end_time: str
+    attendees: Optional[List[str]] = None
+    idempotency_key: Optional[str] = None
+
+
+class EmailItem(BaseModel):
+    to: str
+    subject: str
+    body: str
+    idempotency_key: Optional[str] = None
+
+
+class BulkMeetingsRequest(BaseModel):
+    meetings: List[MeetingItem]
+    user_id: str = DEFAULT_USER
+
+
+class BulkEmailsRequest(BaseModel):
+    emails: List[EmailItem]
+    user_id: str = DEFAULT_USER
+
+
+@app.on_event("startup")
+async def load_credentials():
+    # Libraries that use asyncio.to_thread get the sized pool too
+    asyncio.get_running_loop().set_default_executor(executor)
+    # Heavy dependencies load in the background; /ready reports when they're done
+    warmup.start()
+    # Start reading the default user's token; its first request waits for it (see aget)
+    credential_manager.get(DEFAULT_USER)
+    if briefing:
+        briefing.track(DEFAULT_USER)
+
 
-# TODO: Replace with real Google creds loader
-creds = None
+def request_user(user_id: str, authorization: Optional[str]) -> str:
+    """
+    The user a request acts as. With API_TOKENS set it is the bearer
+    token's user, and naming anyone else is refused; otherwise it is the
+    requested user, if the server is configured for them.
+    """
+    if API_TOKENS:
+        owner = authenticate(authorization)
+        if owner is None:
+            raise HTTPException(status_code=401, detail="Missing or invalid API token", headers={"WWW-Authenticate": "Bearer"})
+        if user_id not in (DEFAULT_USER, owner):
+            raise HTTPException(status_code=403, detail="The API token is for another user")
+        user_id = owner
+    if not credential_manager.configured(user_id):
+        raise HTTPException(status_code=403, detail="Unknown user")
+    return user_id
 
 
-def handle_request(user_input):
-    intent = route_intent(user_input)
+def fast_path(intent):
+    """The tool spec serving an intent deterministically, if it has a formatter."""
+    spec = registry.get(intent)
+    return spec if spec and spec.formatter else None
 
-    if intent == "get_tomorrow_events":
-        events = tool_get_tomorrow_events(creds)
-        return format_events(events)
 
-    elif intent == "get_free_slots":
-        slots = tool_get_free_slots(creds)
-        return format_slots(slots)
+def fast_plan(user_input):
+    """Deterministic steps for the message, or None when it needs the agent."""
+    with span("route"):
+        steps = planner.plan(user_input)
+    if steps and all(fast_path(step.intent) for step in steps):
+        REQUESTS.inc(path="fast")
+        return steps
+    REQUESTS.inc(path="agent")
+    return None
 
-    elif intent == "list_unread_emails":
-        emails = tool_list_unread_emails(creds)
-        return format_emails(emails)
+
+def call_tool(spec, creds, args, user_id):
+    # A fresh precomputed briefing answers the common morning questions
+    result = briefing.lookup(user_id, spec.name, args) if briefing else None
+    if result is None:
+        with span("tool", spec.name):
+            result = spec.func(creds, **args)
+    return result
+
+
+async def run_step(step, creds, user_id=DEFAULT_USER):
+    spec = fast_path(step.intent)
+    # The briefing lookup reads shared state and Google client calls block,
+    # so both run in a worker thread
+    result = await run_blocking(call_tool, spec, creds, step.args, user_id)
+    with span("format", spec.name):
+        return spec.formatter(result)
+
+
+async def handle_request(user_input, session_id=DEFAULT_SESSION, user_id=DEFAULT_USER):
+    creds = await credential_manager.aget(user_id)
+    if briefing:
+        briefing.track(user_id)
+    steps = fast_plan(user_input)
+    if steps:
+        texts = await asyncio.gather(*(run_step(step, creds, user_id) for step in steps))
+        return merge_outputs(steps, texts)
 
     else:
-        return run_agent(user_input, creds)
+        return await run_agent(user_input, creds, session_id)
+
+
+async def handle_request_stream(user_input, session_id=DEFAULT_SESSION, user_id=DEFAULT_USER):
+    """Same routing as handle_request, but yields progress events."""
+    creds = await credential_manager.aget(user_id)
+    if briefing:
+        briefing.track(user_id)
+    steps = fast_plan(user_input)
+    if steps:
+        for step in steps:
+            yield {"type": "tool_start", "name": step.intent}
+
+        async def run_indexed(i):
+            return i, await run_step(steps[i], creds, user_id)
+
+        texts = [None] * len(steps)
+        tasks = [asyncio.ensure_future(run_indexed(i)) for i in range(len(steps))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                i, texts[i] = await next_done
+                yield {"type": "tool_end", "name": steps[i].intent, "ok": True}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        text = merge_outputs(steps, texts)
+        for line in text.splitlines(keepends=True):
+            yield {"type": "token", "content": line}
+        yield {"type": "done", "content": text}
+
+    else:
+        async for event in run_agent_stream(user_input, creds, session_id):
+            yield event
+
+
+def to_sse(event) -> str:
+    return f"data: {json.dumps(event)}\n\n"
 
 
 @app.post("/chat")
-def chat(req: ChatRequest):
-    response = handle_request(req.message)
-    return {"response": response}
\ No newline at end of file
+async def chat(req: ChatRequest, authorization: Optional[str] = Header(None)):
+    user_id = request_user(req.user_id, authorization)
+    response = await handle_request(req.message, req.session_id, user_id)
+    return {"response": response}
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, authorization: Optional[str] = Header(None)):
+    user_id = request_user(req.user_id, authorization)
+
+    async def events():
+        try:
+            async for event in handle_request_stream(req.message, req.session_id, user_id):
+                yield to_sse(event)
+        except Exception as e:
+            yield to_sse({"type": "error", "message": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so the first event is flushed immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Counters other modules already keep, read at scrape time
+for _field in ("hits", "misses", "evictions"):
+    metrics.collector(
+        f"assistant_read_cache_{_field}_total", "counter", f"Read cache {_field}",
+        lambda field=_field: stats_samples(cache_stats(), field, "cache"),
+    )
+metrics.collector(
+    "assistant_outbound_retries_total", "counter", "Retried outbound calls per upstream",
+    lambda: stats_samples(scheduler.stats(), "retries", "upstream"),
+)
+metrics.collector(
+    "assistant_outbound_coalesced_total", "counter", "Outbound reads served by an identical in-flight call",
+    lambda: stats_samples(scheduler.stats(), "coalesced", "upstream"),
+)
+
+
+async def run_bulk(name, user_id, items):
+    """Run a bulk write tool and invalidate what it makes stale, as the agent does."""
+    spec = registry.get(name)
+    creds = await credential_manager.aget(user_id)
+    with span("tool", name):
+        result = await run_blocking(spec.func, creds, items)
+    if completion_cache and spec.invalidates:
+        completion_cache.invalidate_tools(spec.invalidates)
+    if briefing and spec.invalidates:
+        briefing.invalidate(creds, spec.invalidates)
+    if "results" not in result:
+        raise HTTPException(status_code=400, detail=result.get("message"))
+    return result
+
+
+@app.post("/bulk/meetings")
+async def bulk_meetings(req: BulkMeetingsRequest, authorization: Optional[str] = Header(None)):
+    user_id = request_user(req.user_id, authorization)
+    items = [m.model_dump(exclude_none=True) for m in req.meetings]
+    return await run_bulk("schedule_meetings", user_id, items)
+
+
+@app.post("/bulk/emails")
+async def bulk_emails(req: BulkEmailsRequest, authorization: Optional[str] = Header(None)):
+    user_id = request_user(req.user_id, authorization)
+    items = [e.model_dump(exclude_none=True) for e in req.emails]
+    return await run_bulk("send_emails", user_id, items)
+
+
+@app.get("/briefing")
+async def get_briefing(user_id: str = DEFAULT_USER, refresh: bool = False, authorization: Optional[str] = Header(None)):
+    """The user's precomputed digest with its age; refresh=true recomputes it first."""
+    user_id = request_user(user_id, authorization)
+    if not briefing:
+        raise HTTPException(status_code=404, detail="Briefings are disabled")
+    digest = await run_blocking(briefing.get, user_id, refresh)
+    if digest is None:
+        raise HTTPException(status_code=503, detail="Briefing could not be computed")
+    return digest
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+def health():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready():
+    """Readiness: 200 once the startup warm-up has loaded everything, 503 until then. Unconfigured steps are listed."""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "service_pool": pool_stats(),
+        "read_cache": cache_stats(),
+        "completion_cache": completion_cache.stats() if completion_cache else None,
+        "speculation": speculator.stats() if speculator else None,
+        "planner": planner.stats(),
+        "briefing": briefing.stats() if briefing else None,
+        "tool_payloads": payloads.stats(),
+        "credentials": credential_manager.stats(),
+        "outbound": scheduler.stats(),
+    }
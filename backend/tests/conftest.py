@@ -0,0 +1,30 @@
+# conftest.py
+#
+# The backend modules use flat imports from agent/ and api/, as main.py and
+# the bench scripts do. Run from backend: python -m pytest -q tests
+
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for _path in (os.path.join(BACKEND_DIR, "agent"), os.path.join(BACKEND_DIR, "api"), BACKEND_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+# The offline Google fake lives with the benchmarks
+sys.path.append(os.path.join(BACKEND_DIR, "bench"))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def fake_google():
+    """A small FakeGoogle that every new Google service talks to."""
+    import service_pool
+    from fake_google import FakeGoogle
+
+    fake = FakeGoogle(events=50, messages=50, days=10)
+    service_pool.set_http_factory(fake.http)
+    yield fake
+    service_pool.set_http_factory(None)
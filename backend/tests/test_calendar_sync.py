@@ -0,0 +1,130 @@
+# test_calendar_sync.py
+
+from datetime import datetime, timedelta, timezone
+
+from calendar_sync import SYNC_FUTURE_DAYS, CalendarStore, CalendarSyncEngine
+
+
+def event(event_id, start, minutes=30, summary="Synced"):
+    return {
+        "id": event_id,
+        "status": "confirmed",
+        "summary": summary,
+        "start": {"dateTime": start.isoformat()},
+        "end": {"dateTime": (start + timedelta(minutes=minutes)).isoformat()},
+    }
+
+
+def tomorrow_at(hour):
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today + timedelta(days=1, hours=hour)
+
+
+def ids(store, start, end):
+    return {e["id"] for e in store.between(start, end)}
+
+
+def test_full_sync_mirrors_the_window(fake_google):
+    store = CalendarStore(None, "primary")
+    store.sync()
+
+    assert store.ready
+    assert len(store.index) == len(fake_google.events)
+    assert store.sync_token == str(fake_google.change_seq)
+
+
+def test_sync_token_round_trip_applies_only_changes(fake_google):
+    store = CalendarStore(None, "primary")
+    store.sync()
+    first_token = store.sync_token
+
+    fake_google.put_event(event("new1", tomorrow_at(9)))
+    store.sync()
+
+    assert store.sync_token != first_token
+    assert "new1" in ids(store, tomorrow_at(0), tomorrow_at(23))
+    assert len(store.index) == len(fake_google.events)
+
+    # Nothing changed: the next incremental sync keeps the same view
+    requests = fake_google.requests
+    store.sync()
+    assert fake_google.requests == requests + 1
+    assert len(store.index) == len(fake_google.events)
+
+
+def test_updated_event_moves_in_the_index(fake_google):
+    store = CalendarStore(None, "primary")
+    fake_google.put_event(event("moving", tomorrow_at(9)))
+    store.sync()
+
+    fake_google.put_event(event("moving", tomorrow_at(15)))
+    store.sync()
+
+    assert "moving" not in ids(store, tomorrow_at(8), tomorrow_at(10))
+    assert "moving" in ids(store, tomorrow_at(14), tomorrow_at(16))
+
+
+def test_cancelled_events_are_removed(fake_google):
+    store = CalendarStore(None, "primary")
+    fake_google.put_event(event("doomed", tomorrow_at(11)))
+    store.sync()
+    assert "doomed" in ids(store, tomorrow_at(0), tomorrow_at(23))
+
+    fake_google.cancel_event("doomed")
+    store.sync()
+
+    assert "doomed" not in ids(store, tomorrow_at(0), tomorrow_at(23))
+    assert len(store.index) == len(fake_google.events) - 1
+
+
+def test_expired_sync_token_triggers_full_resync(fake_google):
+    store = CalendarStore(None, "primary")
+    store.sync()
+    store.index.upsert(event("local-only", tomorrow_at(12)))
+
+    fake_google.expire_sync_tokens()
+    fake_google.put_event(event("after-expiry", tomorrow_at(13)))
+    store.sync()
+
+    found = ids(store, tomorrow_at(0), tomorrow_at(23))
+    assert "after-expiry" in found
+    # The index was rebuilt from scratch, not patched
+    assert "local-only" not in found
+    assert store.sync_token == str(fake_google.change_seq)
+
+
+def test_full_sync_is_bounded_ahead(fake_google):
+    far = datetime.now(timezone.utc) + timedelta(days=SYNC_FUTURE_DAYS + 30)
+    fake_google.put_event(event("far-future", far))
+    store = CalendarStore(None, "primary")
+    store.sync()
+
+    assert "far-future" not in {e["id"] for e in store.index.between(far - timedelta(days=1), far + timedelta(days=1))}
+    # Windows past the mirrored range are left to the API
+    assert not store.covers(far - timedelta(hours=1), far + timedelta(hours=1))
+    assert store.covers(tomorrow_at(0), tomorrow_at(23))
+
+
+def test_sync_reports_upstream_changes(fake_google):
+    store = CalendarStore(None, "primary")
+    # The first full sync only fills the mirror
+    assert not store.sync()
+    assert not store.sync()
+
+    fake_google.put_event(event("new2", tomorrow_at(10)))
+    assert store.sync()
+    assert not store.sync()
+
+
+def test_engine_tells_listeners_about_changes(fake_google):
+    engine = CalendarSyncEngine(interval_seconds=3600)
+    heard = []
+    engine.add_listener(heard.append)
+    store = CalendarStore(None, "primary")
+    engine._sync(store)
+    engine._sync(store)
+    assert heard == []
+
+    fake_google.cancel_event(fake_google.events[0]["id"])
+    engine._sync(store)
+    assert heard == [None]
@@ -0,0 +1,85 @@
+# test_context.py
+
+import threading
+
+import context
+from context import build_context, group_turns
+
+
+def call(call_id, name="get_tomorrow_events"):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": "{}"}}
+
+
+def tool_result(call_id, content="[]"):
+    return {"role": "tool", "content": content, "tool_call_id": call_id}
+
+
+def test_tool_calls_stay_with_their_results():
+    messages = [
+        {"role": "user", "content": "what's on tomorrow"},
+        {"role": "assistant", "content": None, "tool_calls": [call("a"), call("b")]},
+        tool_result("a"),
+        tool_result("b"),
+        {"role": "assistant", "content": "Nothing."},
+    ]
+    units = group_turns(messages)
+    assert [len(u) for u in units] == [1, 3, 1]
+
+
+def test_orphaned_tool_results_are_dropped():
+    messages = [tool_result("gone"), {"role": "user", "content": "hi"}]
+    assert build_context(messages).messages == [{"role": "user", "content": "hi"}]
+
+
+def test_unanswered_tool_calls_are_dropped():
+    # A turn interrupted before all its results were saved
+    messages = [
+        {"role": "user", "content": "what's on tomorrow and unread mail"},
+        {"role": "assistant", "content": None, "tool_calls": [call("a"), call("b", "list_unread_emails")]},
+        tool_result("a"),
+        {"role": "user", "content": "hello?"},
+    ]
+    context = build_context(messages)
+    assert [m["role"] for m in context.messages] == ["user", "user"]
+    assert not any(m.get("tool_calls") or m["role"] == "tool" for m in context.messages)
+
+
+def test_tool_calls_without_any_results_are_dropped():
+    messages = [
+        {"role": "user", "content": "send it"},
+        {"role": "assistant", "content": None, "tool_calls": [call("a", "send_email")]},
+    ]
+    assert build_context(messages).messages == [{"role": "user", "content": "send it"}]
+
+
+def test_long_history_is_summarized_within_budget():
+    messages = []
+    for i in range(20):
+        messages.append({"role": "user", "content": f"question {i} " + "x" * 200})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "y" * 200})
+    context = build_context(messages, budget=600)
+    assert context.messages[0]["role"] == "system"
+    assert context.messages[-1]["content"].startswith("answer 19")
+    assert context.summarized_turns > 0
+    assert context.tokens < context.raw_tokens
+
+
+def test_summaries_are_safe_to_build_on_many_threads(monkeypatch):
+    monkeypatch.setattr(context, "DIGEST_CACHE_SIZE", 8)
+    errors = []
+
+    def build(worker):
+        try:
+            for i in range(200):
+                context.summarize([[{"role": "user", "content": f"turn {worker} {i % 20}"}]])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=build, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert errors == []
+    assert len(context._digests) <= 8
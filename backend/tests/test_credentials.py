@@ -0,0 +1,195 @@
+# test_credentials.py
+
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+import credentials
+from credentials import CredentialManager, token_path
+
+
+class FakeTokenEndpoint:
+    """A local OAuth token endpoint: grants new access tokens, or rejects revoked refresh tokens."""
+
+    def __init__(self):
+        self.requests = 0
+        self.revoked = set()
+        self.delay = 0.0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+                fake.requests += 1
+                time.sleep(fake.delay)
+                if form["refresh_token"][0] in fake.revoked:
+                    status, body = 400, {"error": "invalid_grant", "error_description": "Token has been revoked."}
+                else:
+                    status, body = 200, {"access_token": f"access-{fake.requests}", "expires_in": 3600, "token_type": "Bearer"}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.uri = f"http://127.0.0.1:{self.server.server_port}/token"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+@pytest.fixture
+def token_endpoint(tmp_path, monkeypatch):
+    endpoint = FakeTokenEndpoint()
+    monkeypatch.setattr(credentials, "GOOGLE_TOKEN_URI", endpoint.uri)
+    monkeypatch.setattr(credentials, "GOOGLE_TOKEN_FILE", str(tmp_path / "token.json"))
+    monkeypatch.setattr(credentials, "GOOGLE_TOKEN_DIR", str(tmp_path / "tokens"))
+    monkeypatch.setattr(credentials, "ALLOWED_USERS", frozenset())
+    yield endpoint
+    endpoint.close()
+
+
+def write_token(user_id, refresh_token="refresh-1", expires_in=3600):
+    path = token_path(user_id)
+    info = {
+        "token": "access-0",
+        "refresh_token": refresh_token,
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "client_id": "client",
+        "client_secret": "secret",
+        "scopes": credentials.SCOPES,
+        "expiry": (datetime.utcnow() + timedelta(seconds=expires_in)).isoformat() + "Z",
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(info, f)
+    return path
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def saved_token(path):
+    with open(path) as f:
+        return json.load(f)["token"]
+
+
+def test_expiring_token_is_refreshed_and_saved(token_endpoint):
+    path = write_token("alice", expires_in=60)
+    manager = CredentialManager(margin_seconds=300)
+
+    creds = manager.load("alice")
+    # The new token is swapped in before it is saved, so wait for the file
+    assert wait_for(lambda: saved_token(path) == "access-1")
+
+    assert token_endpoint.requests == 1
+    assert manager.get("alice").token == "access-1"
+    assert manager.get("alice") is not creds
+
+
+def test_concurrent_refreshes_are_coalesced(token_endpoint):
+    write_token("alice")
+    manager = CredentialManager()
+    manager.load("alice")
+    token_endpoint.delay = 0.2
+
+    futures = [manager.refresh("alice") for _ in range(5)]
+    results = {id(f.result(timeout=5)) for f in futures}
+
+    assert token_endpoint.requests == 1
+    assert len(results) == 1
+    assert manager.stats()["coalesced"] == 4
+
+
+def test_first_request_waits_for_the_initial_load(token_endpoint):
+    write_token("bob")
+    manager = CredentialManager()
+
+    creds = asyncio.run(manager.aget("bob"))
+
+    assert creds is not None
+    assert creds.refresh_token == "refresh-1"
+
+
+def test_unconfigured_users_are_refused(token_endpoint):
+    manager = CredentialManager()
+
+    assert manager.get("mallory") is None
+    assert asyncio.run(manager.aget("mallory")) is None
+    assert not manager.configured("mallory")
+    assert manager.stats()["users"] == 0
+
+
+def test_allowed_users_limit_who_is_configured(token_endpoint, monkeypatch):
+    write_token("bob")
+    monkeypatch.setattr(credentials, "ALLOWED_USERS", frozenset({"alice"}))
+    manager = CredentialManager()
+
+    assert manager.configured("alice")
+    assert not manager.configured("bob")
+
+
+def test_revoked_user_is_reloaded_after_reauthorization(token_endpoint):
+    write_token("carol", refresh_token="old-grant", expires_in=60)
+    token_endpoint.revoked.add("old-grant")
+    manager = CredentialManager(margin_seconds=300)
+    manager.load("carol")
+
+    assert wait_for(lambda: manager.stats()["revoked"] == 1)
+    manager.check()
+    assert manager.stats()["revoked"] == 1
+
+    # google_auth.py writes a new grant to the token file
+    time.sleep(0.01)
+    write_token("carol", refresh_token="new-grant")
+    manager.check()
+
+    assert manager.stats()["revoked"] == 0
+    assert manager.get("carol").refresh_token == "new-grant"
+
+
+def test_api_requires_a_token_for_its_user(token_endpoint, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    monkeypatch.setattr(main, "API_TOKENS", {"secret-a": "alice"})
+    monkeypatch.setattr("auth.API_TOKENS", {"secret-a": "alice"})
+    write_token("alice")
+    client = TestClient(main.app)
+
+    assert client.get("/briefing", params={"user_id": "alice"}).status_code == 401
+    wrong = client.get("/briefing", params={"user_id": "alice"}, headers={"Authorization": "Bearer nope"})
+    assert wrong.status_code == 401
+    other = client.get("/briefing", params={"user_id": "bob"}, headers={"Authorization": "Bearer secret-a"})
+    assert other.status_code == 403
+    assert main.request_user("default", "Bearer secret-a") == "alice"
+
+
+def test_api_refuses_unknown_users_without_tokens(token_endpoint):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    client = TestClient(main.app)
+    response = client.post("/bulk/emails", json={"user_id": "mallory", "emails": []})
+    assert response.status_code == 403
@@ -0,0 +1,67 @@
+# test_gmail_sync.py
+
+import gmail_api
+import gmail_sync
+from gmail_sync import GmailSyncEngine, MailboxMirror
+
+
+def ids(mirror):
+    return {r["id"] for r in mirror.newest(1000)}
+
+
+def test_bootstrap_mirrors_unread_mail(fake_google):
+    mirror = MailboxMirror(None)
+    assert not mirror.sync()
+
+    assert mirror.ready
+    assert mirror.complete
+    assert ids(mirror) == set(fake_google.message_order)
+    assert mirror.history_id == str(fake_google.history_id)
+
+
+def test_history_applies_new_and_read_messages(fake_google):
+    mirror = MailboxMirror(None)
+    mirror.sync()
+    read = fake_google.message_order[0]
+
+    added = fake_google.add_message("Zed <zed@example.com>", "Quarterly numbers")
+    fake_google.mark_read(read)
+    assert mirror.sync()
+
+    assert added["id"] in ids(mirror)
+    assert read not in ids(mirror)
+    assert ids(mirror) == set(fake_google.message_order)
+    assert [r["id"] for r in mirror.from_sender("zed@example.com", 5)] == [added["id"]]
+    assert mirror.history_id == str(fake_google.history_id)
+
+    # Nothing new: the next sync is a single empty history page
+    requests = fake_google.requests
+    assert not mirror.sync()
+    assert fake_google.requests == requests + 1
+
+
+def test_expired_history_triggers_a_fresh_bootstrap(fake_google):
+    mirror = MailboxMirror(None)
+    mirror.sync()
+    mirror.index.remove(fake_google.message_order[-1])
+
+    fake_google.expire_history()
+    added = fake_google.add_message("Yan <yan@example.com>", "After expiry")
+    assert mirror.sync()
+
+    # Rebuilt from a listing, not patched from history
+    assert ids(mirror) == set(fake_google.message_order)
+    assert added["id"] in ids(mirror)
+    assert mirror.history_id == str(fake_google.history_id)
+
+
+def test_sending_mail_marks_the_mirror_stale(fake_google, monkeypatch):
+    engine = GmailSyncEngine(interval_seconds=3600)
+    monkeypatch.setattr(gmail_sync, "gmail_sync_engine", engine)
+    mirror = engine.track(None)
+    mirror.sync()
+    assert not mirror.stale
+
+    gmail_api.send_email(None, "zed@example.com", "Hi", "Checking in")
+
+    assert mirror.stale
@@ -0,0 +1,49 @@
+# test_router.py
+
+import pytest
+
+from planner import planner
+from router import DETERMINISTIC_INTENTS, classify
+from router_eval import EVAL_SET, evaluate
+
+AGENT_ONLY = [message for message, expected, _ in EVAL_SET if expected == "agent"]
+
+
+@pytest.mark.parametrize("message", AGENT_ONLY)
+def test_agent_requests_never_take_the_fast_path(message):
+    assert classify(message).intent == "agent"
+
+
+@pytest.mark.parametrize("message", [
+    "cancel everything tomorrow and check my email",
+    "what's on tomorrow and delete the unread emails from bob@x.com",
+    "check email, then archive it",
+])
+def test_compound_requests_with_a_write_go_to_the_agent(message):
+    assert planner.plan(message) is None
+
+
+def test_eval_set_has_no_false_fast_paths():
+    report = evaluate()
+    assert report["false_fast_path"] == 0
+    assert report["deterministic_hit_rate"] >= 0.9
+
+
+def test_reads_keep_their_slots():
+    match = classify("any unread email from mark@example.com?")
+    assert match.intent in DETERMINISTIC_INTENTS
+    assert match.args == {"sender_email": "mark@example.com"}
+
+
+@pytest.mark.parametrize("message", [
+    "what's on friday and when am I free",
+    "when am I free and what's on the 25th",
+    "what's on tomorrow and when am I free next week",
+])
+def test_a_day_in_one_clause_scopes_the_others(message):
+    assert planner.plan(message) is None
+
+
+def test_tomorrow_in_one_clause_covers_the_others():
+    steps = planner.plan("what's on tomorrow and when am I free")
+    assert [s.intent for s in steps] == ["get_tomorrow_events", "get_free_slots"]
@@ -0,0 +1,179 @@
+# test_scheduler.py
+
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import calendar_api
+import gmail_api
+import scheduler
+from scheduler import OutboundScheduler, TokenBucket, backoff_delay, execute
+from service_pool import get_service
+
+
+@pytest.fixture
+def outbound(monkeypatch):
+    """A fresh scheduler with short backoff, used by execute()."""
+    fresh = OutboundScheduler()
+    monkeypatch.setattr(scheduler, "scheduler", fresh)
+    monkeypatch.setattr(scheduler, "BACKOFF_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(scheduler, "MAX_RETRIES", 3)
+    monkeypatch.setattr(gmail_api, "scheduler", fresh)
+    monkeypatch.setattr(gmail_api, "MAX_RETRIES", 3)
+    return fresh
+
+
+def list_events(creds=None):
+    service = get_service("calendar", "v3", creds)
+    return service.events().list(calendarId="primary", maxResults=5)
+
+
+def send_email(creds=None):
+    service = get_service("gmail", "v1", creds)
+    return service.users().messages().send(userId="me", body={"raw": "aGk="})
+
+
+def test_throttled_reads_are_retried(fake_google, outbound):
+    fake_google.fail_next(429, count=2, match="/events")
+
+    response = execute(list_events(), None)
+
+    assert response["items"]
+    assert fake_google.requests == 3
+    stats = outbound.stats()["calendar"]
+    assert stats["retries"] == 2
+    assert stats["throttled"] == 2
+    assert stats["failures"] == 0
+
+
+def test_rate_limit_403_counts_as_throttling(fake_google, outbound):
+    fake_google.fail_next(403, reason="userRateLimitExceeded", match="/events")
+
+    execute(list_events(), None)
+
+    assert outbound.stats()["calendar"]["throttled"] == 1
+
+
+def test_other_403s_are_not_retried(fake_google, outbound):
+    fake_google.fail_next(403, reason="forbidden", match="/events")
+
+    with pytest.raises(HttpError):
+        execute(list_events(), None)
+
+    assert fake_google.requests == 1
+    assert outbound.stats()["calendar"]["failures"] == 1
+
+
+def test_server_errors_are_retried_until_retries_run_out(fake_google, outbound):
+    fake_google.fail_next(503, count=10, match="/events")
+
+    with pytest.raises(HttpError) as excinfo:
+        execute(list_events(), None)
+
+    assert excinfo.value.resp.status == 503
+    # The first attempt plus MAX_RETRIES retries, then the error surfaces
+    assert fake_google.requests == scheduler.MAX_RETRIES + 1
+    stats = outbound.stats()["calendar"]
+    assert stats["retries"] == scheduler.MAX_RETRIES
+    assert stats["failures"] == 1
+
+
+def test_retry_after_is_honoured(fake_google, outbound):
+    fake_google.fail_next(429, retry_after=0.3, match="/events")
+
+    started = time.monotonic()
+    execute(list_events(), None)
+
+    assert time.monotonic() - started >= 0.3
+
+
+def test_sends_retry_rate_limits_but_not_server_errors(fake_google, outbound):
+    fake_google.fail_next(429, match="/send")
+    assert execute(send_email(), None, idempotent=False)["labelIds"] == ["SENT"]
+    assert fake_google.requests == 2
+
+    # A 5xx may have been applied, so the send is not repeated
+    fake_google.fail_next(500, match="/send")
+    with pytest.raises(HttpError):
+        execute(send_email(), None, idempotent=False)
+    assert fake_google.requests == 3
+
+
+def test_throttled_items_inside_a_batch_are_resubmitted(fake_google, outbound):
+    ids = list(fake_google.messages)[:5]
+    fake_google.fail_next(429, count=2, match="/messages/")
+
+    results = gmail_api.batch_get_metadata(None, ids)
+
+    assert [r["id"] for r in results] == ids
+    assert not any("error" in r for r in results)
+    # The full batch, then one smaller batch for the two throttled items
+    assert fake_google.requests == 2
+    assert outbound.stats()["gmail"]["throttled"] == 1
+
+
+def test_items_still_throttled_come_back_as_errors(fake_google, outbound):
+    ids = list(fake_google.messages)[:3]
+    fake_google.fail_next(429, count=100, match=f"/messages/{ids[1]}")
+
+    results = gmail_api.batch_get_metadata(None, ids)
+
+    assert "error" in results[1] and results[1]["id"] == ids[1]
+    assert "error" not in results[0] and "error" not in results[2]
+    assert fake_google.requests == gmail_api.MAX_RETRIES + 1
+
+
+def test_a_retried_meeting_insert_creates_one_event(fake_google, outbound, monkeypatch):
+    monkeypatch.setattr(calendar_api.secrets, "token_hex", lambda n: "ab" * n)
+    start = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(days=1)
+    end = start + timedelta(minutes=30)
+    events = len(fake_google.events)
+
+    # The second call reuses the id, as a retry of an insert that went through would
+    first = calendar_api.schedule_meeting(None, start, end, "Sync", [])
+    second = calendar_api.schedule_meeting(None, start, end, "Sync", [])
+
+    assert first == second
+    assert len(fake_google.events) == events + 1
+
+
+def test_backoff_grows_and_respects_retry_after(monkeypatch):
+    monkeypatch.setattr(scheduler, "BACKOFF_BASE_SECONDS", 1.0)
+    monkeypatch.setattr(scheduler, "BACKOFF_MAX_SECONDS", 4.0)
+
+    assert all(backoff_delay(0) <= 1.0 for _ in range(50))
+    assert all(backoff_delay(10) <= 4.0 for _ in range(50))
+    assert backoff_delay(0, retry_after=7.5) == 7.5
+
+
+def test_token_bucket_spaces_requests_past_the_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.02)
+    assert bucket.reserve(1) == pytest.approx(0.2, abs=0.02)
+
+
+def test_per_user_limits_delay_only_that_user():
+    outbound = OutboundScheduler({"calendar": {"global": (1000, 1000), "user": (10, 1)}})
+
+    assert outbound.reserve("calendar", 1, user="alice") == 0
+    assert outbound.reserve("calendar", 1, user="alice") > 0
+    assert outbound.reserve("calendar", 1, user="bob") == 0
+    assert outbound.stats()["calendar"]["queue_delay_max_ms"] > 0
+
+
+def test_idle_user_buckets_are_evicted(monkeypatch):
+    monkeypatch.setattr(scheduler, "BUCKET_SWEEP_SECONDS", 0.0)
+    outbound = OutboundScheduler({"calendar": {"global": (1000, 1000), "user": (1000, 1)}})
+
+    for i in range(100):
+        outbound.reserve("calendar", 1, user=f"user{i}")
+    time.sleep(0.01)
+    outbound.reserve("calendar", 1, user="last")
+
+    # Everyone else refilled, so only the global and newest buckets remain
+    assert len(outbound._buckets) == 2
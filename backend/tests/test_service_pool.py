@@ -0,0 +1,36 @@
+# test_service_pool.py
+
+import threading
+
+import service_pool
+from service_pool import ServicePool
+
+
+def test_threads_share_a_service_with_their_own_transports(fake_google, monkeypatch):
+    transports = []
+
+    def factory():
+        http = fake_google.http()
+        transports.append(http)
+        return http
+
+    monkeypatch.setattr(service_pool, "_http_factory", factory)
+    pool = ServicePool(max_entries=4)
+    services = []
+
+    def call():
+        service = pool.get("calendar", "v3", None)
+        service.events().list(calendarId="primary", maxResults=1).execute()
+        services.append(service)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    # One pooled service for the user, however many threads use it
+    assert len({id(s) for s in services}) == 1
+    assert pool.stats()["size"] == 1
+    # Each thread that sent a request did so on its own transport
+    assert len(transports) >= 8
@@ -0,0 +1,131 @@
+# test_state.py
+
+import threading
+import time
+
+import memory
+import state
+from memory import SessionStore, StateBackend
+
+
+def test_writes_purge_expired_keys(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(state.time, "time", lambda: clock[0])
+    store = state.InProcessState()
+    for i in range(10):
+        store.set("briefing", f"user{i}", {"n": i}, ttl=5)
+    store.set("epoch", "kept", 1)
+
+    clock[0] += state.STATE_PURGE_SECONDS + 1
+    store.set("briefing", "fresh", {"n": 0}, ttl=5)
+
+    assert set(store._data) == {("epoch", "kept"), ("briefing", "fresh")}
+
+
+def test_expired_claim_can_be_taken_again(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(state.time, "time", lambda: clock[0])
+    store = state.InProcessState()
+
+    assert store.add("idempotency", "k", "pending", ttl=10)
+    assert not store.add("idempotency", "k", "pending", ttl=10)
+    clock[0] += 11
+    assert store.add("idempotency", "k", "pending", ttl=10)
+
+
+class SlowBackend(StateBackend):
+    """A shared backend whose loads of one session block until released."""
+
+    def __init__(self, slow_session):
+        super().__init__()
+        self.slow_session = slow_session
+        self.loading = threading.Event()
+        self.release = threading.Event()
+
+    def load(self, session_id):
+        if session_id == self.slow_session:
+            self.loading.set()
+            self.release.wait(5)
+        return super().load(session_id)
+
+
+def test_backend_io_does_not_block_other_sessions(monkeypatch):
+    monkeypatch.setattr(memory, "state", state.InProcessState())
+    store = SessionStore(SlowBackend("slow"))
+
+    reader = threading.Thread(target=store.get, args=("slow",))
+    reader.start()
+    assert store.backend.loading.wait(5)
+
+    # The slow session's load is in flight; another session is served meanwhile
+    store.add("other", {"role": "user", "content": "hi"})
+    assert store.get("other") == [{"role": "user", "content": "hi"}]
+
+    store.backend.release.set()
+    reader.join(5)
+    assert not reader.is_alive()
+
+
+def test_extend_keeps_a_turn_together(monkeypatch):
+    monkeypatch.setattr(memory, "state", state.InProcessState())
+    store = SessionStore(StateBackend(), max_messages=4)
+    store.add("s", {"role": "user", "content": "schedule it"})
+    turn = [
+        {"role": "assistant", "content": None, "tool_calls": [{"id": "c1"}]},
+        {"role": "tool", "content": "{}", "tool_call_id": "c1"},
+    ]
+    store.extend("s", turn)
+
+    assert store.get("s")[1:] == turn
+    # A fresh store (another worker) reads the same history
+    assert SessionStore(StateBackend()).get("s")[1:] == turn
+
+
+class InterleavingState(state.InProcessState):
+    """Shared state whose reads yield, so concurrent read-modify-writes interleave."""
+
+    shared = True
+
+    def get(self, namespace, key):
+        value = super().get(namespace, key)
+        time.sleep(0.001)
+        return value
+
+
+def test_workers_appending_to_one_session_keep_every_message(monkeypatch):
+    monkeypatch.setattr(memory, "state", InterleavingState())
+    # One store per worker, over the same shared state
+    stores = [SessionStore(StateBackend(), max_messages=200) for _ in range(2)]
+
+    def write(n, store):
+        for i in range(25):
+            store.add("s", {"role": "user", "content": f"{n}-{i}"})
+
+    threads = [threading.Thread(target=write, args=(n, s)) for n, s in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    contents = {m["content"] for m in stores[0].get("s")}
+    assert contents == {f"{n}-{i}" for n in range(2) for i in range(25)}
+
+
+def test_sqlite_appends_from_two_connections_are_not_lost(tmp_path):
+    path = str(tmp_path / "state.db")
+    workers = [state.SQLiteState(path), state.SQLiteState(path)]
+
+    def write(n, shared):
+        for i in range(25):
+            shared.append("session", "s", [f"{n}-{i}"], max_len=200)
+
+    threads = [threading.Thread(target=write, args=(n, w)) for n, w in enumerate(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert len(workers[0].get("session", "s")) == 50
+    # The cap keeps the newest items
+    assert workers[1].append("session", "s", ["last"], max_len=3)[-1] == "last"
+    assert len(workers[0].get("session", "s")) == 3
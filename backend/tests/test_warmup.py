@@ -0,0 +1,36 @@
+# test_warmup.py
+
+import time
+
+from warmup import NotConfigured, Warmup, _warm_openai
+
+
+def run(warmup):
+    warmup.start()
+    deadline = time.monotonic() + 30
+    while warmup._thread.is_alive() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return warmup.status()
+
+
+def test_missing_openai_key_is_reported_not_unready(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    status = run(Warmup([("openai", _warm_openai)], enabled=True))
+
+    assert status["ready"]
+    assert status["unconfigured"] == ["openai"]
+    assert "OPENAI_API_KEY" in status["steps"]["openai"]["error"]
+
+
+def test_failed_step_keeps_the_process_unready():
+    def broken():
+        raise RuntimeError("discovery document missing")
+
+    def unconfigured():
+        raise NotConfigured("not set")
+
+    status = run(Warmup([("google_discovery", broken), ("openai", unconfigured)], enabled=True))
+
+    assert not status["ready"]
+    assert status["steps"]["google_discovery"]["status"] == "error"
+    assert status["steps"]["openai"]["status"] == "unconfigured"
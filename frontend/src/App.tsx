@@ -1,5 +1,5 @@
 import { useState, useEffect, useRef } from "react";
-import { sendMessage } from "./api";
+import { streamMessage } from "./api";
 
 interface Message {
   role: "user" | "assistant";
@@ -10,11 +10,13 @@ export default function App() {
   const [messages, setMessages] = useState<Message[]>([]);
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(false);
+  const [streaming, setStreaming] = useState("");
+  const [status, setStatus] = useState("Thinking...");
   const chatEndRef = useRef<HTMLDivElement>(null);
 
   useEffect(() => {
     chatEndRef.current?.scrollIntoView({ behavior: "smooth" });
-  }, [messages, loading]);
+  }, [messages, loading, streaming]);
 
   const handleSend = async () => {
     if (!input.trim() || loading) return;
@@ -23,9 +25,22 @@ export default function App() {
     setMessages((prev) => [...prev, userMessage]);
     setInput("");
     setLoading(true);
+    setStreaming("");
+    setStatus("Thinking...");
 
     try {
-      const response = await sendMessage(input);
+      const response = await streamMessage(input, (event) => {
+        if (event.type === "token") {
+          setStreaming((prev) => prev + event.content);
+        } else if (event.type === "step") {
+          // Text from an earlier step preceded a tool call; start fresh
+          setStreaming("");
+        } else if (event.type === "tool_start") {
+          setStatus(`Running ${event.name.replace(/_/g, " ")}...`);
+        } else if (event.type === "tool_end") {
+          setStatus("Thinking...");
+        }
+      });
       setMessages((prev) => [
         ...prev,
         { role: "assistant", content: response },
@@ -37,6 +52,7 @@ export default function App() {
       ]);
     }
 
+    setStreaming("");
     setLoading(false);
   };
 
@@ -94,7 +110,15 @@ export default function App() {
 
           {loading && (
             <div style={styles.messageRow}>
-              <div style={styles.assistantMessage}>Thinking...</div>
+              <div
+                style={
+                  streaming
+                    ? { ...styles.message, ...styles.assistantMessage }
+                    : styles.assistantMessage
+                }
+              >
+                {streaming || status}
+              </div>
             </div>
           )}
 
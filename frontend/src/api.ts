@@ -1,12 +1,79 @@
+const API_URL = "http://localhost:8000";
+
+// One conversation per browser tab; the backend keys memory on this id.
+const SESSION_ID = crypto.randomUUID();
+
 export async function sendMessage(message: string): Promise<string> {
-    const response = await fetch("http://localhost:8000/chat", {
+    const response = await fetch(`${API_URL}/chat`, {
         method: "POST",
         headers: {
             "Content-Type": "application/json",
         },
-        body: JSON.stringify({ message }),
+        body: JSON.stringify({ message, session_id: SESSION_ID }),
     });
 
     const data = await response.json();
     return data.response;
 }
+
+export type ChatEvent =
+    | { type: "step"; step: number }
+    | { type: "token"; content: string }
+    | { type: "tool_start"; id?: string; name: string }
+    | { type: "tool_end"; id?: string; name: string; ok: boolean }
+    | { type: "done"; content: string | null }
+    | { type: "error"; message: string };
+
+// Streams /chat/stream Server-Sent Events, calling onEvent as each arrives.
+// Resolves with the final response text.
+export async function streamMessage(
+    message: string,
+    onEvent: (event: ChatEvent) => void,
+): Promise<string> {
+    const response = await fetch(`${API_URL}/chat/stream`, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+            Accept: "text/event-stream",
+        },
+        body: JSON.stringify({ message, session_id: SESSION_ID }),
+    });
+
+    if (!response.ok || !response.body) {
+        throw new Error(`Request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let final = "";
+
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary = buffer.indexOf("\n\n");
+        while (boundary !== -1) {
+            const raw = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            boundary = buffer.indexOf("\n\n");
+
+            const data = raw
+                .split("\n")
+                .filter((line) => line.startsWith("data:"))
+                .map((line) => line.slice(5).trimStart())
+                .join("\n");
+            if (!data) continue;
+
+            const event = JSON.parse(data) as ChatEvent;
+            if (event.type === "done") final = event.content ?? "";
+            if (event.type === "error") throw new Error(event.message);
+            onEvent(event);
+        }
+    }
+
+    return final;
+}